@@ -0,0 +1,304 @@
+import asyncio
+from collections import namedtuple
+
+import providers
+from jobs import JobCancelled, JobSuspended, current_job, detached, use_job
+from journal import NULL_ENTRY
+from model_registry import get_model, plan_batches
+from providers import COMPLETED, IN_PROGRESS, POLL_INTERVAL, QUEUED, ProviderError, queue_progress
+from scheduler import PRIORITY_BATCH, get_scheduler
+from progress import RUNNING, CombinedProgress, ProgressEvent
+from storage import async_stream_to_store
+from telemetry import current_trace, untraced
+
+# asyncio-native providers. Each one splits a generation into submit, poll
+# and fetch so many requests can be in flight from one event loop; the
+# blocking functions in providers.py remain for the GUI's worker threads.
+
+ProviderStatus = namedtuple("ProviderStatus", ["state", "queue_position", "logs"])
+ProviderStatus.__new__.__defaults__ = (None, None)
+
+
+class ProviderHandle:
+    # One submitted generation. `data` holds whatever the provider needs to
+    # poll, fetch or cancel it.
+    def __init__(self, spec, status, request_id=None, **data):
+        self.spec = spec
+        self.status = status
+        self.request_id = request_id
+        self.data = data
+        self.entry = NULL_ENTRY
+
+
+async def raise_for_status(response, name):
+    if response.status_code < 400:
+        return
+    await response.aread()
+    await response.aclose()
+    raise ProviderError(f"{name} returned HTTP {response.status_code}: {response.text[:200]}")
+
+
+class AsyncProvider:
+    name = None
+    # Trace stage covering submit(); a synchronous API does its inference
+    # inside the submitting request.
+    submit_stage = "submit"
+
+    def __init__(self, transport, poll_interval=POLL_INTERVAL):
+        self.transport = transport
+        self.poll_interval = poll_interval
+
+    async def submit(self, spec, prompt, aspect_ratio, seed=None, num_images=1, journal=None):
+        raise NotImplementedError
+
+    def adopt(self, spec, prompt, aspect_ratio, seed=None, num_images=1, journal=None):
+        # A handle for a journaled request an earlier run left unfinished
+        # (see journal.py), or None to submit a new one.
+        return None
+
+    async def poll(self, handle):
+        raise NotImplementedError
+
+    async def fetch(self, handle, progress=None):
+        # Returns one DownloadResult (or None) per requested image.
+        raise NotImplementedError
+
+    async def cancel(self, handle):
+        pass
+
+    async def generate(self, model, prompt, aspect_ratio, seed=None, progress=None, num_images=1, journal=None):
+        # Task cancellation and the current job's deadlines both end the wait
+        # between polls. `journal` (journal.JournalGeneration) is for providers
+        # whose requests outlive the process.
+        spec = get_model(model)
+        trace = current_trace()
+        job = current_job()
+        handle = self.adopt(spec, prompt, aspect_ratio, seed, num_images, journal)
+        if handle is None:
+            trace.begin(self.submit_stage)
+            job.enter(self.submit_stage)
+            if progress and self.submit_stage == "inference":
+                progress(ProgressEvent(RUNNING))
+            handle = await self.submit(spec, prompt, aspect_ratio, seed, num_images, journal)
+        try:
+            while handle.status.state != COMPLETED:
+                stage = "inference" if handle.status.state == IN_PROGRESS else "queue_wait"
+                if trace.current is None or trace.current[0] != stage:
+                    trace.begin(stage)
+                if job.stage != stage:
+                    job.enter(stage)
+                if progress:
+                    progress(queue_progress(*handle.status))
+                await asyncio.sleep(job.timeout_for(self.poll_interval))
+                job.check()
+                handle.status = await self.poll(handle)
+                handle.entry.status(handle.status.state)
+            job.enter("result")
+            results = await self.fetch(handle, progress)
+        except BaseException as e:
+            # Cancelled or failed mid-flight: release the remote request too,
+            # unless the job was suspended to be resumed later. A completed
+            # request's result stays with the provider, so only the download
+            # failed and the request can be collected again.
+            if handle.status.state == COMPLETED:
+                handle.entry.fetch_failed(e)
+            else:
+                handle.entry.fail(e)
+            if not isinstance(e, JobSuspended):
+                with detached():
+                    await asyncio.shield(self.cancel(handle))
+            raise
+        handle.entry.complete()
+        return results
+
+
+class StabilityProvider(AsyncProvider):
+    # The v2beta endpoint answers the POST with the image itself, so the
+    # handle is complete as soon as the response headers arrive.
+    name = "stability"
+    submit_stage = "inference"
+
+    def __init__(self, transport, poll_interval=POLL_INTERVAL, url=None, api_key=None):
+        super().__init__(transport, poll_interval)
+        self.url = url or providers.STABILITY_API_URL
+        self.api_key = api_key or providers.STABILITY_API_KEY
+
+    async def submit(self, spec, prompt, aspect_ratio, seed=None, num_images=1, journal=None, output_format="png"):
+        headers = {
+            "authorization": f"Bearer {self.api_key}",
+            "accept": "image/*",
+        }
+        data = {
+            key: str(value)
+            for key, value in providers.stability_form_data(prompt, spec.name, aspect_ratio, output_format, seed).items()
+        }
+        response = await self.transport.post(
+            self.url, headers=headers, data=data, files={"none": ("", b"")}, stream=True
+        )
+        await raise_for_status(response, "Stability")
+        return ProviderHandle(spec, ProviderStatus(COMPLETED), response=response, output_format=output_format)
+
+    async def poll(self, handle):
+        return handle.status
+
+    async def fetch(self, handle, progress=None):
+        current_trace().end()
+        return [await async_stream_to_store(handle.data["response"], handle.data["output_format"], progress)]
+
+    async def cancel(self, handle):
+        await handle.data["response"].aclose()
+
+
+class FalProvider(AsyncProvider):
+    # fal's queue REST API, the same flow fal_client.subscribe drives:
+    # POST the arguments, poll the status URL, GET the response URL, then
+    # download the image it points at.
+    name = "fal"
+
+    def __init__(self, transport, poll_interval=POLL_INTERVAL, queue_url=None, api_key=None):
+        super().__init__(transport, poll_interval)
+        self.queue_url = (queue_url or providers.FAL_QUEUE_URL).rstrip("/")
+        self.api_key = api_key or providers.FAL_API_KEY
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Key {self.api_key}"} if self.api_key else {}
+
+    @staticmethod
+    def handle(spec, request, num_images):
+        return ProviderHandle(
+            spec,
+            ProviderStatus(QUEUED),
+            request_id=request["request_id"],
+            status_url=request["status_url"],
+            response_url=request["response_url"],
+            cancel_url=request.get("cancel_url"),
+            num_images=num_images,
+        )
+
+    def adopt(self, spec, prompt, aspect_ratio, seed=None, num_images=1, journal=None):
+        if journal is None:
+            return None
+        entry = journal.adopt(spec.endpoint, providers.flux_arguments(prompt, aspect_ratio, seed, num_images))
+        if entry is None:
+            return None
+        print(f"Resuming fal request {entry.record.request_id}")
+        handle = self.handle(spec, entry.request, num_images)
+        handle.entry = entry
+        return handle
+
+    async def submit(self, spec, prompt, aspect_ratio, seed=None, num_images=1, journal=None):
+        arguments = providers.flux_arguments(prompt, aspect_ratio, seed, num_images)
+        entry = journal.begin(spec.endpoint, arguments) if journal else NULL_ENTRY
+        try:
+            response = await self.transport.post(f"{self.queue_url}/{spec.endpoint}", headers=self.headers,
+                                                 json=arguments)
+            await raise_for_status(response, "fal")
+            payload = response.json()
+        except BaseException as e:
+            entry.fail(e)
+            raise
+        entry.submitted(payload)
+        handle = self.handle(spec, payload, num_images)
+        handle.entry = entry
+        return handle
+
+    async def poll(self, handle):
+        response = await self.transport.get(handle.data["status_url"], headers=self.headers, params={"logs": 1})
+        await raise_for_status(response, "fal")
+        payload = response.json()
+        return ProviderStatus(payload["status"], payload.get("queue_position"), payload.get("logs"))
+
+    async def fetch(self, handle, progress=None):
+        trace = current_trace()
+        trace.begin("result")
+        response = await self.transport.get(handle.data["response_url"], headers=self.headers)
+        await raise_for_status(response, "fal")
+        num_images = handle.data["num_images"]
+        images = (response.json().get("images") or [])[:num_images]
+        trace.end()
+        results = await self.download_images([image["url"] for image in images], progress)
+        return results + [None] * (num_images - len(results))
+
+    async def download_image(self, url, progress=None):
+        response = await self.transport.get(url, stream=True)
+        await raise_for_status(response, "fal image download")
+        return await async_stream_to_store(response, "png", progress)
+
+    async def download_images(self, urls, progress=None):
+        # Same tracing rule as providers.download_images: several downloads
+        # overlap, so they share one wall-clock "download" span.
+        if len(urls) <= 1:
+            return [await self.download_image(url, progress) for url in urls]
+        combined = CombinedProgress(progress, len(urls))
+        with current_trace().span("download"), untraced():
+            return list(await asyncio.gather(*[
+                self.download_image(url, combined.part(index)) for index, url in enumerate(urls)
+            ]))
+
+    async def cancel(self, handle):
+        if handle.status.state == COMPLETED or not handle.data.get("cancel_url"):
+            return
+        try:
+            response = await self.transport.put(handle.data["cancel_url"], headers=self.headers)
+            await response.aclose()
+        except Exception as e:
+            print(f"Error cancelling fal request {handle.request_id}: {e}")
+
+
+PROVIDER_CLASSES = {
+    StabilityProvider.name: StabilityProvider,
+    FalProvider.name: FalProvider,
+}
+
+
+async def generate_images(providers, prompt, model, aspect_ratio, variants=1, progress=None, seeds=None,
+                          priority=PRIORITY_BATCH, journal=None):
+    # asyncio counterpart of providers.generate_images: native batches where
+    # the model supports them, concurrent requests for the rest, one
+    # DownloadResult or None per variant. Seeded variants go out one per
+    # request, each with its own seed from `seeds`.
+    spec = get_model(model)
+    provider = providers[spec.provider]
+    batches = plan_batches(model, variants, seeds is not None)
+    offsets = [sum(batches[:index]) for index in range(len(batches))]
+
+    job = current_job()
+
+    async def run_batch(size, offset, batch_progress):
+        # Each batch is its own task, so a branch of the job keeps its stages
+        # apart from its siblings'.
+        with use_job(job.branch()):
+            async with get_scheduler().async_slot(spec, priority):
+                batch_seed = None if seeds is None else seeds[offset]
+                return await provider.generate(model, prompt, aspect_ratio, batch_seed, batch_progress, size,
+                                               journal and journal.batch(offset, size))
+
+    if len(batches) == 1:
+        return await run_batch(batches[0], 0, progress)
+
+    combined = CombinedProgress(progress, len(batches))
+    with current_trace().span("inference"), untraced():
+        outcomes = await asyncio.gather(*[
+            run_batch(size, offset, combined.part(index))
+            for index, (size, offset) in enumerate(zip(batches, offsets))
+        ], return_exceptions=True)
+
+    results = []
+    for size, outcome in zip(batches, outcomes):
+        if isinstance(outcome, BaseException):
+            if isinstance(outcome, (asyncio.CancelledError, JobCancelled)):
+                raise outcome
+            print(f"Error generating {model} variant: {outcome}")
+            results.extend([None] * size)
+        else:
+            results.extend(outcome)
+    return results
+
+
+def open_providers(transport, options=None):
+    # One instance per provider, sharing the transport's connection pool.
+    # `options` maps a provider name to extra constructor arguments, e.g.
+    # {"fal": {"queue_url": "http://127.0.0.1:8080/fal"}}.
+    options = options or {}
+    return {name: cls(transport, **options.get(name, {})) for name, cls in PROVIDER_CLASSES.items()}
@@ -0,0 +1,463 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from model_registry import ASPECT_RATIOS, model_names, provider_for, supports_aspect_ratio
+from pipeline import generate_variants, generate_variants_async, get_transcoder, resume_interrupted, variant_seed
+from inflight import get_in_flight
+from jobs import JOB_TIMEOUT, STAGE_TIMEOUTS, JobCancelled, JobGroup, JobTimeout
+from providers import missing_api_key
+from scheduler import PROVIDER_LIMITS, get_scheduler
+from storage import TRANSCODE_FORMAT
+from telemetry import METRICS, Trace, record_trace
+
+# Headless batch comparison. Deliberately Qt-free so it runs on CI machines
+# and servers:
+#
+#   python batch.py prompts.txt --models sd3-medium flux-dev --manifest runs/manifest.jsonl
+
+DEFAULT_CONCURRENCY = {provider: limits["maximum"] for provider, limits in PROVIDER_LIMITS.items()}
+MANIFEST_FIELDS = [
+    "prompt", "model", "provider", "aspect_ratio", "seed", "variant", "status", "file",
+    "latency", "error", "started_at", "timings", "metrics",
+]
+
+
+def read_prompts(path, dedupe=False):
+    with open(path, encoding="utf-8") as file:
+        prompts = [line.strip() for line in file if line.strip() and not line.startswith("#")]
+    if dedupe:
+        prompts = list(dict.fromkeys(prompts))
+    return prompts
+
+
+def parse_concurrency(values):
+    limits = dict(DEFAULT_CONCURRENCY)
+    for value in values or []:
+        provider, _, limit = value.partition("=")
+        if provider not in limits or not limit.isdigit() or int(limit) < 1:
+            raise argparse.ArgumentTypeError(f"Invalid concurrency limit: {value}")
+        limits[provider] = int(limit)
+    return limits
+
+
+def parse_rates(values):
+    rates = {}
+    for value in values or []:
+        provider, _, rate = value.partition("=")
+        try:
+            rates[provider] = float(rate)
+        except ValueError:
+            rates[provider] = 0
+        if provider not in PROVIDER_LIMITS or rates[provider] <= 0:
+            raise argparse.ArgumentTypeError(f"Invalid rate limit: {value}")
+    return rates
+
+
+def parse_stage_timeouts(values):
+    timeouts = dict(STAGE_TIMEOUTS)
+    for value in values or []:
+        stage, _, seconds = value.partition("=")
+        try:
+            timeouts[stage] = float(seconds)
+        except ValueError:
+            timeouts[stage] = 0
+        if stage not in STAGE_TIMEOUTS or timeouts[stage] <= 0:
+            raise argparse.ArgumentTypeError(f"Invalid stage timeout: {value}")
+    return timeouts
+
+
+def configure_scheduler(concurrency=None, rates=None):
+    # Concurrency values cap the adaptive limit rather than fix it; the
+    # scheduler still backs off below the cap on 429s and slow responses.
+    scheduler = get_scheduler()
+    for provider, limit in (concurrency or {}).items():
+        scheduler.limiter(provider).configure(maximum=limit)
+    for provider, rate in (rates or {}).items():
+        scheduler.limiter(provider).configure(rate=rate)
+    return scheduler
+
+
+def new_row(prompt, model, aspect_ratio, seed, variant=0):
+    return {
+        "prompt": prompt,
+        "model": model,
+        "provider": provider_for(model),
+        "aspect_ratio": aspect_ratio,
+        "seed": variant_seed(seed, variant),
+        "variant": variant,
+        "status": "failed",
+        "file": None,
+        "latency": None,
+        "error": None,
+        "started_at": None,
+        "timings": None,
+        "metrics": None,
+    }
+
+
+def finish_rows(rows, started, outcomes=None, error=None):
+    # A cancelled job's rows say so; a timed-out one counts as failed.
+    latency = round(time.monotonic() - started, 3)
+    for index, row in enumerate(rows):
+        if error is not None:
+            row["error"] = str(error)
+            if isinstance(error, JobCancelled) and not isinstance(error, JobTimeout):
+                row["status"] = "cancelled"
+        elif outcomes[index][0]:
+            row["status"] = "cached" if outcomes[index][1] else "ok"
+            row["file"] = outcomes[index][0]
+        else:
+            row["error"] = "no image returned"
+        row["latency"] = latency
+
+
+def trace_rows(rows, trace):
+    record_trace(trace)
+    timings = trace.to_dict()["spans"]
+    for row in rows:
+        row["timings"] = timings
+    return rows
+
+
+def run_job(prompt, model, aspect_ratio, seed, force, variants=1, job=None):
+    # One manifest row per variant. Provider requests wait for scheduler
+    # slots in the batch lane; that wait is traced as "admission" and counts
+    # towards the row's latency.
+    rows = [new_row(prompt, model, aspect_ratio, seed, variant) for variant in range(variants)]
+    trace = Trace()
+    started_at = time.time()
+    for row in rows:
+        row["started_at"] = started_at
+    started = time.monotonic()
+    try:
+        outcomes = generate_variants(prompt, model, aspect_ratio, variants, seed=seed, force=force, trace=trace,
+                                     job=job)
+    except Exception as e:
+        finish_rows(rows, started, error=e)
+    else:
+        finish_rows(rows, started, outcomes)
+    return trace_rows(rows, trace)
+
+
+async def run_job_async(prompt, model, aspect_ratio, seed, force, providers, variants=1, job=None):
+    # A cancelled task still returns its rows, marked cancelled, so an
+    # interrupted run can write them out.
+    import asyncio
+
+    rows = [new_row(prompt, model, aspect_ratio, seed, variant) for variant in range(variants)]
+    trace = Trace()
+    started_at = time.time()
+    for row in rows:
+        row["started_at"] = started_at
+    started = time.monotonic()
+    try:
+        outcomes = await generate_variants_async(
+            prompt, model, aspect_ratio, providers, variants, seed=seed, force=force, trace=trace, job=job
+        )
+    except asyncio.CancelledError:
+        trace.status = "cancelled"
+        finish_rows(rows, started, error=JobCancelled("Cancelled"))
+    except Exception as e:
+        finish_rows(rows, started, error=e)
+    else:
+        finish_rows(rows, started, outcomes)
+    return trace_rows(rows, trace)
+
+
+class ManifestWriter:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.is_csv = path.endswith(".csv")
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.lock = threading.Lock()
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=MANIFEST_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        with self.lock:
+            if self.is_csv:
+                self.writer.writerow({**row, "timings": json.dumps(row["timings"]),
+                                      "metrics": json.dumps(row["metrics"]) if row["metrics"] else ""})
+            else:
+                self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def relocate_manifest(path, relocations):
+    # Rewrites the "file" column after images were transcoded to new paths.
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(file))
+        else:
+            rows = [json.loads(line) for line in file if line.strip()]
+    for row in rows:
+        row["file"] = relocations.get(row["file"], row["file"])
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(file, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+class PairMetrics:
+    # Image metrics of every model's output against the reference model's
+    # output for the same prompt and variant. Rows of the other models are
+    # held back until their reference row is in, then written with a
+    # "metrics" column; the reference rows themselves carry none.
+    def __init__(self, reference_model, engine):
+        self.reference_model = reference_model
+        self.engine = engine
+        self.references = {}
+        self.waiting = {}
+
+    def add(self, row):
+        # Returns the rows that are ready to be written.
+        key = (row["prompt"], row["variant"])
+        if row["model"] == self.reference_model:
+            self.references[key] = row
+            others = self.waiting.pop(key, [])
+            ready = [row] + others
+        elif key in self.references:
+            others = ready = [row]
+        else:
+            self.waiting.setdefault(key, []).append(row)
+            return []
+        reference = self.references[key]["file"]
+        compared = [other for other in others if reference and other["file"]]
+        results = self.engine.compare_many([(reference, other["file"]) for other in compared])
+        for other, metrics in zip(compared, results):
+            other["metrics"] = metrics
+        return ready
+
+    def flush(self):
+        # Rows whose reference never arrived (it failed to start).
+        rows = [row for rows in self.waiting.values() for row in rows]
+        self.waiting.clear()
+        return rows
+
+
+def deliver(rows, collected, manifest=None, on_result=None, pair_metrics=None):
+    if pair_metrics is not None:
+        rows = [ready for row in rows for ready in pair_metrics.add(row)]
+    for row in rows:
+        collected.append(row)
+        if manifest:
+            manifest.write(row)
+        if on_result:
+            on_result(row)
+
+
+def run_batch(prompts, models, aspect_ratio="1:1", seed=None, force=False, concurrency=None,
+              manifest=None, on_result=None, variants=1, pair_metrics=None, jobs=None):
+    # Enough threads for every provider at its concurrency cap; jobs beyond
+    # that queue in the executor, and within it the scheduler decides which
+    # requests go out. On Ctrl-C every job is cancelled (submitted fal
+    # requests are cancelled in the queue) and the rows of the whole run,
+    # the unfinished ones marked cancelled, are still delivered.
+    limits = concurrency or dict(DEFAULT_CONCURRENCY)
+    configure_scheduler(concurrency)
+    jobs = jobs or JobGroup()
+    rows = []
+    with ThreadPoolExecutor(max_workers=sum(limits.values())) as executor:
+        pending = {
+            executor.submit(run_job, prompt, model, aspect_ratio, seed, force, variants, jobs.new())
+            for prompt in prompts
+            for model in models
+        }
+        try:
+            for future in as_completed(list(pending)):
+                pending.discard(future)
+                deliver(future.result(), rows, manifest, on_result, pair_metrics)
+        except KeyboardInterrupt:
+            print("Interrupted: cancelling outstanding jobs...")
+            jobs.cancel()
+            for future in as_completed(pending):
+                deliver(future.result(), rows, manifest, on_result, pair_metrics)
+    if pair_metrics is not None:
+        deliver(pair_metrics.flush(), rows, manifest, on_result)
+    return rows
+
+
+async def run_batch_async(prompts, models, aspect_ratio="1:1", seed=None, force=False, concurrency=None,
+                          manifest=None, on_result=None, provider_options=None, variants=1, pair_metrics=None,
+                          jobs=None):
+    # Same contract as run_batch, but every job is a task on one event loop
+    # instead of a thread. Ctrl-C cancels the run's task (asyncio.run does
+    # that); the job tasks are then cancelled and their rows collected.
+    import asyncio  # deferred, like the providers: sync runs never need it
+    from async_providers import open_providers
+    from transport import AsyncTransport
+
+    limits = concurrency or dict(DEFAULT_CONCURRENCY)
+    configure_scheduler(concurrency)
+    jobs = jobs or JobGroup()
+    rows = []
+    async with AsyncTransport(max_connections_per_host=max(limits.values())) as transport:
+        providers = open_providers(transport, provider_options)
+        pending = {
+            asyncio.create_task(run_job_async(prompt, model, aspect_ratio, seed, force, providers, variants,
+                                              jobs.new()))
+            for prompt in prompts
+            for model in models
+        }
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    # Metrics are CPU work; keep them off the event loop.
+                    await asyncio.to_thread(deliver, task.result(), rows, manifest, on_result, pair_metrics)
+        except asyncio.CancelledError:
+            print("Interrupted: cancelling outstanding jobs...")
+            jobs.cancel()
+            for task in pending:
+                task.cancel()
+            for job_rows in await asyncio.gather(*pending):
+                deliver(job_rows, rows, manifest, on_result, pair_metrics)
+    if pair_metrics is not None:
+        deliver(pair_metrics.flush(), rows, manifest, on_result)
+    return rows
+
+
+def main(argv=None):
+    all_models = model_names()
+    parser = argparse.ArgumentParser(description="Generate a prompt set against several models without the GUI.")
+    parser.add_argument("prompts", help="Text file with one prompt per line (blank lines and # comments are skipped)")
+    parser.add_argument("--models", nargs="+", required=True, choices=all_models, metavar="MODEL",
+                        help=f"Models to compare: {', '.join(all_models)}")
+    parser.add_argument("--aspect-ratio", default="1:1", choices=ASPECT_RATIOS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--variants", type=int, default=1,
+                        help="Images per prompt and model (fal batches natively, Stability fans out)")
+    parser.add_argument("--concurrency", nargs="*", metavar="PROVIDER=N",
+                        help="Per-provider caps on concurrent requests, e.g. stability=4 fal=8 "
+                             "(the scheduler adapts below the cap)")
+    parser.add_argument("--rate", nargs="*", metavar="PROVIDER=R",
+                        help="Per-provider request rates in requests per second, e.g. stability=2")
+    parser.add_argument("--timeout", type=float, default=JOB_TIMEOUT,
+                        help=f"Seconds each prompt and model may take in total (default {JOB_TIMEOUT:g})")
+    parser.add_argument("--stage-timeout", nargs="*", metavar="STAGE=S",
+                        help="Per-stage limits in seconds, e.g. queue_wait=300 download=60 (stages: "
+                             f"{', '.join(STAGE_TIMEOUTS)})")
+    parser.add_argument("--manifest", default="batch_manifest.jsonl",
+                        help="Output manifest; .csv writes CSV, anything else JSON lines")
+    parser.add_argument("--metrics", default=None,
+                        help="Write per-model stage histograms in Prometheus text format to this path")
+    parser.add_argument("--dedupe", action="store_true", help="Skip duplicate prompt lines")
+    parser.add_argument("--force", action="store_true", help="Bypass the result cache")
+    parser.add_argument("--pair-metrics", action="store_true",
+                        help="Compare every model's images with the first model's (SSIM, colour histogram, "
+                             "perceptual hash, edges, sharpness) and add them to the manifest; needs NumPy")
+    parser.add_argument("--resume", action="store_true",
+                        help="First collect fal requests that an earlier batch run or GUI session submitted but "
+                             "never collected (it crashed or was closed)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run every job on one asyncio event loop instead of a thread per call")
+    args = parser.parse_args(argv)
+
+    try:
+        concurrency = parse_concurrency(args.concurrency)
+        rates = parse_rates(args.rate)
+        stage_timeouts = parse_stage_timeouts(args.stage_timeout)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.timeout <= 0:
+        parser.error("--timeout must be positive")
+
+    if args.variants < 1:
+        parser.error("--variants must be at least 1")
+
+    key_error = missing_api_key(args.models)
+    if key_error:
+        parser.error(key_error)
+    unsupported = [model for model in args.models if not supports_aspect_ratio(model, args.aspect_ratio)]
+    if unsupported:
+        parser.error(f"Aspect ratio {args.aspect_ratio} is not supported by: {', '.join(unsupported)}")
+
+    prompts = read_prompts(args.prompts, dedupe=args.dedupe)
+    total = len(prompts) * len(args.models) * args.variants
+    print(f"Running {total} generation(s): {len(prompts)} prompt(s) x {len(args.models)} model(s)"
+          + (f" x {args.variants} variant(s)" if args.variants > 1 else ""))
+
+    done = []
+
+    def on_result(row):
+        done.append(row)
+        print(f"[{len(done)}/{total}] {row['status']:<6} {row['model']:<18} {row['latency']:>7}s  {row['prompt'][:60]}")
+
+    configure_scheduler(rates=rates)
+    pair_metrics = None
+    if args.pair_metrics:
+        if len(args.models) < 2:
+            parser.error("--pair-metrics needs at least two models")
+        try:
+            from image_metrics import get_metrics_engine
+        except ImportError as e:
+            parser.error(f"--pair-metrics needs NumPy: {e}")
+        pair_metrics = PairMetrics(args.models[0], get_metrics_engine())
+    jobs = JobGroup(args.timeout, stage_timeouts)
+    if args.resume:
+        try:
+            resumed = resume_interrupted(job=jobs.new())
+        except KeyboardInterrupt:
+            print("Interrupted while resuming")
+            return 130
+        except JobCancelled as e:
+            print(f"Resume stopped: {e}")
+            resumed = []
+        collected = sum(1 for file_name, _ in resumed if file_name)
+        print(f"Resumed {collected} of {len(resumed)} image(s) from interrupted fal requests")
+    manifest = ManifestWriter(args.manifest)
+    try:
+        if args.use_async:
+            import asyncio
+            rows = asyncio.run(run_batch_async(prompts, args.models, args.aspect_ratio, args.seed, args.force,
+                                               concurrency, manifest, on_result, variants=args.variants,
+                                               pair_metrics=pair_metrics, jobs=jobs))
+        else:
+            rows = run_batch(prompts, args.models, args.aspect_ratio, args.seed, args.force,
+                             concurrency, manifest, on_result, variants=args.variants,
+                             pair_metrics=pair_metrics, jobs=jobs)
+    finally:
+        manifest.close()
+        if args.metrics:
+            METRICS.write_prometheus(args.metrics)
+
+    if get_transcoder() is not None:
+        relocations = get_transcoder().flush()
+        if relocations:
+            relocate_manifest(args.manifest, relocations)
+            print(f"  {len(relocations)} image(s) re-encoded as {TRANSCODE_FORMAT}")
+
+    failed = sum(1 for row in rows if row["status"] == "failed")
+    cancelled = sum(1 for row in rows if row["status"] == "cancelled")
+    print(f"Finished: {len(rows) - failed - cancelled} succeeded, {failed} failed"
+          + (f", {cancelled} cancelled" if cancelled else "") + f". Manifest written to {args.manifest}")
+    coalesced = get_in_flight().stats()["coalesced"]
+    if coalesced:
+        print(f"  {coalesced} duplicate job(s) shared an identical in-flight request")
+    for provider, stats in get_scheduler().stats().items():
+        if stats["completed"]:
+            print(f"  {provider}: concurrency limit {stats['limit']}, {stats['throttled']} throttled "
+                  f"of {stats['completed']} request(s)")
+    if jobs.cancelled:
+        return 130
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import json
+import os
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the Stability endpoint and the fal queue
+# (submit -> status -> result -> result URL), with configurable latency,
+# jitter, error rates and image sizes. Nothing here touches the network.
+
+_png_cache = {}
+_png_lock = threading.Lock()
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def make_png(width, height):
+    # Noise compresses about as badly as real generated images, so byte
+    # sizes are realistic. Cached per size because encoding is not free.
+    with _png_lock:
+        if (width, height) not in _png_cache:
+            row_bytes = width * 3
+            noise = os.urandom(row_bytes * height)
+            raw = b"".join(b"\x00" + noise[y * row_bytes:(y + 1) * row_bytes] for y in range(height))
+            _png_cache[(width, height)] = (
+                b"\x89PNG\r\n\x1a\n"
+                + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+                + png_chunk(b"IDAT", zlib.compress(raw, 1))
+                + png_chunk(b"IEND", b"")
+            )
+        return _png_cache[(width, height)]
+
+
+def make_unique_png(width, height):
+    # make_png() with a random text chunk before IEND: every response has
+    # different bytes, as real generations do, so the content-addressed
+    # store does not collapse them into one file.
+    png = make_png(width, height)
+    return png[:-12] + png_chunk(b"tEXt", b"id\x00" + uuid.uuid4().hex.encode()) + png[-12:]
+
+
+class MockConfig:
+    def __init__(self, latency=0.5, jitter=0.1, queue_latency=0.2, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=0.1, image_width=1024, image_height=1024, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.queue_latency = queue_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.image_width = image_width
+        self.image_height = image_height
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self, mean):
+        with self.lock:
+            return max(0.0, mean + self.random.uniform(-self.jitter, self.jitter))
+
+    def roll(self):
+        # Returns None, 429 or 500 for one incoming request.
+        with self.lock:
+            value = self.random.random()
+        if value < self.rate_limit_rate:
+            return 429
+        if value < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def to_dict(self):
+        return {
+            key: value for key, value in vars(self).items()
+            if key not in ("random", "lock")
+        }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def send_bytes(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload, headers=None):
+        self.send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def injected_failure(self):
+        failure = self.mock.config.roll()
+        if failure == 429:
+            self.mock.count("rate_limited")
+            self.send_json(429, {"detail": "rate limited"}, {"Retry-After": str(self.mock.config.retry_after)})
+            return True
+        if failure == 500:
+            self.mock.count("errors")
+            self.send_json(500, {"detail": "injected failure"})
+            return True
+        return False
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path.startswith("/v2beta/"):
+            self.mock.count("stability_requests")
+            if self.injected_failure():
+                return
+            time.sleep(self.mock.config.sample(self.mock.config.latency))
+            config = self.mock.config
+            self.send_bytes(200, make_unique_png(config.image_width, config.image_height), "image/png")
+        elif self.path.startswith("/fal/"):
+            self.mock.count("fal_submits")
+            if self.injected_failure():
+                return
+            application = self.path[len("/fal/"):].strip("/")
+            try:
+                num_images = int(json.loads(body or b"{}").get("num_images", 1))
+            except (ValueError, AttributeError):
+                num_images = 1
+            request_id = self.mock.create_job(application, num_images)
+            base = f"{self.mock.base_url}/fal/{application}/requests/{request_id}"
+            self.send_json(200, {
+                "request_id": request_id,
+                "status_url": f"{base}/status",
+                "response_url": base,
+                "cancel_url": f"{base}/cancel",
+            })
+        else:
+            self.send_json(404, {"detail": "not found"})
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.startswith("/images/"):
+            self.mock.count("image_downloads")
+            config = self.mock.config
+            self.send_bytes(200, make_unique_png(config.image_width, config.image_height), "image/png")
+            return
+        if not path.startswith("/fal/") or "/requests/" not in path:
+            self.send_json(404, {"detail": "not found"})
+            return
+
+        request_id = path.split("/requests/")[1].split("/")[0]
+        job = self.mock.job(request_id)
+        if job is None:
+            self.send_json(404, {"detail": "unknown request"})
+            return
+        state, position = self.mock.job_state(job)
+
+        if path.endswith("/status"):
+            self.mock.count("fal_status_polls")
+            payload = {"status": state, "request_id": request_id}
+            if state == "IN_QUEUE":
+                payload["queue_position"] = position
+            elif state == "IN_PROGRESS":
+                payload["logs"] = [{"message": "mock inference step", "level": "INFO"}]
+            else:
+                payload["logs"] = []
+                payload["metrics"] = {"inference_time": job["run_time"]}
+            self.send_json(200, payload)
+        elif state != "COMPLETED":
+            self.send_json(400, {"detail": "request is still in progress"})
+        else:
+            self.mock.count("fal_results")
+            config = self.mock.config
+            self.send_json(200, {"images": [{
+                "url": f"{self.mock.base_url}/images/{request_id}-{index}.png",
+                "width": config.image_width,
+                "height": config.image_height,
+            } for index in range(job["num_images"])]})
+
+    def do_PUT(self):
+        self.read_body()
+        if self.path.endswith("/cancel") and "/requests/" in self.path:
+            request_id = self.path.split("/requests/")[1].split("/")[0]
+            if self.mock.cancel_job(request_id):
+                self.mock.count("fal_cancels")
+                self.send_json(202, {"status": "CANCELLATION_REQUESTED"})
+            else:
+                self.send_json(400, {"status": "ALREADY_COMPLETED"})
+        else:
+            self.send_json(404, {"detail": "not found"})
+
+
+class MockProviderServer:
+    def __init__(self, config=None):
+        self.config = config or MockConfig()
+        self.jobs = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stability_url(self):
+        return f"{self.base_url}/v2beta/stable-image/generate/sd3"
+
+    @property
+    def fal_queue_url(self):
+        return f"{self.base_url}/fal"
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def create_job(self, application, num_images=1):
+        request_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[request_id] = {
+                "application": application,
+                "num_images": num_images,
+                "submitted": time.monotonic(),
+                "queue_time": self.config.sample(self.config.queue_latency),
+                "run_time": self.config.sample(self.config.latency),
+                "cancelled": False,
+            }
+        return request_id
+
+    def job(self, request_id):
+        with self.lock:
+            return self.jobs.get(request_id)
+
+    def cancel_job(self, request_id):
+        with self.lock:
+            job = self.jobs.get(request_id)
+            if job is None or self.job_state(job)[0] == "COMPLETED":
+                return False
+            job["cancelled"] = True
+            return True
+
+    def job_state(self, job):
+        elapsed = time.monotonic() - job["submitted"]
+        if job["cancelled"]:
+            return "COMPLETED", None
+        if elapsed < job["queue_time"]:
+            with_earlier = sum(
+                1 for other in self.jobs.values()
+                if other["submitted"] < job["submitted"]
+                and time.monotonic() - other["submitted"] < other["queue_time"]
+            )
+            return "IN_QUEUE", with_earlier
+        if elapsed < job["queue_time"] + job["run_time"]:
+            return "IN_PROGRESS", None
+        return "COMPLETED", None
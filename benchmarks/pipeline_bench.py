@@ -0,0 +1,494 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Offline pipeline benchmarks. The providers are pointed at a local mock
+# server (benchmarks/mock_providers.py), everything runs in a scratch working
+# directory, and results are written as JSON keyed by commit so runs can be
+# diffed:
+#
+#   python benchmarks/pipeline_bench.py --latency 0.3 --error-rate 0.02
+#   python benchmarks/pipeline_bench.py --compare benchmarks/results/<old>.json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_providers import MockConfig, MockProviderServer, make_png  # noqa: E402
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+SCENARIOS = ["single", "batch", "batch_async", "gallery", "thumbnails", "theme"]
+GALLERY_MODELS = ["sd3-medium", "sd3-large", "flux-dev", "flux-schnell"]
+
+
+def summarize(values):
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+    return {
+        "n": len(ordered),
+        "mean": round(statistics.fmean(ordered), 4),
+        "p50": round(ordered[len(ordered) // 2], 4),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def git_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10)
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def install_mock(server, poll_interval=0.05):
+    import providers
+
+    providers.STABILITY_API_URL = server.stability_url
+    providers.FAL_QUEUE_URL = server.fal_queue_url
+    providers.POLL_INTERVAL = poll_interval
+
+
+def run_single(args, server):
+    from pipeline import generate_image_with_model
+    from telemetry import Trace, record_trace
+
+    def generate(prompt, model):
+        trace = Trace()
+        started = time.perf_counter()
+        try:
+            file_name, _ = generate_image_with_model(prompt, model, "1:1", force=True, trace=trace)
+        except Exception:
+            file_name = None
+        record_trace(trace)
+        return model, file_name, time.perf_counter() - started
+
+    walls, per_model, failures = [], {model: [] for model in args.compare_models}, 0
+    with ThreadPoolExecutor(max_workers=len(args.compare_models)) as executor:
+        for run in range(args.runs):
+            started = time.perf_counter()
+            results = list(executor.map(lambda model: generate(f"benchmark prompt {run}", model),
+                                        args.compare_models))
+            walls.append(time.perf_counter() - started)
+            for model, file_name, seconds in results:
+                per_model[model].append(seconds)
+                failures += file_name is None
+    return {
+        "compare_seconds": summarize(walls),
+        "models": {model: summarize(values) for model, values in per_model.items()},
+        "failures": failures,
+    }
+
+
+def run_batch_scenario(args, server, use_async=False):
+    import asyncio
+    from batch import run_batch, run_batch_async
+    from scheduler import get_scheduler
+
+    prompts = [f"batch prompt {index}" for index in range(args.batch_prompts)]
+    if use_async:
+        options = {
+            "stability": {"url": server.stability_url},
+            "fal": {"queue_url": server.fal_queue_url, "poll_interval": 0.05},
+        }
+        elapsed, rows = timed(asyncio.run, run_batch_async(prompts, args.batch_models, force=True,
+                                                           provider_options=options, variants=args.variants))
+    else:
+        elapsed, rows = timed(run_batch, prompts, args.batch_models, force=True, variants=args.variants)
+    failed = sum(1 for row in rows if row["status"] == "failed")
+    return {
+        "jobs": len(rows),
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_per_second": round(len(rows) / elapsed, 4) if elapsed else None,
+        "failures": failed,
+        "latency_seconds": summarize([row["latency"] for row in rows if row["status"] != "failed"]),
+        # Cumulative over the process: later scenarios start from the limits
+        # earlier ones adapted to.
+        "scheduler": get_scheduler().stats(),
+    }
+
+
+def populate_gallery(directory, count, source):
+    # Hard links keep 100k files cheap on disk; fall back to copies on
+    # filesystems without them.
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        model = GALLERY_MODELS[index % len(GALLERY_MODELS)]
+        path = os.path.join(directory, f"generated_image_20240101_{index:06d}_{model}.png")
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+
+
+def legacy_listing(directory):
+    # What the gallery did before the metadata index: list, stat, sort.
+    names = [name for name in os.listdir(directory) if name.endswith((".png", ".jpg", ".jpeg"))]
+    return sorted(names, key=lambda name: os.path.getmtime(os.path.join(directory, name)), reverse=True)
+
+
+def run_gallery(args, workdir, qt_available):
+    from image_index import ImageIndex
+
+    source = os.path.join(workdir, "gallery_source.png")
+    with open(source, "wb") as file:
+        file.write(make_png(512, 512))
+
+    results = {}
+    for size in args.gallery_sizes:
+        directory = os.path.join(workdir, f"gallery_{size}")
+        populate_gallery(directory, size, source)
+        index = ImageIndex(os.path.join(directory, ".index.sqlite"))
+
+        result = {
+            "legacy_listing_seconds": round(timed(legacy_listing, directory)[0], 4),
+            "backfill_seconds": round(timed(index.backfill, directory)[0], 4),
+            "first_page_seconds": round(timed(lambda: (index.count(), index.page(limit=200)))[0], 4),
+            "filtered_page_seconds": round(timed(index.page, limit=200, model="flux-dev")[0], 4),
+        }
+
+        def page_all():
+            after, rows = None, 0
+            while True:
+                page = index.page(after=after, limit=200)
+                if not page:
+                    return rows
+                rows += len(page)
+                after = page[-1]
+
+        result["page_all_seconds"] = round(timed(page_all)[0], 4)
+
+        if qt_available:
+            from PyQt6.QtCore import QThreadPool
+            from gallery import GalleryModel
+            from thumbnails import ThumbnailCache
+
+            model = GalleryModel(ThumbnailCache(os.path.join(directory, ".thumbnails")), QThreadPool())
+            model.set_index(index)
+            result["model_reload_seconds"] = round(timed(model.reload)[0], 4)
+            model.image_loader.cancel_all()
+
+        index.close()
+        shutil.rmtree(directory, ignore_errors=True)
+        results[str(size)] = result
+    return results
+
+
+def run_thumbnails(args, workdir):
+    from PyQt6.QtGui import QImage
+    from PyQt6.QtCore import Qt, QSize
+    from image_loader import decode_scaled
+    from thumbnails import THUMBNAIL_SIZE, ThumbnailCache
+
+    directory = os.path.join(workdir, "thumbnail_sources")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(args.thumbnail_count):
+        path = os.path.join(directory, f"source_{index}.png")
+        with open(path, "wb") as file:
+            file.write(make_png(args.image_size, args.image_size))
+        paths.append(path)
+
+    target = QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+    cache = ThumbnailCache(os.path.join(directory, ".thumbnails"))
+
+    def full_decode(path):
+        return QImage(path).scaled(target, Qt.AspectRatioMode.KeepAspectRatio,
+                                   Qt.TransformationMode.SmoothTransformation)
+
+    return {
+        "image_size": args.image_size,
+        "full_decode_seconds": summarize([timed(full_decode, path)[0] for path in paths]),
+        "scaled_decode_seconds": summarize([timed(decode_scaled, path, target)[0] for path in paths]),
+        "cache_build_seconds": summarize([timed(cache.build, path)[0] for path in paths]),
+        "cache_hit_seconds": summarize([timed(cache.get, path)[0] for path in paths]),
+    }
+
+
+def legacy_styles(theme):
+    # (tile, image, caption) stylesheets of a gallery tile as the GUI built
+    # it before the theme engine: one f-string per widget.
+    return (
+        f"""
+        QFrame {{
+            background-color: {theme.container_bg};
+            border: 1px solid {theme.border_color};
+            border-radius: 8px;
+        }}
+        QFrame:hover {{
+            border-color: {theme.accent_color};
+            background-color: {theme.bg_color};
+        }}
+        """,
+        f"color: {theme.placeholder_color}; border: none;",
+        f"color: {theme.text_color}; background-color: {theme.bg_color}; border-radius: 4px;",
+    )
+
+
+def bench_tile(file_name, styles=None):
+    # With `styles` each widget gets its own stylesheet; without, they take
+    # their colours from the palette, as the GUI's widgets do, and geometry
+    # from the app stylesheet.
+    from PyQt6.QtGui import QPalette
+    from PyQt6.QtWidgets import QFrame, QLabel, QVBoxLayout
+
+    tile = QFrame()
+    tile.setObjectName("benchTile")
+    tile.image = QLabel("Loading...")
+    tile.image.setObjectName("benchTileImage")
+    tile.caption = QLabel(file_name)
+    tile.caption.setObjectName("benchTileCaption")
+    layout = QVBoxLayout(tile)
+    layout.addWidget(tile.image)
+    layout.addWidget(tile.caption)
+    if styles:
+        restyle_tile(tile, styles)
+    else:
+        tile.setFrameShape(QFrame.Shape.StyledPanel)
+        tile.setBackgroundRole(QPalette.ColorRole.Base)
+        tile.setAutoFillBackground(True)
+        tile.image.setForegroundRole(QPalette.ColorRole.PlaceholderText)
+    return tile
+
+
+def restyle_tile(tile, styles):
+    for widget, style in zip((tile, tile.image, tile.caption), styles):
+        widget.setStyleSheet(style)
+
+
+def run_theme(args, qt_app):
+    # Time to build and first-paint a gallery of N tiles: widget tiles with
+    # per-widget stylesheets (the old GUI), the same tiles under one
+    # app-level stylesheet, and the delegate-painted GalleryView. Also the
+    # cost of a dark/light switch for each.
+    from PyQt6.QtCore import QEvent, QThreadPool
+    from PyQt6.QtWidgets import QGridLayout, QWidget
+    from gallery import GalleryDelegate, GalleryModel, GalleryView
+    from image_index import ImageRecord
+    from thumbnails import ThumbnailCache
+    from theme import DARK, LIGHT, STYLESHEET, ThemeManager
+
+    count = args.theme_tiles
+    names = [f"generated_image_20240101_{index:06d}_{GALLERY_MODELS[index % 4]}.png" for index in range(count)]
+    tile_rules = """
+        QFrame#benchTile { padding: 4px; }
+        QLabel#benchTileCaption { padding: 2px 4px; }
+    """
+
+    def build(make_tile):
+        container = QWidget()
+        grid = QGridLayout(container)
+        tiles = []
+        for index, name in enumerate(names):
+            tile = make_tile(name)
+            grid.addWidget(tile, index // 5, index % 5)
+            tiles.append(tile)
+        container.show()
+        qt_app.processEvents()
+        return container, tiles
+
+    def discard(container):
+        # deleteLater() outside an event loop needs the deferred deletes
+        # flushed by hand, or the tiles would still be restyled later on.
+        container.close()
+        container.deleteLater()
+        qt_app.sendPostedEvents(None, QEvent.Type.DeferredDelete)
+        qt_app.processEvents()
+
+    def restyle(tiles, theme):
+        styles = legacy_styles(theme)
+        for tile in tiles:
+            restyle_tile(tile, styles)
+        qt_app.processEvents()
+
+    qt_app.setStyleSheet("")
+    started = time.perf_counter()
+    container, tiles = build(lambda name: bench_tile(name, legacy_styles(LIGHT)))
+    legacy_build = time.perf_counter() - started
+    legacy_switch = timed(restyle, tiles, DARK)[0]
+    discard(container)
+
+    manager = ThemeManager(qt_app, LIGHT)
+    qt_app.setStyleSheet(STYLESHEET + tile_rules)
+    started = time.perf_counter()
+    container, tiles = build(bench_tile)
+    app_build = time.perf_counter() - started
+    app_switch = timed(lambda: (manager.apply(DARK), qt_app.processEvents()))[0]
+    discard(container)
+
+    directory = tempfile.mkdtemp(prefix="theme_bench_")
+    records = []
+    for index, name in enumerate(names):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(make_png(64, 64))
+        records.append(ImageRecord(path=path, model=GALLERY_MODELS[index % 4], created_at=float(index)))
+    thread_pool = QThreadPool()
+    started = time.perf_counter()
+    model = GalleryModel(ThumbnailCache(os.path.join(directory, ".thumbnails")), thread_pool)
+    view = GalleryView()
+    view.setModel(model)
+    delegate = GalleryDelegate(manager.theme, view)
+    view.setItemDelegate(delegate)
+    manager.changed.connect(delegate.set_theme)
+    model.show_records(records)
+    view.resize(1200, 800)
+    view.show()
+    qt_app.processEvents()
+    delegate_build = time.perf_counter() - started
+    delegate_switch = timed(lambda: (manager.apply(LIGHT), view.viewport().update(), qt_app.processEvents()))[0]
+    view.close()
+    thread_pool.waitForDone()
+    qt_app.processEvents()
+    qt_app.setStyleSheet("")
+    shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "tiles": count,
+        "per_widget_stylesheets": {"build_seconds": round(legacy_build, 4), "switch_seconds": round(legacy_switch, 4)},
+        "app_stylesheet": {"build_seconds": round(app_build, 4), "switch_seconds": round(app_switch, 4)},
+        "delegate_gallery": {"build_seconds": round(delegate_build, 4), "switch_seconds": round(delegate_switch, 4)},
+    }
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}.{key}" if prefix else key))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def print_comparison(old, new):
+    old_metrics = flatten(old.get("scenarios", {}))
+    new_metrics = flatten(new.get("scenarios", {}))
+    print(f"Comparing {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    for name in sorted(set(old_metrics) & set(new_metrics)):
+        before, after = old_metrics[name], new_metrics[name]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {name:<60} {before:>12.4f} {after:>12.4f} {change:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline against local mock providers.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--runs", type=int, default=10, help="Single-compare repetitions")
+    parser.add_argument("--compare-models", nargs="+", default=["sd3-medium", "flux-dev"])
+    parser.add_argument("--batch-prompts", type=int, default=20)
+    parser.add_argument("--batch-models", nargs="+", default=["sd3-medium", "sd3-large", "flux-dev", "flux-schnell"])
+    parser.add_argument("--variants", type=int, default=1, help="Images per prompt and model in the batch scenarios")
+    parser.add_argument("--gallery-sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--thumbnail-count", type=int, default=20)
+    parser.add_argument("--theme-tiles", type=int, default=2000, help="Gallery tiles built in the theme scenario")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean mock inference time in seconds")
+    parser.add_argument("--queue-latency", type=float, default=0.2, help="Mean time a fal request sits in the queue")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Uniform +/- jitter applied to both latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--image-size", type=int, default=1024, help="Edge length of the mock images in pixels")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the mock's latency and error draws")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", default=None, metavar="OLD.json", help="Print deltas against an earlier result")
+    args = parser.parse_args(argv)
+
+    try:
+        qt_available = importlib.util.find_spec("PyQt6.QtGui") is not None
+    except ImportError:
+        qt_available = False
+
+    config = MockConfig(
+        latency=args.latency, jitter=args.jitter, queue_latency=args.queue_latency,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        image_width=args.image_size, image_height=args.image_size, seed=args.seed,
+    )
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "mock": config.to_dict(),
+        },
+        "scenarios": {},
+    }
+
+    qt_app = None
+    if qt_available and {"gallery", "thumbnails", "theme"} & set(args.scenarios):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt6.QtWidgets import QApplication
+        qt_app = QApplication.instance() or QApplication([])
+
+    # The pipeline writes to ./generated_images, so run in a scratch
+    # directory and leave the real gallery alone.
+    original_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="image-compare-bench-")
+    os.chdir(workdir)
+    try:
+        with MockProviderServer(config) as server:
+            install_mock(server)
+            for scenario in args.scenarios:
+                print(f"Running {scenario}...")
+                if scenario == "single":
+                    result = run_single(args, server)
+                elif scenario == "batch":
+                    result = run_batch_scenario(args, server)
+                elif scenario == "batch_async":
+                    result = run_batch_scenario(args, server, use_async=True)
+                elif scenario == "gallery":
+                    result = run_gallery(args, workdir, qt_available)
+                elif not qt_available:
+                    print("  skipped: PyQt6 is not installed")
+                    continue
+                elif scenario == "thumbnails":
+                    result = run_thumbnails(args, workdir)
+                else:
+                    result = run_theme(args, qt_app)
+                report["scenarios"][scenario] = result
+            report["meta"]["mock_requests"] = dict(server.counts)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    del qt_app
+
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{commit or 'unknown'}.json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(report["scenarios"], indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            print_comparison(json.load(file), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
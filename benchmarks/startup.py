@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Startup guard: headless import time of the batch/pipeline modules and the
+# GUI's time to first frame, each measured in a fresh interpreter. Exits
+# non-zero when a median exceeds its budget.
+#
+#   python benchmarks/startup.py --runs 5
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["PyQt6", "requests", "fal_client", "httpx"]
+
+HEADLESS_IMPORT = """
+import sys, time, json
+started = time.perf_counter()
+import batch, pipeline
+elapsed = (time.perf_counter() - started) * 1000
+heavy = sorted({name.split(".")[0] for name in sys.modules} & set(%r))
+print(json.dumps({"ms": elapsed, "heavy": heavy}))
+""" % HEAVY_MODULES
+
+FIRST_FRAME = """
+import time, json
+started = time.perf_counter()
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QObject, QEvent
+import gui
+
+app = QApplication([])
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            print(json.dumps({"ms": (time.perf_counter() - started) * 1000}))
+            app.exit(0)
+        return False
+
+window = gui.ImageGeneratorApp()
+first_paint = FirstPaint()
+window.installEventFilter(first_paint)
+window.show()
+app.exec()
+"""
+
+
+def run_child(code, cwd):
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, timeout=120
+    )
+    wall = (time.perf_counter() - started) * 1000
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip())
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["wall_ms"] = wall
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure headless import time and GUI time-to-first-frame.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=150)
+    parser.add_argument("--max-first-frame-ms", type=float, default=1500)
+    parser.add_argument("--skip-gui", action="store_true", help="Only measure the headless import")
+    parser.add_argument("--workdir", default=REPO_ROOT, help="Directory to start in (holds generated_images)")
+    args = parser.parse_args(argv)
+
+    failures = []
+
+    imports = [run_child(HEADLESS_IMPORT, args.workdir) for _ in range(args.runs)]
+    import_ms = statistics.median(run["ms"] for run in imports)
+    heavy = sorted({name for run in imports for name in run["heavy"]})
+    print(f"headless import: median {import_ms:.1f} ms (budget {args.max_import_ms:.0f} ms)")
+    if heavy:
+        failures.append(f"headless import loaded heavy modules: {', '.join(heavy)}")
+    if import_ms > args.max_import_ms:
+        failures.append(f"headless import {import_ms:.1f} ms exceeds {args.max_import_ms:.0f} ms")
+
+    if not args.skip_gui:
+        frames = [run_child(FIRST_FRAME, args.workdir) for _ in range(args.runs)]
+        frame_ms = statistics.median(run["ms"] for run in frames)
+        wall_ms = statistics.median(run["wall_ms"] for run in frames)
+        print(f"time to first frame: median {frame_ms:.1f} ms in-process, {wall_ms:.1f} ms including "
+              f"interpreter start (budget {args.max_first_frame_ms:.0f} ms)")
+        if frame_ms > args.max_first_frame_ms:
+            failures.append(f"first frame {frame_ms:.1f} ms exceeds {args.max_first_frame_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,543 @@
+import os
+import time
+from collections import OrderedDict
+
+from PyQt6.QtWidgets import QListView, QStyledItemDelegate, QStyle, QMenu
+from PyQt6.QtGui import QPixmap, QColor, QPen
+from PyQt6.QtCore import (
+    Qt, QSize, QPoint, QRect, QRectF, QAbstractListModel, QModelIndex, QObject, QRunnable, QTimer,
+    QFileSystemWatcher, pyqtSignal
+)
+
+from image_index import SORT_NEWEST, scan_directory
+from image_loader import ImageLoader
+from thumbnails import THUMBNAIL_SIZE
+
+FETCH_BATCH_SIZE = 200
+PIXMAP_CACHE_SIZE = 512
+VISIBLE_MARGIN_ROWS = 8
+# Directory events are collected for this long after the last one, but a
+# steady stream (a batch run writing) is still flushed every WATCH_MAX_DELAY_MS.
+WATCH_DEBOUNCE_MS = 250
+WATCH_MAX_DELAY_MS = 2000
+TILE_SIZE = QSize(THUMBNAIL_SIZE + 20, THUMBNAIL_SIZE + 50)
+# Startup cache pruning: images stat'ed per background job, and the pause
+# between jobs.
+PRUNE_CHUNK = 500
+PRUNE_INTERVAL_MS = 50
+
+PathRole = Qt.ItemDataRole.UserRole + 1
+RecordRole = Qt.ItemDataRole.UserRole + 2
+
+
+class GalleryIndexSignals(QObject):
+    finished = pyqtSignal(int, object, float)
+
+
+class GalleryIndexJob(QRunnable):
+    # Bulk-imports images that predate the metadata index (once per
+    # directory), then reports every indexed path, and when they were read,
+    # for CachePruner.
+    def __init__(self, image_index, image_dir):
+        super().__init__()
+        self.image_index = image_index
+        self.image_dir = image_dir
+        self.signals = GalleryIndexSignals()
+
+    def run(self):
+        added = 0
+        if not self.image_index.is_backfilled(self.image_dir):
+            added = self.image_index.backfill(self.image_dir)
+        indexed_at = time.time()
+        self.signals.finished.emit(added, self.image_index.paths(), indexed_at)
+
+
+class CachePruneSignals(QObject):
+    finished = pyqtSignal(object)
+
+
+class CacheKeyJob(QRunnable):
+    # The keys one chunk of images has in each cache.
+    def __init__(self, paths, caches):
+        super().__init__()
+        self.paths = paths
+        self.caches = caches
+        self.signals = CachePruneSignals()
+
+    def run(self):
+        keys = [set() for _ in self.caches]
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            for cache_keys, cache in zip(keys, self.caches):
+                cache_keys.add(cache.key(path, stat))
+        self.signals.finished.emit(keys)
+
+
+class CacheSweepJob(QRunnable):
+    def __init__(self, caches, keys, before):
+        super().__init__()
+        self.caches = caches
+        self.keys = keys
+        self.before = before
+
+    def run(self):
+        for cache, keys in zip(self.caches, self.keys):
+            cache.prune(keys, self.before)
+
+
+class CachePruner(QObject):
+    # Removes thumbnails and viewer tiles whose image is gone or has changed.
+    # Both caches key an entry on its image's path and stat, so each indexed
+    # image is stat'ed once for all of them. The pass starts after the first
+    # page's thumbnails are queued and runs as low-priority jobs of
+    # PRUNE_CHUNK images, PRUNE_INTERVAL_MS apart, so it never holds up the
+    # thumbnails being looked at. Entries written after `before` belong to
+    # images newer than `paths` and are kept.
+    def __init__(self, caches, thread_pool, parent=None):
+        super().__init__(parent)
+        self.caches = caches
+        self.thread_pool = thread_pool
+        self.paths = []
+        self.before = 0.0
+        self.keys = []
+        self.offset = 0
+        self.job = None
+
+    def start(self, paths, before):
+        self.paths = paths
+        self.before = before
+        self.keys = [set() for _ in self.caches]
+        self.offset = 0
+        QTimer.singleShot(PRUNE_INTERVAL_MS, self.next_chunk)
+
+    def next_chunk(self):
+        if self.offset >= len(self.paths):
+            self.job = None
+            self.thread_pool.start(CacheSweepJob(self.caches, self.keys, self.before), -1)
+            return
+        self.job = CacheKeyJob(self.paths[self.offset:self.offset + PRUNE_CHUNK], self.caches)
+        self.offset += PRUNE_CHUNK
+        self.job.signals.finished.connect(self.on_chunk_keyed)
+        self.thread_pool.start(self.job, -1)
+
+    def on_chunk_keyed(self, keys):
+        for cache_keys, chunk_keys in zip(self.keys, keys):
+            cache_keys.update(chunk_keys)
+        QTimer.singleShot(PRUNE_INTERVAL_MS, self.next_chunk)
+
+
+class GalleryScanSignals(QObject):
+    finished = pyqtSignal(object, object, object, object)
+
+
+class GalleryScanJob(QRunnable):
+    # Diffs the directory against the previous snapshot and applies the
+    # difference to the index. `previous` is None for the first scan, which
+    # compares against what the index already holds instead. The image
+    # store's shards are never listed: its ledger is read from
+    # `ledger_offset` instead.
+    def __init__(self, image_index, image_dir, previous, image_store=None, ledger_offset=0):
+        super().__init__()
+        self.image_index = image_index
+        self.image_dir = image_dir
+        self.previous = previous
+        self.image_store = image_store
+        self.ledger_offset = ledger_offset
+        self.signals = GalleryScanSignals()
+
+    def run(self):
+        previous = self.previous
+        if previous is None:
+            previous = dict.fromkeys(self.image_index.paths_in(self.image_dir))
+        current = scan_directory(self.image_dir)
+        upserted, removed = self.image_index.sync(previous, current)
+        offset = self.ledger_offset
+        if self.image_store is not None:
+            offset, added, gone = self.image_store.read_ledger(offset)
+            stored, dropped = self.image_index.apply_store_changes(added, gone)
+            upserted += stored
+            removed += dropped
+        self.signals.finished.emit(current, offset, upserted, removed)
+
+
+class GalleryWatcher(QObject):
+    # Keeps the gallery in step with the image directory, including files
+    # written by other processes such as batch runs. Events are debounced
+    # into one background scan; only one scan runs at a time.
+    changed = pyqtSignal(object, object)
+
+    def __init__(self, image_index, image_dir, thread_pool, image_store=None, parent=None):
+        super().__init__(parent)
+        self.image_index = image_index
+        self.image_dir = image_dir
+        self.thread_pool = thread_pool
+        self.image_store = image_store
+        self.snapshot = None
+        self.ledger_offset = 0
+        self.scan_job = None
+        self.rescan = False
+        self.first_event = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.watcher.fileChanged.connect(self.on_directory_changed)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.scan)
+
+    def start(self):
+        self.watcher.addPath(self.image_dir)
+        if self.image_store is not None:
+            # Everything already in the ledger is in the index: writers
+            # record their images themselves.
+            self.ledger_offset = self.image_store.ledger_size()
+            self.watcher.addPath(self.image_store.ensure_ledger())
+        self.scan()
+
+    def on_directory_changed(self, path):
+        now = time.monotonic()
+        if self.first_event is None:
+            self.first_event = now
+        if (now - self.first_event) * 1000 < WATCH_MAX_DELAY_MS or not self.timer.isActive():
+            self.timer.start(WATCH_DEBOUNCE_MS)
+
+    def scan(self):
+        self.first_event = None
+        if self.scan_job is not None:
+            self.rescan = True
+            return
+        self.rescan = False
+        job = GalleryScanJob(self.image_index, self.image_dir, self.snapshot, self.image_store, self.ledger_offset)
+        job.signals.finished.connect(self.on_scanned)
+        self.scan_job = job
+        self.thread_pool.start(job)
+
+    def on_scanned(self, snapshot, ledger_offset, upserted, removed):
+        self.scan_job = None
+        self.snapshot = snapshot
+        self.ledger_offset = ledger_offset
+        if upserted or removed:
+            self.changed.emit(upserted, removed)
+        if self.rescan:
+            self.scan()
+
+
+class GalleryModel(QAbstractListModel):
+    # Rows are paged from the metadata index with keyset queries as the view
+    # scrolls (canFetchMore/fetchMore), and thumbnails are only requested
+    # when the view asks for a visible row.
+    def __init__(self, thumbnail_cache, thread_pool, parent=None):
+        super().__init__(parent)
+        self.image_index = None
+        self.thumbnail_cache = thumbnail_cache
+        self.image_loader = ImageLoader(thread_pool, self)
+        self.records = []
+        self.total = 0
+        self.sort = SORT_NEWEST
+        self.model_filter = None
+        self.row_lookup = None
+        self.pixmaps = OrderedDict()
+        self.failed_paths = set()
+        # Set while showing a fixed result list (similarity search) instead
+        # of pages from the index.
+        self.pinned = False
+
+    def set_index(self, image_index):
+        self.image_index = image_index
+
+    def reload(self, sort=None, model_filter=None):
+        if sort is not None:
+            self.sort = sort
+        if model_filter is not None:
+            self.model_filter = model_filter
+        if self.image_index is None:
+            return
+        self.beginResetModel()
+        self.pinned = False
+        self.image_loader.cancel_all()
+        self.total = self.image_index.count(model=self.model_filter)
+        self.records = self.image_index.page(limit=FETCH_BATCH_SIZE, sort=self.sort, model=self.model_filter)
+        self.row_lookup = None
+        self.endResetModel()
+
+    def show_records(self, records):
+        # A fixed list in the given order; reload() returns to the index.
+        self.beginResetModel()
+        self.pinned = True
+        self.image_loader.cancel_all()
+        self.records = list(records)
+        self.total = len(self.records)
+        self.row_lookup = None
+        self.endResetModel()
+
+    def apply_changes(self, upserted=(), removed=()):
+        # Incremental update: only the affected rows are inserted, moved,
+        # refreshed or removed; the rest of the view is left alone. A pinned
+        # result list only loses rows.
+        if self.image_index is None:
+            return
+        for record in removed:
+            self.remove_record(record)
+        if self.pinned:
+            return
+        for record in upserted:
+            self.upsert_record(record)
+
+    def matches(self, record):
+        return not self.model_filter or record.model == self.model_filter
+
+    def sort_position(self, record, records):
+        # Binary search for `record` in (created_at, path) order, matching
+        # the index's keyset pagination.
+        key = (record.created_at, record.path)
+        descending = self.sort == SORT_NEWEST
+        low, high = 0, len(records)
+        while low < high:
+            middle = (low + high) // 2
+            other = (records[middle].created_at, records[middle].path)
+            if (other > key) if descending else (other < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def remove_record(self, record):
+        # `total` counts the rows the view can show: a loaded row, or one the
+        # filter lets through. A relocation's record has only its path, so
+        # it is counted only when loaded or nothing is filtered out.
+        self.forget_thumbnail(record.path)
+        row = self.row_of(record.path)
+        if row is None and (self.pinned or not self.matches(record)):
+            return
+        self.total = max(0, self.total - 1)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.records[row]
+        self.row_lookup = None
+        self.endRemoveRows()
+
+    def upsert_record(self, record):
+        row = self.row_of(record.path)
+        if row is None:
+            if not self.matches(record):
+                return
+            self.total += 1
+            position = self.sort_position(record, self.records)
+            if position == len(self.records) and len(self.records) < self.total - 1:
+                return  # past the loaded pages; fetchMore reaches it
+            self.beginInsertRows(QModelIndex(), position, position)
+            self.records.insert(position, record)
+            self.row_lookup = None
+            self.endInsertRows()
+            return
+
+        if self.records[row] != record:
+            self.forget_thumbnail(record.path)
+        if not self.matches(record):
+            self.remove_record(self.records[row])
+            return
+        position = self.sort_position(record, self.records[:row] + self.records[row + 1:])
+        if position != row:
+            # Qt's destination row counts the moved row itself when moving down.
+            destination = position + 1 if position > row else position
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+            del self.records[row]
+            self.records.insert(position, record)
+            self.row_lookup = None
+            self.endMoveRows()
+        else:
+            self.records[row] = record
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def forget_thumbnail(self, file_path):
+        self.pixmaps.pop(file_path, None)
+        self.failed_paths.discard(file_path)
+        self.image_loader.cancel(file_path)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and len(self.records) < self.total
+
+    def fetchMore(self, parent):
+        if parent.isValid() or not self.records:
+            return
+        records = self.image_index.page(
+            after=self.records[-1], limit=FETCH_BATCH_SIZE, sort=self.sort, model=self.model_filter
+        )
+        if not records:
+            self.total = len(self.records)
+            return
+        self.beginInsertRows(QModelIndex(), len(self.records), len(self.records) + len(records) - 1)
+        self.records.extend(records)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.records):
+            return None
+        record = self.records[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return record.model
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.thumbnail(record.path)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return record.prompt
+        if role == PathRole:
+            return record.path
+        if role == RecordRole:
+            return record
+        return None
+
+    def thumbnail(self, file_path):
+        pixmap = self.pixmaps.get(file_path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(file_path)
+            return pixmap
+        if file_path not in self.failed_paths:
+            self.request_thumbnail(file_path)
+        return None
+
+    def request_thumbnail(self, file_path):
+        self.image_loader.load(
+            file_path,
+            lambda: self.thumbnail_cache.get_or_build(file_path),
+            lambda thumbnail: self.on_thumbnail_ready(file_path, thumbnail)
+        )
+
+    def retain_rows(self, first, last):
+        # Tiles that scrolled away no longer need their thumbnail; drop the
+        # queued decode so the pool works on what is on screen.
+        for file_path in self.image_loader.pending_keys():
+            row = self.row_of(file_path)
+            if row is None or row < first or row > last:
+                self.image_loader.cancel(file_path)
+
+    def on_thumbnail_ready(self, file_path, thumbnail):
+        if thumbnail.isNull():
+            self.failed_paths.add(file_path)
+        else:
+            self.pixmaps[file_path] = QPixmap.fromImage(thumbnail)
+            while len(self.pixmaps) > PIXMAP_CACHE_SIZE:
+                self.pixmaps.popitem(last=False)
+
+        row = self.row_of(file_path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def row_of(self, file_path):
+        if self.row_lookup is None:
+            self.row_lookup = {record.path: row for row, record in enumerate(self.records)}
+        return self.row_lookup.get(file_path)
+
+
+class GalleryDelegate(QStyledItemDelegate):
+    # Tiles are painted here rather than styled: the colours come from the
+    # current theme (theme.Theme), swapped by set_theme().
+    def __init__(self, theme, parent=None):
+        super().__init__(parent)
+        self.set_theme(theme)
+
+    def set_theme(self, theme):
+        self.bg_color = QColor(theme.bg_color)
+        self.container_bg = QColor(theme.container_bg)
+        self.border_color = QColor(theme.border_color)
+        self.text_color = QColor(theme.text_color)
+        self.placeholder_color = QColor(theme.placeholder_color)
+        self.accent_color = QColor(theme.accent_color)
+
+    def sizeHint(self, option, index):
+        return TILE_SIZE
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(painter.RenderHint.Antialiasing)
+
+        hovered = bool(option.state & QStyle.StateFlag.State_MouseOver)
+        tile = QRectF(option.rect).adjusted(2, 2, -2, -2)
+        painter.setPen(QPen(self.accent_color if hovered else self.border_color, 1))
+        painter.setBrush(self.bg_color if hovered else self.container_bg)
+        painter.drawRoundedRect(tile, 8, 8)
+
+        image_rect = QRect(
+            option.rect.x() + (option.rect.width() - THUMBNAIL_SIZE) // 2,
+            option.rect.y() + 10,
+            THUMBNAIL_SIZE,
+            THUMBNAIL_SIZE
+        )
+        pixmap = index.data(Qt.ItemDataRole.DecorationRole)
+        if pixmap is not None:
+            target = pixmap.size().scaled(image_rect.size(), Qt.AspectRatioMode.KeepAspectRatio)
+            x = image_rect.x() + (image_rect.width() - target.width()) // 2
+            y = image_rect.y() + (image_rect.height() - target.height()) // 2
+            painter.drawPixmap(QRect(x, y, target.width(), target.height()), pixmap)
+        else:
+            painter.setPen(self.placeholder_color)
+            painter.drawText(image_rect, Qt.AlignmentFlag.AlignCenter, "Loading...")
+
+        label_rect = QRect(option.rect.x() + 10, image_rect.bottom() + 8, option.rect.width() - 20, 24)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(self.bg_color)
+        painter.drawRoundedRect(QRectF(label_rect), 4, 4)
+        painter.setPen(self.text_color)
+        painter.drawText(label_rect, Qt.AlignmentFlag.AlignCenter, index.data(Qt.ItemDataRole.DisplayRole))
+
+        painter.restore()
+
+
+class GalleryView(QListView):
+    imageActivated = pyqtSignal(str)
+    similarRequested = pyqtSignal(str)
+    duplicatesRequested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setMovement(QListView.Movement.Static)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(FETCH_BATCH_SIZE)
+        self.setUniformItemSizes(True)
+        self.setSpacing(10)
+        self.setGridSize(TILE_SIZE + QSize(10, 10))
+        self.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.setMouseTracking(True)
+        self.viewport().setCursor(Qt.CursorShape.PointingHandCursor)
+        self.clicked.connect(lambda index: self.imageActivated.emit(index.data(PathRole)))
+
+        self.visible_rows_timer = QTimer(self)
+        self.visible_rows_timer.setSingleShot(True)
+        self.visible_rows_timer.setInterval(100)
+        self.visible_rows_timer.timeout.connect(self.update_visible_rows)
+        self.verticalScrollBar().valueChanged.connect(lambda: self.visible_rows_timer.start())
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.visible_rows_timer.start()
+
+    def contextMenuEvent(self, event):
+        index = self.indexAt(event.pos())
+        menu = QMenu(self)
+        if index.isValid():
+            path = index.data(PathRole)
+            menu.addAction("Find similar images", lambda: self.similarRequested.emit(path))
+        menu.addAction("Show near-duplicates", self.duplicatesRequested.emit)
+        menu.exec(event.globalPos())
+
+    def update_visible_rows(self):
+        model = self.model()
+        if model is None or model.rowCount() == 0:
+            return
+        first_index = self.indexAt(self.viewport().rect().topLeft() + QPoint(5, 5))
+        last_index = self.indexAt(self.viewport().rect().bottomRight() - QPoint(5, 5))
+        first = first_index.row() if first_index.isValid() else 0
+        last = last_index.row() if last_index.isValid() else model.rowCount() - 1
+        per_row = max(1, self.viewport().width() // self.gridSize().width())
+        margin = VISIBLE_MARGIN_ROWS * per_row
+        model.retain_rows(max(0, first - margin), last + margin)
@@ -0,0 +1,843 @@
+import sys
+import os
+import math
+from model_registry import ASPECT_RATIOS, models_by_group, supports_aspect_ratio
+from providers import missing_api_key
+from jobs import Job, JobCancelled, JobSuspended, JobTimeout
+from progress import ThrottledProgress, describe_event
+from pipeline import generate_variants, get_image_index, resume_interrupted
+from similarity_index import get_similarity_index
+from storage import IMAGE_DIR, get_image_store
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from thumbnails import ThumbnailCache, THUMBNAIL_DIR_NAME
+from gallery import CachePruner, GalleryModel, GalleryDelegate, GalleryView, GalleryIndexJob, GalleryWatcher
+from image_loader import ImageLoader, decode_scaled
+from image_pyramid import TilePyramid, TILE_DIR_NAME
+from image_viewer import TiledImageView
+from telemetry import Trace, METRICS, METRICS_FILE, record_trace
+from image_index import SORT_NEWEST, SORT_OLDEST
+from theme import DARK, LIGHT, get_theme_manager
+from PyQt6.QtWidgets import (
+    QApplication, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout, QWidget,
+    QMessageBox, QComboBox, QCheckBox, QGroupBox, QFrame, QGridLayout, QSizePolicy, QSpinBox,
+    QMainWindow, QDialog, QScrollArea
+)
+from PyQt6.QtGui import QPalette, QPixmap
+from PyQt6.QtCore import Qt, QEvent, pyqtSignal, QObject, QRunnable, QThreadPool, QTimer
+
+MAX_VARIANTS = 8
+
+class GenerationSignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+    progress = pyqtSignal(int, object)
+
+class GenerationWorker(QRunnable):
+    # Runs one model's generation (all of its variants) on a pool thread;
+    # results come back to the GUI thread through queued signals, keyed by
+    # the comparison slot. job.cancel() stops it from any thread.
+    def __init__(self, slot, prompt, model, aspect_ratio, variants=1, force=False):
+        super().__init__()
+        self.slot = slot
+        self.prompt = prompt
+        self.model = model
+        self.aspect_ratio = aspect_ratio
+        self.variants = variants
+        self.force = force
+        self.trace = Trace()
+        self.job = Job()
+        self.signals = GenerationSignals()
+
+    def run(self):
+        try:
+            outcomes = generate_variants(
+                self.prompt, self.model, self.aspect_ratio, self.variants,
+                progress=ThrottledProgress(lambda event: self.signals.progress.emit(self.slot, event)),
+                force=self.force,
+                trace=self.trace,
+                priority=PRIORITY_INTERACTIVE,
+                job=self.job
+            )
+        except JobCancelled as e:
+            if isinstance(e, JobTimeout):
+                self.signals.failed.emit(self.slot, str(e))
+            else:
+                self.signals.cancelled.emit(self.slot)
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.slot, str(e))
+            return
+        self.signals.finished.emit(self.slot, outcomes)
+
+class ResumeSignals(QObject):
+    finished = pyqtSignal(object)
+
+class ResumeWorker(QRunnable):
+    # Collects the fal requests an earlier session left in the queue when it
+    # crashed or was closed (see journal.py), in the batch lane so new
+    # generations go first. Emits the files it stored.
+    def __init__(self):
+        super().__init__()
+        self.job = Job()
+        self.signals = ResumeSignals()
+
+    def run(self):
+        try:
+            outcomes = resume_interrupted(priority=PRIORITY_BATCH, job=self.job)
+        except JobCancelled:
+            return
+        except Exception as e:
+            print(f"Error resuming interrupted generations: {e}")
+            return
+        self.signals.finished.emit([file_name for file_name, _ in outcomes if file_name])
+
+class MetricsSignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+class MetricsWorker(QRunnable):
+    # Computes image metrics for the primary/comparison variant pairs off the
+    # GUI thread. `generation` ties the result to the run that asked for it.
+    def __init__(self, generation, pairs):
+        super().__init__()
+        self.generation = generation
+        self.pairs = pairs
+        self.signals = MetricsSignals()
+
+    def run(self):
+        try:
+            from image_metrics import MetricsUnavailable, get_metrics_engine, summarize
+        except ImportError as e:
+            self.signals.failed.emit(self.generation, f"Image metrics unavailable: {e}")
+            return
+        try:
+            results = [get_metrics_engine().compare(path_a, path_b) for path_a, path_b in self.pairs]
+        except (OSError, MetricsUnavailable) as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        self.signals.finished.emit(self.generation, summarize(results))
+
+class SimilarityWorker(QRunnable):
+    # Catches the similarity index up with the gallery (only new images are
+    # hashed) and runs one query: images like `image_path`, or near-duplicate
+    # groups when it is None. Emits the matching index records in order.
+    def __init__(self, request, image_path=None):
+        super().__init__()
+        self.request = request
+        self.image_path = image_path
+        self.signals = MetricsSignals()
+
+    def run(self):
+        try:
+            from image_metrics import MetricsUnavailable
+            from similarity_index import refreshed_similarity_index
+        except ImportError as e:
+            self.signals.failed.emit(self.request, f"Similarity search unavailable: {e}")
+            return
+        try:
+            index = refreshed_similarity_index()
+            if self.image_path is None:
+                paths = [path for group in index.near_duplicates() for path in group]
+            else:
+                paths = [self.image_path] + [path for _, path in index.similar_to(self.image_path)]
+        except (OSError, MetricsUnavailable) as e:
+            self.signals.failed.emit(self.request, str(e))
+            return
+        records = [get_image_index().get(path) for path in paths]
+        self.signals.finished.emit(self.request, [record for record in records if record is not None])
+
+class ImageViewerDialog(QDialog):
+    # Full-resolution viewer: wheel or +/- to zoom, drag to pan, double-click
+    # to toggle between fit and 100%.
+    def __init__(self, image_path, thread_pool, pyramid, parent=None):
+        super().__init__(parent)
+        self.setObjectName("imageViewer")
+        self.setWindowTitle("Image Viewer")
+        self.setModal(True)
+        self.setMinimumSize(800, 600)
+        
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(20)
+        
+        image_container = QFrame()
+        image_container.setObjectName("imageContainer")
+        image_container.setFrameShape(QFrame.Shape.StyledPanel)
+        image_layout = QVBoxLayout(image_container)
+        
+        self.image_view = TiledImageView(pyramid, thread_pool)
+        self.image_view.open(image_path)
+        image_layout.addWidget(self.image_view)
+        layout.addWidget(image_container)
+        
+        controls_layout = QHBoxLayout()
+        fit_button = QPushButton("Fit")
+        fit_button.clicked.connect(self.image_view.fit)
+        actual_size_button = QPushButton("100%")
+        actual_size_button.clicked.connect(lambda: self.image_view.set_zoom(1.0))
+        self.zoom_label = QLabel()
+        self.image_view.zoomChanged.connect(lambda zoom: self.zoom_label.setText(f"{zoom * 100:.0f}%"))
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        controls_layout.addWidget(fit_button)
+        controls_layout.addWidget(actual_size_button)
+        controls_layout.addWidget(self.zoom_label)
+        controls_layout.addStretch()
+        controls_layout.addWidget(close_button)
+        layout.addLayout(controls_layout)
+        self.image_view.setFocus()
+
+    def done(self, result):
+        self.image_view.close_view()
+        super().done(result)
+
+class VariantGrid(QWidget):
+    # N-up grid of one comparison slot's images. Double-clicking a finished
+    # image opens it in the viewer.
+    imageActivated = pyqtSignal(str)
+
+    def __init__(self, slot, parent=None):
+        super().__init__(parent)
+        self.slot = slot
+        self.labels = []
+        self.files = {}
+        self.grid = QGridLayout(self)
+        self.grid.setContentsMargins(0, 0, 0, 0)
+        self.grid.setSpacing(6)
+        self.setMinimumSize(400, 400)
+        self.set_count(1, "Generated Image will appear here")
+
+    def set_count(self, count, text):
+        if count != len(self.labels):
+            for label in self.labels:
+                self.grid.removeWidget(label)
+                label.deleteLater()
+            columns = math.ceil(math.sqrt(count))
+            self.labels = []
+            for index in range(count):
+                label = QLabel()
+                label.setObjectName(f"comparison_image_{self.slot + 1}_{index + 1}")
+                label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+                label.setFrameShape(QFrame.Shape.StyledPanel)
+                label.setForegroundRole(QPalette.ColorRole.PlaceholderText)
+                # Ignored so a pixmap never grows its cell; images are decoded
+                # to the cell size instead.
+                label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+                label.installEventFilter(self)
+                self.grid.addWidget(label, index // columns, index % columns)
+                self.labels.append(label)
+        self.files = {}
+        for label in self.labels:
+            label.clear()
+            label.setText(text)
+
+    def set_file(self, label, file_name):
+        self.files[label] = file_name
+
+    def set_text(self, text):
+        for label in self.labels:
+            label.setText(text)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.MouseButtonDblClick and obj in self.files:
+            self.imageActivated.emit(self.files[obj])
+            return True
+        return super().eventFilter(obj, event)
+
+class ModelSelector(QFrame):
+    selectionChanged = pyqtSignal(str)
+    
+    def __init__(self, models, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setSpacing(4)  
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.buttons = []
+        
+        for category, model_list in models.items():
+            header = QLabel(category)
+            header.setObjectName("modelGroupHeader")
+            header.setAlignment(Qt.AlignmentFlag.AlignLeft)
+            layout.addWidget(header)
+            
+            for model in model_list:
+                btn = QPushButton(model)
+                btn.setCheckable(True)
+                btn.setObjectName("modelButton")
+                btn.clicked.connect(lambda checked, m=model: self.handle_selection(m))
+                layout.addWidget(btn)
+                self.buttons.append(btn)
+        
+        layout.addStretch()  
+        
+        if self.buttons:
+            self.buttons[0].setChecked(True)
+            self.current_selection = self.buttons[0].text()
+
+    def handle_selection(self, model):
+        for btn in self.buttons:
+            if btn.text() != model:
+                btn.setChecked(False)
+            else:
+                btn.setChecked(True)
+        
+        self.current_selection = model
+        self.selectionChanged.emit(model)
+
+    def currentText(self):
+        return self.current_selection
+
+    def setEnabled(self, enabled):
+        for btn in self.buttons:
+            btn.setEnabled(enabled)
+
+class ImageGeneratorApp(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.models = models_by_group()
+        self.theme_manager = get_theme_manager()
+
+        self.thread_pool = QThreadPool.globalInstance()
+        # Decoding gets its own pool so long-running provider calls never
+        # starve thumbnail and preview work.
+        self.image_pool = QThreadPool(self)
+        self.image_loader = ImageLoader(self.image_pool, self)
+        self.active_workers = {}
+        self.generation_id = 0
+        self.slot_files = {}
+        self.generation_errors = []
+        self.generation_cancelled = False
+        self.cached_results = 0
+        self.gallery_loaded = False
+        self.gallery_watcher = None
+        self.resume_worker = None
+        self.similarity_request = 0
+        self.thumbnail_cache = ThumbnailCache(os.path.join(IMAGE_DIR, THUMBNAIL_DIR_NAME))
+        self.tile_pyramid = TilePyramid(os.path.join(IMAGE_DIR, TILE_DIR_NAME))
+        self.cache_pruner = CachePruner([self.thumbnail_cache, self.tile_pyramid], self.image_pool, self)
+        
+        self.initUI()
+
+    def setup_model_combo(self, combo_box):
+        combo_box.clear()
+        
+        for group, models in self.models.items():
+            combo_box.addItem(f"── {group} ──")
+            combo_box.setItemData(combo_box.count() - 1, False, Qt.ItemDataRole.UserRole)
+            combo_box.setItemData(combo_box.count() - 1, Qt.AlignmentFlag.AlignCenter, Qt.ItemDataRole.TextAlignmentRole)
+            for model in models:
+                combo_box.addItem(model)
+
+        combo_box.view().installEventFilter(self)
+        
+        combo_box.setCurrentIndex(1)
+
+    def eventFilter(self, obj, event):
+        if isinstance(obj, QComboBox().view().__class__):
+            if event.type() == event.Type.MouseButtonPress:
+                index = obj.indexAt(event.pos())
+                if index.isValid():
+                    if not obj.model().data(index, Qt.ItemDataRole.UserRole) is False:
+                        return False
+                    return True
+        return super().eventFilter(obj, event)
+
+    def initUI(self):
+        self.setWindowTitle('AI Image Generator Studio')
+        self.setMinimumSize(1400, 900)
+
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+        main_layout.setSpacing(20)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+
+        header_layout = QHBoxLayout()
+        header_label = QLabel("AI Image Generator Studio")
+        header_label.setObjectName("headerTitle")
+        header_layout.addWidget(header_label)
+        main_layout.addLayout(header_layout)
+
+        prompt_group = QGroupBox("Image Prompt")
+        prompt_layout = QHBoxLayout()
+        self.prompt_input = QLineEdit()
+        self.prompt_input.setPlaceholderText("Describe the image you want to generate...")
+        self.generate_button = QPushButton("Generate Image")
+        self.generate_button.setObjectName("primaryButton")
+        self.generate_button.clicked.connect(self.on_generate_image)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setObjectName("secondaryButton")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.on_cancel_generation)
+        prompt_layout.addWidget(self.prompt_input)
+        prompt_layout.addWidget(self.generate_button)
+        prompt_layout.addWidget(self.cancel_button)
+        prompt_group.setLayout(prompt_layout)
+        main_layout.addWidget(prompt_group)
+
+        content_layout = QHBoxLayout()
+
+        sidebar_widget = QWidget()
+        sidebar_widget.setObjectName("sidebar")
+        sidebar_layout = QVBoxLayout(sidebar_widget)
+        sidebar_layout.setSpacing(15)
+
+        model_group = QGroupBox("Primary Model")
+        model_layout = QVBoxLayout()
+        self.model_selector = ModelSelector(self.models)
+        model_layout.addWidget(self.model_selector)
+        model_group.setLayout(model_layout)
+        sidebar_layout.addWidget(model_group)
+
+        compare_model_group = QGroupBox("Comparison Model")
+        compare_model_layout = QVBoxLayout()
+        self.compare_model_selector = ModelSelector(self.models)
+        self.compare_model_selector.setEnabled(False)
+        compare_model_layout.addWidget(self.compare_model_selector)
+        compare_model_group.setLayout(compare_model_layout)
+        sidebar_layout.addWidget(compare_model_group)
+
+        aspect_group = QGroupBox("Image Size")
+        aspect_layout = QVBoxLayout()
+        self.aspect_ratio_combo = QComboBox()
+        self.aspect_ratio_combo.addItems(ASPECT_RATIOS)
+        aspect_layout.addWidget(self.aspect_ratio_combo)
+        aspect_group.setLayout(aspect_layout)
+        sidebar_layout.addWidget(aspect_group)
+
+        variants_group = QGroupBox("Variants per Model")
+        variants_layout = QVBoxLayout()
+        self.variants_spin = QSpinBox()
+        self.variants_spin.setRange(1, MAX_VARIANTS)
+        self.variants_spin.setToolTip("Images per model for each prompt. Flux models batch them in one "
+                                      "request; Stability models run them concurrently.")
+        variants_layout.addWidget(self.variants_spin)
+        variants_group.setLayout(variants_layout)
+        sidebar_layout.addWidget(variants_group)
+
+        self.compare_checkbox = QCheckBox("Enable Model Comparison")
+        self.compare_checkbox.stateChanged.connect(self.toggle_compare_models)
+        sidebar_layout.addWidget(self.compare_checkbox)
+
+        self.force_checkbox = QCheckBox("Force regenerate (skip cache)")
+        sidebar_layout.addWidget(self.force_checkbox)
+
+        self.dark_theme_checkbox = QCheckBox("Dark theme")
+        self.dark_theme_checkbox.setChecked(self.theme_manager.theme == DARK)
+        self.dark_theme_checkbox.toggled.connect(self.on_dark_theme_toggled)
+        sidebar_layout.addWidget(self.dark_theme_checkbox)
+
+        sidebar_layout.addStretch()
+        # Two full model lists are taller than the window's minimum height.
+        sidebar_scroll = QScrollArea()
+        sidebar_scroll.setObjectName("sidebar")
+        sidebar_scroll.setWidget(sidebar_widget)
+        sidebar_scroll.setWidgetResizable(True)
+        sidebar_scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        sidebar_scroll.setMinimumWidth(sidebar_widget.sizeHint().width() + sidebar_scroll.verticalScrollBar().sizeHint().width())
+        content_layout.addWidget(sidebar_scroll)
+
+        main_content = QWidget()
+        main_content_layout = QVBoxLayout(main_content)
+
+        self.comparison_frame = QFrame()
+        self.comparison_frame.setObjectName("comparison_frame")
+        self.comparison_frame.setFrameShape(QFrame.Shape.StyledPanel)
+        comparison_frame_layout = QVBoxLayout(self.comparison_frame)
+        comparison_layout = QHBoxLayout()
+        comparison_frame_layout.addLayout(comparison_layout)
+        
+        self.variant_grids = []
+        for i, label_text in enumerate(["Primary Model", "Comparison Model"]):
+            container = QWidget()
+            container_layout = QVBoxLayout(container)
+            
+            model_label = QLabel(label_text)
+            model_label.setObjectName("slotTitle")
+            model_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            container_layout.addWidget(model_label)
+            
+            variant_grid = VariantGrid(i)
+            variant_grid.imageActivated.connect(self.show_image_viewer)
+            container_layout.addWidget(variant_grid, stretch=1)
+
+            timing_label = QLabel("")
+            timing_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            timing_label.setObjectName("timingLabel")
+            timing_label.setForegroundRole(QPalette.ColorRole.PlaceholderText)
+            container_layout.addWidget(timing_label)
+            
+            comparison_layout.addWidget(container)
+            
+            if i == 0:
+                self.model_label_1 = model_label
+                self.timing_label_1 = timing_label
+            else:
+                self.model_label_2 = model_label
+                self.timing_label_2 = timing_label
+            self.variant_grids.append(variant_grid)
+
+        self.metrics_label = QLabel("")
+        self.metrics_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.metrics_label.setObjectName("metricsLabel")
+        comparison_frame_layout.addWidget(self.metrics_label)
+
+        self.comparison_frame.hide()
+        main_content_layout.addWidget(self.comparison_frame)
+
+        gallery_group = QGroupBox("Generated Images Gallery")
+        gallery_filter_layout = QHBoxLayout()
+        self.gallery_model_filter = QComboBox()
+        self.gallery_model_filter.addItem("All models", "")
+        for model_list in self.models.values():
+            for model in model_list:
+                self.gallery_model_filter.addItem(model, model)
+        self.gallery_model_filter.currentIndexChanged.connect(self.on_gallery_filter_changed)
+        self.gallery_sort_combo = QComboBox()
+        self.gallery_sort_combo.addItem("Newest first", SORT_NEWEST)
+        self.gallery_sort_combo.addItem("Oldest first", SORT_OLDEST)
+        self.gallery_sort_combo.currentIndexChanged.connect(self.on_gallery_filter_changed)
+        gallery_filter_layout.addWidget(self.gallery_model_filter)
+        gallery_filter_layout.addWidget(self.gallery_sort_combo)
+        gallery_filter_layout.addStretch()
+        self.gallery_results_label = QLabel("")
+        self.gallery_show_all_button = QPushButton("Show all")
+        self.gallery_show_all_button.clicked.connect(self.on_gallery_filter_changed)
+        self.gallery_show_all_button.hide()
+        gallery_filter_layout.addWidget(self.gallery_results_label)
+        gallery_filter_layout.addWidget(self.gallery_show_all_button)
+
+        self.gallery_model = GalleryModel(self.thumbnail_cache, self.image_pool, self)
+        self.gallery_view = GalleryView()
+        self.gallery_view.setModel(self.gallery_model)
+        self.gallery_view.setItemDelegate(GalleryDelegate(self.theme_manager.theme, self.gallery_view))
+        self.theme_manager.changed.connect(self.on_theme_changed)
+        self.gallery_view.imageActivated.connect(self.show_image_viewer)
+        self.gallery_view.similarRequested.connect(self.find_similar)
+        self.gallery_view.duplicatesRequested.connect(lambda: self.find_similar(None))
+        gallery_layout = QVBoxLayout()
+        gallery_layout.addLayout(gallery_filter_layout)
+        gallery_layout.addWidget(self.gallery_view)
+        gallery_group.setLayout(gallery_layout)
+        main_content_layout.addWidget(gallery_group)
+
+        content_layout.addWidget(main_content, stretch=3)
+        main_layout.addLayout(content_layout)
+
+        self.statusBar().showMessage('Ready to generate images')
+
+    def on_dark_theme_toggled(self, checked):
+        self.theme_manager.apply(DARK if checked else LIGHT)
+
+    def on_theme_changed(self, theme):
+        # The stylesheet restyles every widget; only the custom-painted
+        # gallery needs telling.
+        self.gallery_view.itemDelegate().set_theme(theme)
+        self.gallery_view.viewport().update()
+
+    def toggle_compare_models(self, state):
+        self.comparison_frame.setVisible(state)
+        self.compare_model_selector.setEnabled(state)
+
+    def on_generate_image(self):
+        if not self.prompt_input.text():
+            QMessageBox.warning(self, "Input Error", "Please enter a valid prompt.")
+            return
+
+        selected = [self.model_selector.currentText()]
+        if self.compare_checkbox.isChecked():
+            selected.append(self.compare_model_selector.currentText())
+
+        key_error = missing_api_key(selected)
+        if key_error:
+            QMessageBox.warning(self, "API Key Error", key_error)
+            return
+
+        aspect_ratio = self.aspect_ratio_combo.currentText()
+        unsupported = [model for model in selected if not supports_aspect_ratio(model, aspect_ratio)]
+        if unsupported:
+            QMessageBox.warning(self, "Unsupported Aspect Ratio",
+                                f"{aspect_ratio} is not supported by: {', '.join(unsupported)}")
+            return
+
+        self.statusBar().showMessage('Generating image(s)...')
+        self.generate_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.generation_errors = []
+        self.generation_cancelled = False
+        self.cached_results = 0
+        self.generation_id += 1
+        self.slot_files = {}
+        self.metrics_label.setText("")
+
+        jobs = [(0, self.model_selector.currentText())]
+        self.model_label_1.setText(f"Model: {self.model_selector.currentText()}")
+        if self.compare_checkbox.isChecked():
+            jobs.append((1, self.compare_model_selector.currentText()))
+            self.model_label_2.setText(f"Model: {self.compare_model_selector.currentText()}")
+
+        variants = self.variants_spin.value()
+        for slot, model in jobs:
+            grid = self.variant_grids[slot]
+            for label in grid.labels:
+                self.image_loader.cancel(label.objectName())
+            grid.set_count(variants, "Generating...")
+            self.timing_label_for_slot(slot).setText("")
+            worker = GenerationWorker(
+                slot,
+                self.prompt_input.text(),
+                model,
+                self.aspect_ratio_combo.currentText(),
+                variants=variants,
+                force=self.force_checkbox.isChecked()
+            )
+            worker.signals.finished.connect(self.on_generation_finished)
+            worker.signals.failed.connect(self.on_generation_failed)
+            worker.signals.cancelled.connect(self.on_generation_cancelled)
+            worker.signals.progress.connect(self.on_generation_progress)
+            self.active_workers[slot] = worker
+            self.thread_pool.start(worker)
+
+    def on_cancel_generation(self):
+        # The workers stop at their next check (at once if waiting on the
+        # network) and report back through their cancelled signals.
+        self.cancel_button.setEnabled(False)
+        self.statusBar().showMessage('Cancelling...')
+        for worker in self.active_workers.values():
+            worker.job.cancel()
+
+    def suspend_generations(self):
+        # On quit the workers stop without cancelling their fal requests; the
+        # next session resumes them from the journal.
+        workers = list(self.active_workers.values())
+        if self.resume_worker is not None:
+            workers.append(self.resume_worker)
+        for worker in workers:
+            worker.job.cancel(JobSuspended("Suspended"))
+
+    def resume_interrupted(self):
+        worker = ResumeWorker()
+        worker.signals.finished.connect(self.on_resume_finished)
+        self.resume_worker = worker
+        self.thread_pool.start(worker)
+
+    def on_resume_finished(self, file_names):
+        self.resume_worker = None
+        for file_name in file_names:
+            self.add_to_gallery(file_name)
+        if file_names and not self.active_workers:
+            self.statusBar().showMessage(f"Recovered {len(file_names)} image(s) from an interrupted session")
+
+    def timing_label_for_slot(self, slot):
+        return self.timing_label_1 if slot == 0 else self.timing_label_2
+
+    def finish_trace(self, slot, trace):
+        record_trace(trace)
+        METRICS.write_prometheus(os.path.join(IMAGE_DIR, METRICS_FILE))
+        self.timing_label_for_slot(slot).setText(f"{trace.summary()} · total {trace.total():.2f}s")
+
+    def on_generation_progress(self, slot, event):
+        # Each pane shows its own request's progress under its images until
+        # the trace summary replaces it. Events still queued from a worker
+        # that has been cancelled are dropped.
+        if slot in self.active_workers:
+            self.timing_label_for_slot(slot).setText(describe_event(event))
+
+    def on_generation_finished(self, slot, outcomes):
+        worker = self.active_workers[slot]
+        grid = self.variant_grids[slot]
+        remaining = [sum(1 for file_name, _ in outcomes if file_name)]
+        self.slot_files[slot] = [file_name for file_name, _ in outcomes]
+
+        def on_loaded():
+            # The trace covers the slot until its last variant is on screen.
+            remaining[0] -= 1
+            if not remaining[0]:
+                self.finish_trace(slot, worker.trace)
+
+        for label, (file_name, cached) in zip(grid.labels, outcomes):
+            if not file_name:
+                label.setText("Generation failed")
+                continue
+            grid.set_file(label, file_name)
+            self.display_image(file_name, label, on_loaded=on_loaded, trace=worker.trace)
+            if cached:
+                self.cached_results += 1
+            else:
+                self.add_to_gallery(file_name)
+
+        failed = len(outcomes) - remaining[0]
+        if failed:
+            detail = "no image returned" if len(outcomes) == 1 else f"{failed} of {len(outcomes)} variants returned no image"
+            self.generation_errors.append(f"{worker.model}: {detail}")
+        if not remaining[0]:
+            self.finish_trace(slot, worker.trace)
+        self.complete_generation(slot)
+
+    def on_generation_failed(self, slot, error):
+        self.variant_grids[slot].set_text("Generation failed")
+        self.generation_errors.append(f"{self.active_workers[slot].model}: {error}")
+        self.finish_trace(slot, self.active_workers[slot].trace)
+        self.complete_generation(slot)
+
+    def on_generation_cancelled(self, slot):
+        self.variant_grids[slot].set_text("Cancelled")
+        self.generation_cancelled = True
+        self.finish_trace(slot, self.active_workers[slot].trace)
+        self.complete_generation(slot)
+
+    def complete_generation(self, slot):
+        self.active_workers.pop(slot, None)
+        if self.active_workers:
+            return
+
+        self.start_metrics()
+
+        self.generate_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        if self.generation_cancelled:
+            self.statusBar().showMessage('Generation cancelled')
+        elif self.generation_errors:
+            self.statusBar().showMessage('Error generating image')
+            QMessageBox.critical(self, "Error", "Failed to generate image:\n" + "\n".join(self.generation_errors))
+        else:
+            message = 'Image generation completed successfully'
+            if self.cached_results:
+                message += f' ({self.cached_results} from cache)'
+            self.statusBar().showMessage(message)
+            QMessageBox.information(self, "Success", "Image(s) generated successfully!")
+
+    def start_metrics(self):
+        # Variant k of the primary model is compared with variant k of the
+        # comparison model.
+        if len(self.slot_files) < 2:
+            return
+        pairs = [(a, b) for a, b in zip(self.slot_files[0], self.slot_files[1]) if a and b]
+        if not pairs:
+            return
+        self.metrics_label.setText("Computing image metrics...")
+        worker = MetricsWorker(self.generation_id, pairs)
+        worker.signals.finished.connect(self.on_metrics_finished)
+        worker.signals.failed.connect(self.on_metrics_failed)
+        self.image_pool.start(worker)
+
+    def on_metrics_finished(self, generation, summary):
+        if generation != self.generation_id:
+            return  # a newer generation replaced these images
+        from image_metrics import format_summary
+        self.metrics_label.setText(format_summary(summary))
+
+    def on_metrics_failed(self, generation, error):
+        if generation == self.generation_id:
+            self.metrics_label.setText(error)
+
+    def show_image_viewer(self, image_path):
+        dialog = ImageViewerDialog(image_path, self.image_pool, self.tile_pyramid, self)
+        dialog.exec()
+
+    def display_image(self, file_name, label, on_loaded=None, trace=None):
+        size = label.size()
+
+        def decode():
+            if trace is None:
+                return decode_scaled(file_name, size)
+            with trace.span("decode"):
+                return decode_scaled(file_name, size)
+
+        def show(image):
+            if image.isNull():
+                label.setText("Unable to load image")
+            else:
+                label.setPixmap(QPixmap.fromImage(image))
+            if on_loaded:
+                on_loaded()
+
+        label.setText("Loading image...")
+        self.image_loader.cancel(label.objectName())
+        self.image_loader.load(label.objectName(), decode, show, priority=1)
+
+    def add_to_gallery(self, file_path):
+        record = get_image_index().get(file_path)
+        if record is not None:
+            self.gallery_model.apply_changes([record])
+        get_similarity_index().submit(file_path)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        # The gallery (index open, backfill, first page) is populated only
+        # after the window has painted once, so startup shows a frame first.
+        if not self.gallery_loaded:
+            self.gallery_loaded = True
+            QTimer.singleShot(0, self.load_gallery)
+
+    def load_gallery(self):
+        self.resume_interrupted()
+        self.gallery_model.set_index(get_image_index())
+        self.gallery_model.reload()
+        job = GalleryIndexJob(get_image_index(), IMAGE_DIR)
+        job.signals.finished.connect(self.on_gallery_indexed)
+        self.gallery_index_job = job
+        self.image_pool.start(job)
+
+    def on_gallery_indexed(self, added, paths, indexed_at):
+        self.gallery_index_job = None
+        if added:
+            self.gallery_model.reload()
+        self.cache_pruner.start(paths, indexed_at)
+        # From here on the gallery follows the directory incrementally,
+        # picking up images other processes write as well as our own.
+        self.gallery_watcher = GalleryWatcher(get_image_index(), IMAGE_DIR, self.image_pool, get_image_store(), self)
+        self.gallery_watcher.changed.connect(self.gallery_model.apply_changes)
+        self.gallery_watcher.start()
+
+    def find_similar(self, image_path):
+        # Pins the gallery to the results until "Show all" or a filter change.
+        self.similarity_request += 1
+        self.gallery_results_label.setText(
+            "Finding near-duplicates..." if image_path is None else "Finding similar images...")
+        self.gallery_show_all_button.show()
+        worker = SimilarityWorker(self.similarity_request, image_path)
+        worker.signals.finished.connect(lambda request, records: self.on_similar_found(request, records, image_path))
+        worker.signals.failed.connect(self.on_similar_failed)
+        self.image_pool.start(worker)
+
+    def on_similar_found(self, request, records, image_path):
+        if request != self.similarity_request:
+            return
+        self.gallery_model.show_records(records)
+        if image_path is None:
+            self.gallery_results_label.setText(f"{len(records)} near-duplicate image(s)")
+        else:
+            self.gallery_results_label.setText(f"{max(0, len(records) - 1)} similar image(s)")
+
+    def on_similar_failed(self, request, error):
+        if request == self.similarity_request:
+            self.gallery_results_label.setText(error)
+
+    def on_gallery_filter_changed(self):
+        self.similarity_request += 1
+        self.gallery_results_label.setText("")
+        self.gallery_show_all_button.hide()
+        self.gallery_model.reload(
+            sort=self.gallery_sort_combo.currentData(),
+            model_filter=self.gallery_model_filter.currentData()
+        )
+
+def run(argv):
+    app = QApplication(argv)
+    app.setStyle('Fusion')
+    get_theme_manager()
+    window = ImageGeneratorApp()
+    # Quitting mid-generation suspends it: fal requests stay queued and are
+    # journaled for the next session. The workers are let finish before the
+    # interpreter shuts down.
+    app.aboutToQuit.connect(window.suspend_generations)
+    window.show()
+    code = app.exec()
+    QThreadPool.globalInstance().waitForDone()
+    return code
+
+if __name__ == "__main__":
+    sys.exit(run(sys.argv))
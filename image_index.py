@@ -0,0 +1,360 @@
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from model_registry import provider_for
+
+INDEX_FILE = ".index.sqlite"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+FIELDS = [
+    "path", "prompt", "model", "provider", "aspect_ratio", "seed", "latency",
+    "byte_size", "width", "height", "sha256", "created_at",
+]
+ImageRecord = namedtuple("ImageRecord", FIELDS)
+ImageRecord.__new__.__defaults__ = (None,) * len(FIELDS)
+
+SORT_NEWEST = "newest"
+SORT_OLDEST = "oldest"
+
+
+def model_from_file_name(file_name):
+    # generated_image_{date}_{random}_{model}.{ext}; the model itself may
+    # contain underscores, so only the first four separators are structural.
+    # Content-addressed names (the image store) carry no model.
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return ""
+    parts = stem.split("_", 4)
+    return parts[4] if len(parts) == 5 else parts[-1]
+
+
+def read_image_size(file_path):
+    # Reads dimensions from the PNG IHDR, WebP or JPEG SOF header without
+    # decoding the image. Returns (None, None) for anything else.
+    try:
+        with open(file_path, "rb") as file:
+            header = file.read(30)
+            if header[:8] == b"\x89PNG\r\n\x1a\n" and header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+            if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+                return webp_size(header)
+            if header[:2] != b"\xff\xd8":
+                return None, None
+            file.seek(2)
+            while True:
+                marker = file.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None, None
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                length = struct.unpack(">H", file.read(2))[0]
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">xHH", file.read(5))
+                    return width, height
+                file.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None, None
+
+
+def webp_size(header):
+    chunk = header[12:16]
+    if chunk == b"VP8L":
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    return None, None
+
+
+def is_image_file(name):
+    # Dot-files are in-progress downloads and the index's own databases.
+    return name.endswith(IMAGE_EXTENSIONS) and not name.startswith(".")
+
+
+def record_for_file(path, stat):
+    # What can be known about an image from the file alone; used for files
+    # that were not written through the pipeline.
+    width, height = read_image_size(path)
+    model = model_from_file_name(path)
+    return ImageRecord(
+        path=path,
+        model=model,
+        provider=provider_for(model) or ("fal" if model.startswith("flux") else "stability" if model else None),
+        byte_size=stat.st_size,
+        width=width,
+        height=height,
+        created_at=stat.st_mtime,
+    )
+
+
+def scan_directory(directory):
+    # {path: (mtime_ns, size)} for every image directly in `directory`.
+    snapshot = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not is_image_file(entry.name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed between listing and stat
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        pass
+    return snapshot
+
+
+class ImageIndex:
+    # Metadata for every generated image, in SQLite with WAL so the GUI can
+    # page through it while a batch run in another process is writing.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY,
+                prompt TEXT,
+                model TEXT,
+                provider TEXT,
+                aspect_ratio TEXT,
+                seed INTEGER,
+                latency REAL,
+                byte_size INTEGER,
+                width INTEGER,
+                height INTEGER,
+                sha256 TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS images_created ON images (created_at, path);
+            CREATE INDEX IF NOT EXISTS images_model_created ON images (model, created_at, path);
+            CREATE INDEX IF NOT EXISTS images_provider_created ON images (provider, created_at, path);
+            CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+            CREATE TABLE IF NOT EXISTS backfills (
+                directory TEXT PRIMARY KEY,
+                completed_at REAL NOT NULL
+            );
+        """)
+        self.connection.commit()
+
+    def record(self, record):
+        if record.created_at is None:
+            record = record._replace(created_at=time.time())
+        with self.lock:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO images ({', '.join(FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(FIELDS))})",
+                tuple(record)
+            )
+            self.connection.commit()
+        return record
+
+    def get(self, path):
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(FIELDS)} FROM images WHERE path = ?", (path,)
+            ).fetchone()
+        return ImageRecord(*row) if row else None
+
+    def remove(self, path):
+        with self.lock:
+            self.connection.execute("DELETE FROM images WHERE path = ?", (path,))
+            self.connection.commit()
+
+    def relocate(self, old_path, new_path):
+        # Moves the metadata of a re-encoded file to its new path. Returns the
+        # new record, or None.
+        record = self.get(old_path)
+        if record is None:
+            return None
+        try:
+            stat = os.stat(new_path)
+        except OSError:
+            return None
+        width, height = read_image_size(new_path)
+        moved = record._replace(path=new_path, byte_size=stat.st_size, width=width or record.width,
+                                height=height or record.height)
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM images WHERE path = ?", (old_path,))
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO images ({', '.join(FIELDS)}) "
+                    f"VALUES ({', '.join('?' * len(FIELDS))})",
+                    tuple(moved)
+                )
+        return moved
+
+    def where_clause(self, model=None, provider=None):
+        clauses, params = [], []
+        if model:
+            clauses.append("model = ?")
+            params.append(model)
+        if provider:
+            clauses.append("provider = ?")
+            params.append(provider)
+        return clauses, params
+
+    def count(self, model=None, provider=None):
+        clauses, params = self.where_clause(model, provider)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM images {where}", params).fetchone()[0]
+
+    def page(self, after=None, limit=200, sort=SORT_NEWEST, model=None, provider=None):
+        # Keyset pagination on (created_at, path): `after` is the last record
+        # of the previous page, so inserts at the head never shift later pages.
+        clauses, params = self.where_clause(model, provider)
+        descending = sort == SORT_NEWEST
+        if after is not None:
+            clauses.append(f"(created_at, path) {'<' if descending else '>'} (?, ?)")
+            params.extend([after.created_at, after.path])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "DESC" if descending else "ASC"
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(FIELDS)} FROM images {where} "
+                f"ORDER BY created_at {order}, path {order} LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [ImageRecord(*row) for row in rows]
+
+    def paths(self):
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT path FROM images")]
+
+    def paths_in(self, directory):
+        return [path for path in self.paths() if os.path.dirname(path) == directory]
+
+    def models(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT DISTINCT model FROM images ORDER BY model").fetchall()
+        return [row[0] for row in rows if row[0]]
+
+    def is_backfilled(self, directory):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM backfills WHERE directory = ?", (os.path.abspath(directory),)
+            ).fetchone() is not None
+
+    def backfill(self, directory):
+        # One-off bulk import of images that predate the index. Only cheap
+        # metadata is gathered (stat, filename, image header); content hashes
+        # are left empty rather than reading every file.
+        existing = set()
+        with self.lock:
+            for (path,) in self.connection.execute("SELECT path FROM images"):
+                existing.add(path)
+
+        records = []
+        if os.path.isdir(directory):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not is_image_file(entry.name):
+                        continue
+                    if entry.path in existing:
+                        continue
+                    records.append(record_for_file(entry.path, entry.stat()))
+
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    f"INSERT OR IGNORE INTO images ({', '.join(FIELDS)}) "
+                    f"VALUES ({', '.join('?' * len(FIELDS))})",
+                    [tuple(record) for record in records]
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO backfills (directory, completed_at) VALUES (?, ?)",
+                    (os.path.abspath(directory), time.time())
+                )
+        return len(records)
+
+    def sync(self, previous, current):
+        # Brings the index in line with a directory change between two
+        # scan_directory() snapshots. A None in `previous` means "state
+        # unknown": the file is only treated as new if the index lacks it.
+        # Returns (upserted records, removed records).
+        upserted, removed = [], []
+        for path, state in current.items():
+            before = previous.get(path, False)
+            if before == state or (before is None and self.get(path) is not None):
+                continue
+            record = self.get(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if record is None:
+                # INSERT OR IGNORE: the process that wrote the file may be
+                # recording its full metadata at the same moment.
+                with self.lock:
+                    self.connection.execute(
+                        f"INSERT OR IGNORE INTO images ({', '.join(FIELDS)}) "
+                        f"VALUES ({', '.join('?' * len(FIELDS))})",
+                        tuple(record_for_file(path, stat))
+                    )
+                    self.connection.commit()
+            elif before is not False:
+                # Rewritten in place: refresh what the file says and move it
+                # up to where a new image would sort.
+                width, height = read_image_size(path)
+                self.record(record._replace(
+                    byte_size=stat.st_size, width=width, height=height,
+                    created_at=max(record.created_at, stat.st_mtime),
+                ))
+            record = self.get(path)
+            if record is not None:
+                upserted.append(record)
+        for path in previous:
+            if path not in current:
+                record = self.get(path)
+                if record is not None:
+                    self.remove(path)
+                    removed.append(record)
+        return upserted, removed
+
+    def apply_store_changes(self, added, removed):
+        # Follows image store ledger entries (see storage.ImageStore). Files
+        # the pipeline has not recorded yet get a placeholder record that its
+        # own record() replaces. Returns (upserted, removed) records; a
+        # removed path the index already dropped (a relocation) is reported
+        # with its path only.
+        upserted, gone = [], []
+        for path in added:
+            record = self.get(path)
+            if record is None:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                with self.lock:
+                    self.connection.execute(
+                        f"INSERT OR IGNORE INTO images ({', '.join(FIELDS)}) "
+                        f"VALUES ({', '.join('?' * len(FIELDS))})",
+                        tuple(record_for_file(path, stat))
+                    )
+                    self.connection.commit()
+                record = self.get(path)
+            if record is not None:
+                upserted.append(record)
+        for path in removed:
+            record = self.get(path)
+            if record is not None and not os.path.exists(path):
+                self.remove(path)
+            gone.append(record or ImageRecord(path=path))
+        return upserted, gone
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
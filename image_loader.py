@@ -0,0 +1,102 @@
+from PyQt6.QtGui import QImage, QImageReader
+from PyQt6.QtCore import Qt, QObject, QRunnable, pyqtSignal
+
+
+def decode_scaled(file_path, target_size):
+    # Asking the reader for the scaled size up front lets formats such as
+    # JPEG downscale while decoding, and never materialises a full-resolution
+    # QImage for formats that cannot.
+    reader = QImageReader(file_path)
+    reader.setAutoTransform(True)
+    source_size = reader.size()
+    if source_size.isValid() and target_size.isValid():
+        scaled_size = source_size.scaled(target_size, Qt.AspectRatioMode.KeepAspectRatio)
+        if scaled_size.width() < source_size.width():
+            reader.setScaledSize(scaled_size)
+    image = reader.read()
+    if image.isNull():
+        print(f"Error decoding {file_path}: {reader.errorString()}")
+    return image
+
+
+class ImageLoadSignals(QObject):
+    loaded = pyqtSignal(str, QImage)
+
+
+class ImageLoadJob(QRunnable):
+    def __init__(self, key, decode):
+        super().__init__()
+        self.key = key
+        self.decode = decode
+        self.cancelled = False
+        self.started = False
+        self.signals = ImageLoadSignals()
+
+    def run(self):
+        self.started = True
+        if self.cancelled:
+            return
+        try:
+            image = self.decode()
+        except OSError as e:
+            print(f"Error loading image {self.key}: {e}")
+            image = None
+        if not self.cancelled:
+            self.signals.loaded.emit(self.key, image if image is not None else QImage())
+
+
+class ImageLoader(QObject):
+    # Decodes QImages on the thread pool and hands them back to the GUI thread
+    # through the per-request callback. Requests are keyed so callers can
+    # supersede or cancel them; a cancelled job that has not started yet is
+    # pulled out of the pool queue. The pool deletes a job's C++ object once
+    # it has run, while the job stays in `jobs` until its queued result is
+    # handled, so only jobs that have not started are taken back.
+    def __init__(self, thread_pool, parent=None):
+        super().__init__(parent)
+        self.thread_pool = thread_pool
+        self.jobs = {}
+        self.callbacks = {}
+
+    def load(self, key, decode, callback, priority=0):
+        if key in self.jobs:
+            self.callbacks[key] = callback
+            return
+        job = ImageLoadJob(key, decode)
+        job.signals.loaded.connect(self.on_job_loaded)
+        self.jobs[key] = job
+        self.callbacks[key] = callback
+        self.thread_pool.start(job, priority)
+
+    def load_scaled(self, key, file_path, target_size, callback, priority=0):
+        self.load(key, lambda: decode_scaled(file_path, target_size), callback, priority)
+
+    def cancel(self, key):
+        job = self.jobs.pop(key, None)
+        self.callbacks.pop(key, None)
+        if job is not None:
+            job.cancelled = True
+            if not job.started:
+                try:
+                    self.thread_pool.tryTake(job)
+                except RuntimeError:
+                    pass  # started and finished since the check
+
+    def cancel_all(self):
+        for key in list(self.jobs):
+            self.cancel(key)
+
+    def is_pending(self, key):
+        return key in self.jobs
+
+    def pending_keys(self):
+        return list(self.jobs)
+
+    def on_job_loaded(self, key, image):
+        job = self.jobs.get(key)
+        if job is None or job.signals is not self.sender():
+            return  # superseded or cancelled after the result was queued
+        del self.jobs[key]
+        callback = self.callbacks.pop(key, None)
+        if callback is not None:
+            callback(image)
@@ -0,0 +1,334 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from storage import IMAGE_DIR, ensure_image_dir
+
+# Numeric comparison of two models' outputs. Images are decoded once to a
+# fixed-size RGB array and every statistic is computed with whole-array NumPy
+# operations. Results are cached by content hash, so re-running a comparison
+# or a batch over the same files is a lookup.
+#
+# Callers import this module lazily: NumPy is too heavy for the headless
+# import budget, and batch runs without --pair-metrics never need it.
+
+METRICS_FILE = ".image_metrics.sqlite"
+# Bump when a statistic's definition changes; older cache entries are ignored.
+METRICS_VERSION = 1
+ANALYSIS_SIZE = 256
+HISTOGRAM_BINS = 32
+SSIM_WINDOW = 7
+# Sobel magnitude on [0, 1] intensities; 0.5 is roughly a 12% step.
+EDGE_THRESHOLD = 0.5
+PHASH_SIZE = 32
+PHASH_BITS = 8
+DECODED_CACHE_SIZE = 16
+
+
+class MetricsUnavailable(Exception):
+    pass
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_rgb(file_path, size=ANALYSIS_SIZE):
+    # (size, size, 3) uint8. Qt's reader scales while decoding; Pillow is the
+    # fallback for machines without Qt (batch runs on servers).
+    try:
+        from PyQt6.QtGui import QImage, QImageReader
+        from PyQt6.QtCore import QSize
+    except ImportError:
+        QImageReader = None
+    if QImageReader is not None:
+        reader = QImageReader(file_path)
+        reader.setAutoTransform(True)
+        reader.setScaledSize(QSize(size, size))
+        image = reader.read()
+        if image.isNull():
+            raise OSError(f"Cannot decode {file_path}: {reader.errorString()}")
+        image = image.convertToFormat(QImage.Format.Format_RGB888)
+        pixels = np.frombuffer(image.constBits().asstring(image.sizeInBytes()), np.uint8)
+        return pixels.reshape(size, image.bytesPerLine())[:, :size * 3].reshape(size, size, 3).copy()
+    try:
+        from PIL import Image
+    except ImportError:
+        raise MetricsUnavailable("Image metrics need PyQt6 or Pillow to decode images") from None
+    with Image.open(file_path) as image:
+        return np.asarray(image.convert("RGB").resize((size, size), Image.BILINEAR))
+
+
+def grayscale(pixels):
+    # Rec. 601 luma on [0, 1].
+    return pixels.astype(np.float64) @ np.array([0.299, 0.587, 0.114]) / 255.0
+
+
+def color_histograms(pixels):
+    # One normalised histogram per channel, shape (3, HISTOGRAM_BINS).
+    shift = 8 - int(np.log2(HISTOGRAM_BINS))
+    binned = (pixels.reshape(-1, 3) >> shift).astype(np.intp) + np.arange(3) * HISTOGRAM_BINS
+    counts = np.bincount(binned.ravel(), minlength=3 * HISTOGRAM_BINS).reshape(3, HISTOGRAM_BINS)
+    return counts / counts.sum(axis=1, keepdims=True)
+
+
+def histogram_distance(a, b):
+    # Hellinger distance per channel, averaged: 0 for identical colour
+    # distributions, 1 for disjoint ones.
+    overlap = np.sqrt(color_histograms(a) * color_histograms(b)).sum(axis=1)
+    return float(np.sqrt(np.clip(1.0 - overlap, 0.0, None)).mean())
+
+
+def box_mean(values, size):
+    # Mean over every size x size window ("valid" region) from a summed-area
+    # table, so the cost does not depend on the window size.
+    table = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    sums = table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size]
+    return sums / (size * size)
+
+
+def ssim(a, b, window=SSIM_WINDOW):
+    # Mean structural similarity of the luma channels with a uniform window.
+    x, y = grayscale(a), grayscale(b)
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+    mean_x, mean_y = box_mean(x, window), box_mean(y, window)
+    # Sample (co)variances, as in the reference implementation.
+    correction = window * window / (window * window - 1)
+    var_x = (box_mean(x * x, window) - mean_x ** 2) * correction
+    var_y = (box_mean(y * y, window) - mean_y ** 2) * correction
+    covariance = (box_mean(x * y, window) - mean_x * mean_y) * correction
+    numerator = (2 * mean_x * mean_y + c1) * (2 * covariance + c2)
+    denominator = (mean_x ** 2 + mean_y ** 2 + c1) * (var_x + var_y + c2)
+    return float((numerator / denominator).mean())
+
+
+def edge_density(gray):
+    # Fraction of pixels whose Sobel gradient magnitude exceeds EDGE_THRESHOLD.
+    gx = (gray[:-2, 2:] + 2 * gray[1:-1, 2:] + gray[2:, 2:]) - (gray[:-2, :-2] + 2 * gray[1:-1, :-2] + gray[2:, :-2])
+    gy = (gray[2:, :-2] + 2 * gray[2:, 1:-1] + gray[2:, 2:]) - (gray[:-2, :-2] + 2 * gray[:-2, 1:-1] + gray[:-2, 2:])
+    return float((np.hypot(gx, gy) > EDGE_THRESHOLD).mean())
+
+
+def sharpness(gray):
+    # Variance of the Laplacian on 0-255 intensities. Measured at the
+    # analysis size, so it ranks images against each other rather than being
+    # an absolute figure.
+    laplacian = gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * gray[1:-1, 1:-1]
+    return float((laplacian * 255).var())
+
+
+_dct_matrix = None
+
+
+def dct_matrix(size=PHASH_SIZE):
+    global _dct_matrix
+    if _dct_matrix is None:
+        k, n = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+        _dct_matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    return _dct_matrix
+
+
+def perceptual_hash(gray):
+    # 64-bit DCT hash: downscale to 32x32 by block means, keep the 8x8
+    # lowest frequencies and set a bit for every coefficient above their
+    # median (the DC term is left out of the median). Returned as 16 hex digits.
+    block = gray.shape[0] // PHASH_SIZE
+    small = gray[:block * PHASH_SIZE, :block * PHASH_SIZE]
+    small = small.reshape(PHASH_SIZE, block, PHASH_SIZE, block).mean(axis=(1, 3))
+    matrix = dct_matrix()
+    low = (matrix @ small @ matrix.T)[:PHASH_BITS, :PHASH_BITS].ravel()
+    bits = low > np.median(low[1:])
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def hamming_distance(hash_a, hash_b):
+    return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+
+
+def image_features(pixels):
+    gray = grayscale(pixels)
+    return {
+        "sharpness": round(sharpness(gray), 2),
+        "edge_density": round(edge_density(gray), 4),
+        "phash": perceptual_hash(gray),
+    }
+
+
+def pair_metrics(a, b):
+    return {
+        "ssim": round(ssim(a, b), 4),
+        "histogram_distance": round(histogram_distance(a, b), 4),
+    }
+
+
+class MetricsCache:
+    # Per-image features keyed by content hash, and per-pair metrics keyed
+    # by the ordered pair of hashes.
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS image_features (
+                sha256 TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                features TEXT NOT NULL,
+                PRIMARY KEY (sha256, version)
+            );
+            CREATE TABLE IF NOT EXISTS pair_metrics (
+                sha256_a TEXT NOT NULL,
+                sha256_b TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                metrics TEXT NOT NULL,
+                PRIMARY KEY (sha256_a, sha256_b, version)
+            );
+        """)
+        self.connection.commit()
+
+    def get_features(self, sha256):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT features FROM image_features WHERE sha256 = ? AND version = ?", (sha256, METRICS_VERSION)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_features(self, sha256, features):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO image_features (sha256, version, features) VALUES (?, ?, ?)",
+                (sha256, METRICS_VERSION, json.dumps(features))
+            )
+            self.connection.commit()
+
+    def get_pair(self, sha256_a, sha256_b):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT metrics FROM pair_metrics WHERE sha256_a = ? AND sha256_b = ? AND version = ?",
+                (sha256_a, sha256_b, METRICS_VERSION)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_pair(self, sha256_a, sha256_b, metrics):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pair_metrics (sha256_a, sha256_b, version, metrics) VALUES (?, ?, ?, ?)",
+                (sha256_a, sha256_b, METRICS_VERSION, json.dumps(metrics))
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class MetricsEngine:
+    # Thread-safe; keeps the last few decoded arrays so an image compared
+    # against several others (a batch's reference model) is decoded once.
+    def __init__(self, cache=None, decode=load_rgb):
+        self.cache = cache
+        self.decode = decode
+        self.decoded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pixels(self, file_path, sha256):
+        with self.lock:
+            pixels = self.decoded.get(sha256)
+            if pixels is not None:
+                self.decoded.move_to_end(sha256)
+                return pixels
+        pixels = self.decode(file_path)
+        with self.lock:
+            self.decoded[sha256] = pixels
+            while len(self.decoded) > DECODED_CACHE_SIZE:
+                self.decoded.popitem(last=False)
+        return pixels
+
+    def features(self, file_path, sha256=None):
+        sha256 = sha256 or file_sha256(file_path)
+        features = self.cache.get_features(sha256) if self.cache else None
+        if features is None:
+            features = image_features(self.pixels(file_path, sha256))
+            if self.cache:
+                self.cache.put_features(sha256, features)
+        return features
+
+    def compare(self, path_a, path_b):
+        # {"ssim", "histogram_distance", "phash_distance", "a": {...}, "b": {...}}
+        sha_a, sha_b = file_sha256(path_a), file_sha256(path_b)
+        metrics = self.cache.get_pair(sha_a, sha_b) if self.cache else None
+        if metrics is None:
+            metrics = pair_metrics(self.pixels(path_a, sha_a), self.pixels(path_b, sha_b))
+            if self.cache:
+                self.cache.put_pair(sha_a, sha_b, metrics)
+        features_a, features_b = self.features(path_a, sha_a), self.features(path_b, sha_b)
+        return {
+            **metrics,
+            "phash_distance": hamming_distance(features_a["phash"], features_b["phash"]),
+            "a": features_a,
+            "b": features_b,
+        }
+
+    def compare_many(self, pairs, workers=4):
+        # Bulk form for batch runs; one result (or None on a decode error)
+        # per (path_a, path_b), in order. NumPy and the decoder release the
+        # GIL for the heavy parts, so threads overlap well.
+        def compare(pair):
+            try:
+                return self.compare(*pair)
+            except (OSError, MetricsUnavailable) as e:
+                print(f"Error comparing {pair[0]} and {pair[1]}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(compare, pairs))
+
+
+def summarize(results):
+    # Mean of each pair statistic over several variant pairs, for display.
+    results = [result for result in results if result]
+    if not results:
+        return None
+    keys = ["ssim", "histogram_distance", "phash_distance"]
+    summary = {key: sum(result[key] for result in results) / len(results) for key in keys}
+    for side in ("a", "b"):
+        summary[side] = {
+            key: sum(result[side][key] for result in results) / len(results)
+            for key in ("sharpness", "edge_density")
+        }
+    summary["pairs"] = len(results)
+    return summary
+
+
+def format_summary(summary):
+    if summary is None:
+        return ""
+    return (
+        f"SSIM {summary['ssim']:.3f} · colour histogram Δ {summary['histogram_distance']:.3f} · "
+        f"pHash Δ {summary['phash_distance']:.0f}/64 · "
+        f"edges {summary['a']['edge_density']:.1%} / {summary['b']['edge_density']:.1%} · "
+        f"sharpness {summary['a']['sharpness']:.0f} / {summary['b']['sharpness']:.0f}"
+        + (f" (mean of {summary['pairs']} pairs)" if summary["pairs"] > 1 else "")
+    )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_metrics_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            ensure_image_dir()
+            _engine = MetricsEngine(MetricsCache(os.path.join(IMAGE_DIR, METRICS_FILE)))
+        return _engine
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from PyQt6.QtGui import QImage, QImageReader
+from PyQt6.QtCore import Qt, QObject, QRunnable, pyqtSignal
+
+TILE_SIZE = 256
+TILE_DIR_NAME = ".tiles"
+TILE_FORMAT = "png"
+PYRAMID_INFO = "pyramid.json"
+
+# width/height of the full image, `levels` halvings down to a single tile.
+PyramidInfo = namedtuple("PyramidInfo", ["path", "width", "height", "levels", "tile_size"])
+
+
+class TilePyramid:
+    # Mipmap tile pyramids on disk, keyed like the thumbnail cache by
+    # (path, mtime, size). Level 0 is full resolution; each level above halves
+    # it until one tile covers the image. The viewer reads only the tiles it
+    # shows, so nothing ever holds a full-resolution image except the one-off
+    # build.
+    def __init__(self, cache_dir, tile_size=TILE_SIZE):
+        self.cache_dir = cache_dir
+        self.tile_size = tile_size
+
+    def key(self, file_path, stat=None):
+        stat = stat or os.stat(file_path)
+        raw = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.tile_size}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def pyramid_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def tile_path(self, info, level, column, row):
+        return os.path.join(info.path, f"{level}_{column}_{row}.{TILE_FORMAT}")
+
+    def get(self, file_path):
+        try:
+            directory = self.pyramid_dir(self.key(file_path))
+            with open(os.path.join(directory, PYRAMID_INFO), encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return PyramidInfo(directory, data["width"], data["height"], data["levels"], data["tile_size"])
+
+    def build(self, file_path):
+        reader = QImageReader(file_path)
+        reader.setAutoTransform(True)
+        image = reader.read()
+        if image.isNull():
+            print(f"Error decoding {file_path}: {reader.errorString()}")
+            return None
+        image = image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+        width, height = image.width(), image.height()
+
+        # Tiles go to a temp directory renamed into place once complete, so a
+        # half-built pyramid is never read.
+        directory = self.pyramid_dir(self.key(file_path))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=".build-", dir=self.cache_dir)
+        info = PyramidInfo(temp_dir, width, height, levels_for(width, height, self.tile_size), self.tile_size)
+        try:
+            for level in range(info.levels):
+                if level:
+                    image = image.scaled(
+                        math.ceil(image.width() / 2), math.ceil(image.height() / 2),
+                        Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation
+                    )
+                columns, rows = tile_grid(image.width(), image.height(), self.tile_size)
+                for row in range(rows):
+                    for column in range(columns):
+                        tile = image.copy(column * self.tile_size, row * self.tile_size,
+                                          min(self.tile_size, image.width() - column * self.tile_size),
+                                          min(self.tile_size, image.height() - row * self.tile_size))
+                        # Low compression: tiles are read far more than written.
+                        tile.save(self.tile_path(info, level, column, row), TILE_FORMAT.upper(), 90)
+            with open(os.path.join(temp_dir, PYRAMID_INFO), "w", encoding="utf-8") as file:
+                json.dump({"width": width, "height": height, "levels": info.levels,
+                           "tile_size": self.tile_size}, file)
+            os.replace(temp_dir, directory)
+        except OSError:
+            # Lost a race with another build of the same image, or the disk
+            # is full; either way whatever is in place is used.
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return self.get(file_path)
+
+    def get_or_build(self, file_path):
+        info = self.get(file_path)
+        if info is None:
+            info = self.build(file_path)
+        return info
+
+    def prune(self, valid, before):
+        # Like ThumbnailCache.prune: removes pyramids whose key is not in
+        # `valid` and that were built before `before`.
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name not in valid and not name.startswith("."):  # skip builds in progress
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    if os.path.getmtime(path) < before:
+                        shutil.rmtree(path, ignore_errors=True)
+                except OSError:
+                    pass
+
+
+def tile_grid(width, height, tile_size):
+    return math.ceil(width / tile_size), math.ceil(height / tile_size)
+
+
+def levels_for(width, height, tile_size):
+    levels = 1
+    while width > tile_size or height > tile_size:
+        width, height = math.ceil(width / 2), math.ceil(height / 2)
+        levels += 1
+    return levels
+
+
+class PyramidBuildSignals(QObject):
+    finished = pyqtSignal(object)
+
+
+class PyramidBuildJob(QRunnable):
+    def __init__(self, pyramid, file_path):
+        super().__init__()
+        self.pyramid = pyramid
+        self.file_path = file_path
+        self.signals = PyramidBuildSignals()
+
+    def run(self):
+        try:
+            info = self.pyramid.get_or_build(self.file_path)
+        except OSError as e:
+            print(f"Error building tiles for {self.file_path}: {e}")
+            info = None
+        self.signals.finished.emit(info)
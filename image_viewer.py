@@ -0,0 +1,218 @@
+import math
+from collections import OrderedDict
+
+from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsPixmapItem
+from PyQt6.QtGui import QPixmap, QPainter, QImage
+from PyQt6.QtCore import Qt, QSize, QRectF, QTimer, pyqtSignal
+
+from image_loader import ImageLoader
+from image_pyramid import PyramidBuildJob, tile_grid
+
+PREVIEW_SIZE = QSize(1024, 1024)
+MAX_TILE_PIXMAPS = 192  # 256x256 ARGB tiles: about 48 MB
+MAX_ZOOM = 8.0
+ZOOM_STEP = 1.25
+
+
+def tile_key(tile):
+    return "{}/{}/{}".format(*tile)
+
+
+class TiledImageView(QGraphicsView):
+    # Zoom and pan over a tile pyramid. A scaled preview is shown at once;
+    # when the pyramid is ready only the tiles of the level matching the
+    # current zoom that intersect the viewport are decoded and put in the
+    # scene, and tile pixmaps are kept in a bounded LRU cache.
+    zoomChanged = pyqtSignal(float)
+
+    def __init__(self, pyramid, thread_pool, parent=None):
+        super().__init__(parent)
+        self.pyramid = pyramid
+        self.thread_pool = thread_pool
+        self.tile_loader = ImageLoader(thread_pool, self)
+        self.info = None
+        self.build_job = None
+        self.preview_item = None
+        self.tile_items = {}
+        self.pixmaps = OrderedDict()
+        self.fit_mode = True
+
+        self.setObjectName("imageView")  # background from the theme's palette (Base)
+        self.setScene(QGraphicsScene(self))
+        self.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
+        self.setResizeAnchor(QGraphicsView.ViewportAnchor.AnchorViewCenter)
+        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.SmartViewportUpdate)
+        self.setFrameShape(QGraphicsView.Shape.NoFrame)
+
+        # Scrolling, zooming and resizing all funnel into one tile update per
+        # event-loop turn.
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(0)
+        self.update_timer.timeout.connect(self.update_tiles)
+        # Not connected to start() directly: valueChanged(int) would become
+        # the timer interval.
+        self.horizontalScrollBar().valueChanged.connect(lambda: self.update_timer.start())
+        self.verticalScrollBar().valueChanged.connect(lambda: self.update_timer.start())
+
+    def open(self, file_path):
+        self.file_path = file_path
+        self.tile_loader.load_scaled("preview", file_path, PREVIEW_SIZE, self.on_preview_loaded, priority=2)
+        job = PyramidBuildJob(self.pyramid, file_path)
+        job.signals.finished.connect(self.on_pyramid_ready)
+        self.build_job = job
+        self.thread_pool.start(job)
+
+    def on_preview_loaded(self, image):
+        if image.isNull():
+            return
+        if self.preview_item is None:
+            # Until the real size is known, the preview's own size stands in.
+            size = QSize(self.info.width, self.info.height) if self.info else image.size()
+            self.preview_item = self.scene().addPixmap(QPixmap.fromImage(image))
+            self.preview_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+            self.preview_item.setZValue(-1)
+            self.set_scene_size(size)
+
+    def on_pyramid_ready(self, info):
+        self.build_job = None
+        if info is None:
+            return
+        self.info = info
+        self.set_scene_size(QSize(info.width, info.height))
+        self.update_timer.start()
+
+    def set_scene_size(self, size):
+        self.scene().setSceneRect(QRectF(0, 0, size.width(), size.height()))
+        if self.preview_item is not None:
+            pixmap = self.preview_item.pixmap()
+            self.preview_item.setScale(size.width() / max(1, pixmap.width()))
+        if self.fit_mode:
+            self.fit()
+
+    def zoom(self):
+        return self.transform().m11()
+
+    def fit(self):
+        self.fit_mode = True
+        self.fitInView(self.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+        self.on_zoom_changed()
+
+    def set_zoom(self, zoom):
+        minimum = min(1.0, self.fit_zoom()) / 2
+        zoom = max(minimum, min(MAX_ZOOM, zoom))
+        self.fit_mode = False
+        self.scale(zoom / self.zoom(), zoom / self.zoom())
+        self.on_zoom_changed()
+
+    def fit_zoom(self):
+        rect = self.sceneRect()
+        if rect.isEmpty():
+            return 1.0
+        viewport = self.viewport().size()
+        return min(viewport.width() / rect.width(), viewport.height() / rect.height())
+
+    def on_zoom_changed(self):
+        self.zoomChanged.emit(self.zoom())
+        self.update_timer.start()
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if steps:
+            self.set_zoom(self.zoom() * ZOOM_STEP ** steps)
+
+    def mouseDoubleClickEvent(self, event):
+        if self.fit_mode:
+            self.set_zoom(1.0)
+        else:
+            self.fit()
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if key in (Qt.Key.Key_Plus, Qt.Key.Key_Equal):
+            self.set_zoom(self.zoom() * ZOOM_STEP)
+        elif key == Qt.Key.Key_Minus:
+            self.set_zoom(self.zoom() / ZOOM_STEP)
+        elif key == Qt.Key.Key_0:
+            self.fit()
+        elif key == Qt.Key.Key_1:
+            self.set_zoom(1.0)
+        else:
+            super().keyPressEvent(event)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.fit_mode:
+            self.fit()
+        else:
+            self.update_timer.start()
+
+    def level_for_zoom(self):
+        # The coarsest level that still has at least one source pixel per
+        # screen pixel.
+        level = math.floor(math.log2(1 / self.zoom())) if self.zoom() < 1 else 0
+        return max(0, min(self.info.levels - 1, level))
+
+    def visible_tiles(self, level):
+        scale = 2 ** level
+        span = self.info.tile_size * scale
+        visible = self.mapToScene(self.viewport().rect()).boundingRect().intersected(self.sceneRect())
+        columns, rows = tile_grid(math.ceil(self.info.width / scale), math.ceil(self.info.height / scale),
+                                  self.info.tile_size)
+        first_column, last_column = int(visible.left() // span), min(columns - 1, int(visible.right() // span))
+        first_row, last_row = int(visible.top() // span), min(rows - 1, int(visible.bottom() // span))
+        return {
+            (level, column, row)
+            for row in range(max(0, first_row), last_row + 1)
+            for column in range(max(0, first_column), last_column + 1)
+        }
+
+    def update_tiles(self):
+        if self.info is None:
+            return
+        wanted = self.visible_tiles(self.level_for_zoom())
+        for tile in list(self.tile_items):
+            if tile not in wanted:
+                self.scene().removeItem(self.tile_items.pop(tile))
+        wanted_keys = {tile_key(tile) for tile in wanted}
+        for key in self.tile_loader.pending_keys():
+            if key != "preview" and key not in wanted_keys:
+                self.tile_loader.cancel(key)
+        for tile in wanted:
+            if tile in self.tile_items:
+                continue
+            pixmap = self.pixmaps.get(tile)
+            if pixmap is not None:
+                self.pixmaps.move_to_end(tile)
+                self.add_tile_item(tile, pixmap)
+            else:
+                path = self.pyramid.tile_path(self.info, *tile)
+                self.tile_loader.load(tile_key(tile), lambda path=path: QImage(path),
+                                      lambda image, tile=tile: self.on_tile_loaded(tile, image))
+
+    def on_tile_loaded(self, tile, image):
+        if image.isNull():
+            return
+        pixmap = QPixmap.fromImage(image)
+        self.pixmaps[tile] = pixmap
+        while len(self.pixmaps) > MAX_TILE_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+        if tile in self.visible_tiles(tile[0]) and tile[0] == self.level_for_zoom():
+            self.add_tile_item(tile, pixmap)
+
+    def add_tile_item(self, tile, pixmap):
+        level, column, row = tile
+        scale = 2 ** level
+        item = QGraphicsPixmapItem(pixmap)
+        item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        item.setScale(scale)
+        item.setPos(column * self.info.tile_size * scale, row * self.info.tile_size * scale)
+        # Finer levels above coarser ones and above the preview.
+        item.setZValue(self.info.levels - level)
+        self.scene().addItem(item)
+        self.tile_items[tile] = item
+
+    def close_view(self):
+        self.tile_loader.cancel_all()
@@ -0,0 +1,122 @@
+import threading
+from concurrent.futures import Future
+
+from jobs import JobCancelled, current_job
+from result_cache import request_key
+
+# Coalesces identical generations that are running at the same time: the
+# first caller does the work and everyone else who asks for the same request
+# while it is in flight waits on the same future. Covers the same model in
+# both comparison slots, duplicate batch lines and a re-click before the
+# first call returned. Finished flights are forgotten immediately; after
+# that the result cache answers repeats.
+#
+# The futures are concurrent.futures ones so worker threads and event-loop
+# tasks can share a flight.
+
+
+class SharedRequestCancelled(Exception):
+    # Raised in waiters when the caller doing the work was cancelled; the
+    # waiter itself was not, so it must not see a CancelledError or
+    # JobCancelled.
+    pass
+
+
+class Flight:
+    def __init__(self):
+        self.future = Future()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def add_listener(self, progress):
+        if progress is not None:
+            with self.lock:
+                self.listeners.append(progress)
+
+    def progress(self, event):
+        # The owner's progress events, fanned out so every waiter's pane
+        # follows the shared request too.
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(event)
+
+
+class InFlightRequests:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, request, progress=None):
+        # Returns (flight, owner). The owner must run the work and call
+        # finish(); everyone else waits on flight.future.
+        key = request_key(request)
+        with self.lock:
+            flight = self.flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self.flights[key] = Flight()
+                self.started += 1
+            else:
+                self.coalesced += 1
+        flight.add_listener(progress)
+        return flight, owner
+
+    def finish(self, request, flight, result=None, error=None):
+        with self.lock:
+            if self.flights.get(request_key(request)) is flight:
+                del self.flights[request_key(request)]
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def run(self, request, work, progress=None):
+        # Blocking: returns (result, shared). `work(progress)` runs only in
+        # the first caller; its exception reaches every waiter.
+        flight, owner = self.join(request, progress)
+        if not owner:
+            # A waiter's own job can give up on the flight; the owner carries on.
+            return current_job().result(flight.future), True
+        try:
+            result = work(flight.progress)
+        except BaseException as e:
+            self.finish(request, flight, error=shared_error(e))
+            raise
+        self.finish(request, flight, result)
+        return result, False
+
+    async def run_async(self, request, work, progress=None):
+        # asyncio counterpart; `work(progress)` returns a coroutine.
+        import asyncio
+
+        flight, owner = self.join(request, progress)
+        if not owner:
+            # Shielded: one waiter giving up must not cancel the shared future.
+            return await asyncio.shield(asyncio.wrap_future(flight.future)), True
+        try:
+            result = await work(flight.progress)
+        except BaseException as e:
+            self.finish(request, flight, error=shared_error(e))
+            raise
+        self.finish(request, flight, result)
+        return result, False
+
+    def stats(self):
+        with self.lock:
+            return {"started": self.started, "coalesced": self.coalesced, "in_flight": len(self.flights)}
+
+
+def shared_error(error):
+    if isinstance(error, Exception) and not isinstance(error, JobCancelled):
+        return error
+    return SharedRequestCancelled(f"The shared request was interrupted: {error!r}")
+
+
+_in_flight = InFlightRequests()
+
+
+def get_in_flight():
+    return _in_flight
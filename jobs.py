@@ -0,0 +1,267 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+# Cancellation and deadlines for a generation. A Job is made current for the
+# duration of one (a context variable, like the telemetry Trace), and the
+# scheduler, transport, providers and downloads check it at every point where
+# they wait: between queue polls, before and during HTTP requests, between
+# download chunks. cancel() may be called from any thread; the waiting code
+# raises JobCancelled, cleans up (a fal request is cancelled in its queue)
+# and gives its scheduler slot back.
+#
+# Deadlines are passive: whoever next checks the job after one has passed
+# cancels it with a JobTimeout, and blocking socket reads are bounded by the
+# time left.
+
+JOB_TIMEOUT = float(os.getenv("IMAGE_COMPARE_JOB_TIMEOUT", "900"))
+# Seconds a job may spend in each stage (the trace's stage names). Stages not
+# listed are bounded only by the job's deadline.
+STAGE_TIMEOUTS = {
+    "submit": 30,
+    "queue_wait": 600,
+    "inference": 300,
+    "result": 30,
+    "download": 120,
+}
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobTimeout(JobCancelled):
+    pass
+
+
+class JobSuspended(JobCancelled):
+    # Stopped because the process is going away (the GUI was closed): the
+    # remote request is left running for a later run to collect (see
+    # journal.py) instead of being cancelled.
+    pass
+
+
+class CancelState:
+    # Shared by a job and its branches.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.error = None
+        self.callbacks = []
+
+
+class Job:
+    def __init__(self, timeout=JOB_TIMEOUT, stage_timeouts=None):
+        self.timeout = timeout
+        self.stage_timeouts = STAGE_TIMEOUTS if stage_timeouts is None else stage_timeouts
+        self.state = CancelState()
+        self.deadline = None
+        self.stage = None
+        self.stage_deadline = None
+
+    def start(self):
+        if self.deadline is None and self.timeout:
+            self.deadline = time.monotonic() + self.timeout
+
+    def branch(self):
+        # For work fanned out from this job: cancelled with it and bound by
+        # its deadline, but with stages of its own.
+        job = Job(self.timeout, self.stage_timeouts)
+        job.state = self.state
+        job.deadline = self.deadline
+        return job
+
+    def wrap(self, function):
+        # Runs `function` under a branch of this job. Pool threads do not
+        # inherit context variables, so fanned-out work is submitted wrapped.
+        branch = self.branch()
+
+        def run(*args, **kwargs):
+            with use_job(branch):
+                return function(*args, **kwargs)
+        return run
+
+    @property
+    def cancelled(self):
+        return self.state.event.is_set()
+
+    def cancel(self, error=None):
+        state = self.state
+        with state.lock:
+            if state.event.is_set():
+                return
+            state.error = error or JobCancelled("Cancelled")
+            state.event.set()
+            callbacks = list(state.callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in cancel callback: {e}")
+
+    @contextlib.contextmanager
+    def on_cancel(self, callback):
+        # Calls `callback` (from the cancelling thread) if the job is
+        # cancelled while the block runs. Keep it quick: wake a waiter, close
+        # a response.
+        state = self.state
+        with state.lock:
+            state.callbacks.append(callback)
+            cancelled = state.event.is_set()
+        if cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            with state.lock:
+                state.callbacks.remove(callback)
+
+    def enter(self, stage):
+        self.stage = stage
+        limit = self.stage_timeouts.get(stage)
+        self.stage_deadline = None if limit is None else time.monotonic() + limit
+
+    def remaining(self):
+        # Seconds until the job or its current stage runs out; None if
+        # neither has a limit.
+        deadlines = [deadline for deadline in (self.deadline, self.stage_deadline) if deadline is not None]
+        return min(deadlines) - time.monotonic() if deadlines else None
+
+    def check(self):
+        if not self.state.event.is_set():
+            remaining = self.remaining()
+            if remaining is None or remaining > 0:
+                return
+            if self.stage_deadline is not None and self.stage_deadline <= time.monotonic():
+                message = f"Timed out in {self.stage} after {self.stage_timeouts[self.stage]:g}s"
+            else:
+                message = f"Timed out after {self.timeout:g}s"
+            self.cancel(JobTimeout(message))
+        raise self.state.error
+
+    def timeout_for(self, seconds):
+        # `seconds` shortened to what is left of the job; for socket timeouts.
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return remaining if seconds is None else min(seconds, remaining)
+
+    def sleep(self, seconds):
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self.state.event.wait(max(0.0, remaining))
+        else:
+            self.state.event.wait(seconds)
+        self.check()
+
+    def result(self, future):
+        # Waits for a concurrent.futures.Future, giving up on cancel or
+        # timeout; the future itself is left to finish.
+        done = threading.Event()
+        future.add_done_callback(lambda _: done.set())
+        with self.on_cancel(done.set):
+            while not done.wait(self.timeout_for(None)):
+                self.check()
+        self.check()
+        return future.result()
+
+    def call(self, function, discard=None):
+        # Runs a blocking call (an HTTP request waiting for headers) on a
+        # helper thread so that cancelling returns control at once. A result
+        # that arrives after the job gave up is passed to `discard`.
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(function())
+            except BaseException as e:
+                future.set_exception(e)
+
+        # A thread per call rather than a pool: an abandoned call may hang
+        # until its socket times out and must not hold up anyone else's.
+        threading.Thread(target=run, name="job-call", daemon=True).start()
+        try:
+            return self.result(future)
+        except JobCancelled:
+            if discard is not None:
+                future.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+            raise
+
+
+class _NullJob(Job):
+    # Never cancelled and without limits, so code outside a job behaves as
+    # before: blocking calls run inline.
+    def __init__(self):
+        super().__init__(timeout=None, stage_timeouts={})
+
+    def cancel(self, error=None):
+        pass
+
+    def enter(self, stage):
+        pass
+
+    def call(self, function, discard=None):
+        return function()
+
+
+class JobGroup:
+    # Jobs that are cancelled together (a batch run on Ctrl-C). Jobs created
+    # after cancel() start out cancelled.
+    def __init__(self, timeout=JOB_TIMEOUT, stage_timeouts=None):
+        self.timeout = timeout
+        self.stage_timeouts = stage_timeouts
+        self.jobs = []
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def new(self):
+        job = Job(self.timeout, self.stage_timeouts)
+        with self.lock:
+            self.jobs.append(job)
+            cancelled = self.cancelled
+        if cancelled:
+            job.cancel()
+        return job
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+
+
+_NULL_JOB = _NullJob()
+
+
+def current_job():
+    job = _current_job.get()
+    return job if job is not None else _NULL_JOB
+
+
+@contextlib.contextmanager
+def use_job(job):
+    job.start()
+    token = _current_job.set(job)
+    try:
+        yield job
+    finally:
+        _current_job.reset(token)
+
+
+@contextlib.contextmanager
+def detached():
+    # For cleanup that must run after the job was cancelled (cancelling a
+    # fal request): no job is current inside the block.
+    token = _current_job.set(_NULL_JOB)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
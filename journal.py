@@ -0,0 +1,339 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from jobs import JobCancelled, JobSuspended
+from result_cache import request_key
+
+# A durable record of the fal requests the app has paid for. Each request is
+# written down before it is submitted, gets its queue handle (request id and
+# status, response and cancel URLs) once fal accepts it, and logs every state
+# it moves through. When the process crashes or is closed while a request is
+# still in fal's queue, its row outlives it: the next generation with the
+# same arguments adopts the request and polls it instead of paying for a new
+# one, and pipeline.resume_interrupted() collects the rest. SQLite in WAL
+# mode, so the GUI and a batch run share one journal.
+#
+# A row belongs to the process working on it. One that is released
+# (suspended) or whose owner has exited or stopped updating it is an orphan
+# and may be claimed by anyone.
+
+JOURNAL_FILE = ".job_journal.sqlite"
+# Older requests are not resumed: fal does not keep results forever.
+RESUME_MAX_AGE = float(os.getenv("IMAGE_COMPARE_RESUME_MAX_AGE", 24 * 3600))
+JOURNAL_RETENTION = 30 * 24 * 3600
+# An owner refreshes its rows at least this often while polling, and one
+# silent for STALE_AFTER is presumed dead (downloads do not refresh).
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 300
+
+SUBMITTING = "submitting"
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+SUSPENDED = "suspended"
+RESUMED = "resumed"
+# States in which fal still holds the request and its result.
+RESUMABLE_STATES = (QUEUED, RUNNING, SUSPENDED, RESUMED)
+# fal queue statuses as journal states; a completed request stays running
+# until its images are downloaded.
+FAL_STATES = {"IN_QUEUE": QUEUED, "IN_PROGRESS": RUNNING, "COMPLETED": RUNNING}
+
+FIELDS = [
+    "id", "key", "model", "prompt", "aspect_ratio", "seed", "variants", "model_path", "arguments",
+    "request_id", "status_url", "response_url", "cancel_url", "state", "error", "owner",
+    "created_at", "updated_at",
+]
+JournalRecord = namedtuple("JournalRecord", FIELDS)
+HANDLE_FIELDS = ("request_id", "status_url", "response_url", "cancel_url")
+
+
+def process_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_exited(owner):
+    # True when `owner` was a process on this machine that is gone. Elsewhere
+    # (another host, no POSIX signals) only the heartbeat tells.
+    host, _, pid = owner.rpartition(":")
+    if os.name != "posix" or host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def outcome_state(error):
+    # The journal state for a request whose collection raised `error`; task
+    # cancellation and Ctrl-C count as cancelled.
+    if isinstance(error, JobSuspended):
+        return SUSPENDED
+    if isinstance(error, JobCancelled) or not isinstance(error, Exception):
+        return CANCELLED
+    return FAILED
+
+
+def read_record(row):
+    record = JournalRecord(*row)
+    return record._replace(variants=json.loads(record.variants), arguments=json.loads(record.arguments))
+
+
+class JobJournal:
+    def __init__(self, path, resume_max_age=RESUME_MAX_AGE):
+        self.path = path
+        self.resume_max_age = resume_max_age
+        self.owner = process_owner()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Every commit reaches the disk: a row lost here is a request paid
+        # for twice.
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                aspect_ratio TEXT NOT NULL,
+                seed INTEGER,
+                variants TEXT NOT NULL,
+                model_path TEXT NOT NULL,
+                arguments TEXT NOT NULL,
+                request_id TEXT,
+                status_url TEXT,
+                response_url TEXT,
+                cancel_url TEXT,
+                state TEXT NOT NULL,
+                error TEXT,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS requests_state ON requests (state, created_at);
+            CREATE INDEX IF NOT EXISTS requests_key ON requests (key, state);
+            CREATE TABLE IF NOT EXISTS transitions (
+                request INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                detail TEXT,
+                at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS transitions_request ON transitions (request, at);
+        """)
+        self.prune()
+
+    def prune(self):
+        cutoff = time.time() - JOURNAL_RETENTION
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM transitions WHERE request IN (SELECT id FROM requests WHERE updated_at < ?)", (cutoff,)
+            )
+            self.connection.execute("DELETE FROM requests WHERE updated_at < ?", (cutoff,))
+
+    def generation(self, prompt, model, aspect_ratio, seed, variants):
+        return JournalGeneration(self, prompt, model, aspect_ratio, seed, list(variants))
+
+    def begin(self, generation, model_path, arguments):
+        # Written before the request is submitted, so its parameters are on
+        # disk whatever happens next.
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO requests (key, model, prompt, aspect_ratio, seed, variants, model_path, arguments, "
+                "state, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (fal_request_key(model_path, arguments), generation.model, generation.prompt,
+                 generation.aspect_ratio, generation.seed, json.dumps(generation.variants), model_path,
+                 json.dumps(arguments, sort_keys=True), SUBMITTING, self.owner, now, now)
+            )
+            self.connection.execute("INSERT INTO transitions (request, state, at) VALUES (?, ?, ?)",
+                                    (cursor.lastrowid, SUBMITTING, now))
+        return JournalEntry(self, self.get(cursor.lastrowid))
+
+    def get(self, entry_id):
+        with self.lock:
+            row = self.connection.execute(f"SELECT {', '.join(FIELDS)} FROM requests WHERE id = ?",
+                                          (entry_id,)).fetchone()
+        return read_record(row) if row else None
+
+    def update(self, entry_id, state=None, error=None, release=False, **handle):
+        # Records a transition when `state` is given; otherwise just proves
+        # the owner is alive. `release` gives the row up to other processes.
+        now = time.time()
+        assignments, params = ["updated_at = ?"], [now]
+        if state is not None:
+            assignments += ["state = ?", "error = ?"]
+            params += [state, error]
+        if release:
+            assignments.append("owner = NULL")
+        for name in HANDLE_FIELDS:
+            if name in handle:
+                assignments.append(f"{name} = ?")
+                params.append(handle[name])
+        with self.lock, self.connection:
+            self.connection.execute(f"UPDATE requests SET {', '.join(assignments)} WHERE id = ?",
+                                    params + [entry_id])
+            if state is not None:
+                self.connection.execute("INSERT INTO transitions (request, state, detail, at) VALUES (?, ?, ?, ?)",
+                                        (entry_id, state, error, now))
+
+    def orphaned(self, record, now):
+        if record.owner is None:
+            return True
+        if record.owner == self.owner:
+            return False
+        return now - record.updated_at > STALE_AFTER or owner_exited(record.owner)
+
+    def orphans(self, key=None):
+        # Resumable requests nobody is working on, oldest first.
+        now = time.time()
+        query = (f"SELECT {', '.join(FIELDS)} FROM requests WHERE state IN ({', '.join('?' * len(RESUMABLE_STATES))}) "
+                 "AND request_id IS NOT NULL AND created_at > ?")
+        params = list(RESUMABLE_STATES) + [now - self.resume_max_age]
+        if key is not None:
+            query += " AND key = ?"
+            params.append(key)
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY created_at", params).fetchall()
+        return [record for record in map(read_record, rows) if self.orphaned(record, now)]
+
+    def claim(self, record, variants=None):
+        # Takes an orphan over; None if another process or thread got there
+        # first. `variants` re-targets the request at a new generation's
+        # variants.
+        now = time.time()
+        record = record if variants is None else record._replace(variants=list(variants))
+        with self.lock, self.connection:
+            claimed = self.connection.execute(
+                "UPDATE requests SET owner = ?, variants = ?, state = ?, updated_at = ? "
+                "WHERE id = ? AND owner IS ? AND updated_at = ?",
+                (self.owner, json.dumps(record.variants), RESUMED, now, record.id, record.owner, record.updated_at)
+            ).rowcount
+            if claimed:
+                self.connection.execute("INSERT INTO transitions (request, state, detail, at) VALUES (?, ?, ?, ?)",
+                                        (record.id, RESUMED, f"was {record.state}", now))
+        if not claimed:
+            return None
+        return JournalEntry(self, record._replace(owner=self.owner, state=RESUMED, updated_at=now))
+
+    def adopt(self, model_path, arguments, variants):
+        for record in self.orphans(fal_request_key(model_path, arguments)):
+            entry = self.claim(record, variants)
+            if entry is not None:
+                return entry
+        return None
+
+    def history(self, entry_id):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT state, detail, at FROM transitions WHERE request = ? ORDER BY at", (entry_id,)
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def fal_request_key(model_path, arguments):
+    return request_key({"model_path": model_path, **arguments})
+
+
+class JournalGeneration:
+    # The part of a generation one request covers: its parameters and the
+    # variants whose images the request produces, in order.
+    def __init__(self, journal, prompt, model, aspect_ratio, seed, variants):
+        self.journal = journal
+        self.prompt = prompt
+        self.model = model
+        self.aspect_ratio = aspect_ratio
+        self.seed = seed
+        self.variants = variants
+
+    def batch(self, offset, size):
+        return JournalGeneration(self.journal, self.prompt, self.model, self.aspect_ratio, self.seed,
+                                 self.variants[offset:offset + size])
+
+    def adopt(self, model_path, arguments):
+        # An orphaned request with the same arguments, or None.
+        return self.journal.adopt(model_path, arguments, self.variants)
+
+    def begin(self, model_path, arguments):
+        return self.journal.begin(self, model_path, arguments)
+
+
+class JournalEntry:
+    # One journaled request, owned by this process until finish().
+    def __init__(self, journal, record):
+        self.journal = journal
+        self.record = record
+        self.state = record.state
+        self.touched = time.monotonic()
+
+    @property
+    def request(self):
+        # The queue handle, in the shape submit_fal_request returns.
+        return {name: getattr(self.record, name) for name in HANDLE_FIELDS}
+
+    def submitted(self, request):
+        handle = {name: request.get(name) for name in HANDLE_FIELDS}
+        self.record = self.record._replace(**handle)
+        self.set_state(QUEUED, **handle)
+
+    def status(self, fal_status):
+        # Called on every poll with fal's status: writes only transitions and
+        # heartbeats.
+        state = FAL_STATES.get(fal_status, QUEUED)
+        if state != self.state:
+            self.set_state(state)
+        elif time.monotonic() - self.touched > HEARTBEAT_INTERVAL:
+            self.touched = time.monotonic()
+            self.journal.update(self.record.id)
+
+    def complete(self):
+        self.finish(COMPLETED)
+
+    def fail(self, error):
+        # Collection stopped with `error`; a suspended request stays
+        # resumable.
+        self.finish(outcome_state(error), error)
+
+    def fetch_failed(self, error):
+        # The request completed but its result or images did not arrive. fal
+        # still holds them, so a plain failure leaves the row resumable.
+        state = outcome_state(error)
+        self.finish(RUNNING if state == FAILED else state, error)
+
+    def finish(self, state, error=None):
+        self.set_state(state, None if error is None else str(error), release=True)
+
+    def set_state(self, state, error=None, release=False, **handle):
+        self.state = state
+        self.touched = time.monotonic()
+        self.journal.update(self.record.id, state, error, release, **handle)
+
+
+class _NullEntry(JournalEntry):
+    # Stands in when a request is not journaled.
+    def __init__(self):
+        self.state = None
+
+    def submitted(self, request):
+        pass
+
+    def status(self, fal_status):
+        pass
+
+    def finish(self, state, error=None):
+        pass
+
+
+NULL_ENTRY = _NullEntry()
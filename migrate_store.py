@@ -0,0 +1,107 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from image_index import record_for_file, scan_directory
+from pipeline import get_image_index, get_result_cache, relocate_image
+from similarity_index import get_similarity_index
+from storage import IMAGE_DIR, TRANSCODE_QUALITY, file_digest, get_image_store, transcode_file
+
+# Moves images from the flat generated_images/ directory into the sharded,
+# content-addressed image store (storage.ImageStore), carrying their index
+# metadata, result-cache entries and similarity hashes along. Identical
+# files collapse into one. Safe to interrupt and re-run, and to run while
+# the GUI is open: each image is recorded at its new address before it is
+# moved, so a crash leaves at worst a stale row for the old path, which the
+# gallery drops on its next scan.
+#
+#   python image_compare.py migrate --dry-run
+#   python image_compare.py migrate --transcode webp
+
+
+def migrate_file(store, index, cache, path):
+    # Returns (new path, stored); stored is False for a duplicate.
+    sha256 = file_digest(path)
+    target = store.address(path, sha256)
+    if index.get(target) is None:
+        record = index.get(path) or record_for_file(path, os.stat(path))
+        index.record(record._replace(path=target, sha256=sha256))
+    new_path, stored = store.add_file(path, sha256)
+    index.remove(path)
+    cache.relocate(path, new_path)
+    get_similarity_index().relocate(path, new_path)
+    return new_path, stored
+
+
+def migrate(directory=IMAGE_DIR, transcode=None, workers=4, dry_run=False):
+    store = get_image_store()
+    index = get_image_index()
+    cache = get_result_cache()
+    paths = sorted(scan_directory(directory))
+    counts = {"images": len(paths), "moved": 0, "duplicates": 0, "transcoded": 0, "bytes_saved": 0}
+    if dry_run:
+        digests = set()
+        for path in paths:
+            digest = file_digest(path)
+            if digest in digests or store.find(digest):
+                counts["duplicates"] += 1
+                counts["bytes_saved"] += os.path.getsize(path)
+            digests.add(digest)
+        return counts
+
+    migrated = []
+    for number, path in enumerate(paths, 1):
+        try:
+            size = os.path.getsize(path)
+            new_path, stored = migrate_file(store, index, cache, path)
+        except OSError as e:
+            print(f"Error migrating {path}: {e}")
+            continue
+        if stored:
+            counts["moved"] += 1
+            migrated.append(new_path)
+        else:
+            counts["duplicates"] += 1
+            counts["bytes_saved"] += size
+        if number % 1000 == 0:
+            print(f"{number}/{len(paths)} migrated")
+
+    if transcode:
+        def run(path):
+            size = os.path.getsize(path)
+            new_path = transcode_file(store, path, transcode)
+            if new_path is None:
+                return 0
+            relocate_image(path, new_path)
+            return size - os.path.getsize(new_path)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for saved in executor.map(run, migrated):
+                if saved:
+                    counts["transcoded"] += 1
+                    counts["bytes_saved"] += saved
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move flat generated images into the content-addressed store.")
+    parser.add_argument("--directory", default=IMAGE_DIR, help=f"Flat image directory (default {IMAGE_DIR})")
+    parser.add_argument("--transcode", choices=sorted(TRANSCODE_QUALITY),
+                        help="Re-encode migrated images losslessly, keeping the result only if smaller")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel transcodes (default 4)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count images and duplicates")
+    args = parser.parse_args(argv)
+
+    counts = migrate(args.directory, args.transcode, args.workers, args.dry_run)
+    if args.dry_run:
+        print(f"{counts['images']} image(s) to migrate, {counts['duplicates']} duplicate(s) "
+              f"({counts['bytes_saved'] / 1e6:.1f} MB)")
+    else:
+        print(f"{counts['moved']} image(s) moved, {counts['duplicates']} duplicate(s) removed, "
+              f"{counts['transcoded']} transcoded; {counts['bytes_saved'] / 1e6:.1f} MB saved")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
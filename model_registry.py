@@ -0,0 +1,79 @@
+from collections import OrderedDict, namedtuple
+
+# Every model the app knows about, in display order. The GUI pickers, the
+# batch CLI, cache keys and provider dispatch all read from here, so adding
+# a model is one register_model() call.
+
+ModelSpec = namedtuple("ModelSpec", [
+    "name",             # what users pick and what goes in file names
+    "provider",         # "stability" or "fal"
+    "group",            # heading in the model pickers
+    "endpoint",         # fal application path, or the Stability `model` form field
+    "aspect_ratios",    # ratios the provider accepts for this model
+    "max_batch_size",   # images one request can return
+    "typical_latency",  # seconds, rough; used for ordering and scheduling hints
+])
+
+ASPECT_RATIOS = ["1:1", "16:9", "4:3"]
+STABILITY_ASPECT_RATIOS = ("16:9", "1:1", "21:9", "2:3", "3:2", "4:5", "5:4", "9:16", "9:21")
+FAL_ASPECT_RATIOS = ("1:1", "16:9", "4:3", "3:4", "9:16")
+
+_registry = OrderedDict()
+
+
+def register_model(spec):
+    _registry[spec.name] = spec
+    return spec
+
+
+def get_model(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError(f"Unknown model: {name}") from None
+
+
+def model_names(provider=None):
+    return [spec.name for spec in _registry.values() if provider is None or spec.provider == provider]
+
+
+def models_by_group():
+    groups = OrderedDict()
+    for spec in _registry.values():
+        groups.setdefault(spec.group, []).append(spec.name)
+    return groups
+
+
+def provider_for(name):
+    spec = _registry.get(name)
+    return spec.provider if spec else None
+
+
+def supports_aspect_ratio(name, aspect_ratio):
+    return aspect_ratio in get_model(name).aspect_ratios
+
+
+def plan_batches(name, variants, seeded=False):
+    # Request sizes for `variants` images: as few requests as the model's
+    # native batch size allows, fanned out for the rest. A native batch takes
+    # a single seed, so seeded variants go out one per request, each with its
+    # own seed.
+    batch_size = 1 if seeded else max(1, get_model(name).max_batch_size)
+    return [min(batch_size, variants - start) for start in range(0, variants, batch_size)]
+
+
+for _name, _latency in [
+    ("sd3.5-large", 8.0),
+    ("sd3.5-large-turbo", 3.0),
+    ("sd3-large", 8.0),
+    ("sd3-large-turbo", 3.0),
+    ("sd3-medium", 5.0),
+]:
+    register_model(ModelSpec(_name, "stability", "Stability AI", _name, STABILITY_ASPECT_RATIOS, 1, _latency))
+
+for _name, _path, _latency in [
+    ("flux-1.1-pro", "fal-ai/flux-pro/v1.1", 6.0),
+    ("flux-dev", "fal-ai/flux/dev", 5.0),
+    ("flux-schnell", "fal-ai/flux/schnell", 1.5),
+]:
+    register_model(ModelSpec(_name, "fal", "Flux Models", _path, FAL_ASPECT_RATIOS, 4, _latency))
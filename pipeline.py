@@ -0,0 +1,316 @@
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from image_index import ImageIndex, ImageRecord, INDEX_FILE, read_image_size
+from inflight import get_in_flight
+from jobs import JobCancelled, JobSuspended, JobTimeout, current_job, use_job
+from journal import JOURNAL_FILE, JobJournal
+from model_registry import get_model
+from providers import STABILITY_API_URL, collect_fal_request, flux_arguments, generate_images, stability_form_data
+from result_cache import ResultCache, RESULT_CACHE_FILE
+from scheduler import PRIORITY_BATCH, get_scheduler
+from similarity_index import get_similarity_index
+from storage import IMAGE_DIR, TRANSCODE_FORMAT, Transcoder, ensure_image_dir, get_image_store
+from telemetry import Trace, record_trace, use_trace
+
+# Interrupted requests collected at once by resume_interrupted().
+RESUME_WORKERS = 4
+
+
+_result_cache = None
+_image_index = None
+_job_journal = None
+_transcoder = None
+_storage_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _result_cache
+    with _storage_lock:
+        if _result_cache is None:
+            ensure_image_dir()
+            _result_cache = ResultCache(os.path.join(IMAGE_DIR, RESULT_CACHE_FILE))
+        return _result_cache
+
+
+def get_image_index():
+    global _image_index
+    with _storage_lock:
+        if _image_index is None:
+            ensure_image_dir()
+            _image_index = ImageIndex(os.path.join(IMAGE_DIR, INDEX_FILE))
+        return _image_index
+
+
+def get_job_journal():
+    global _job_journal
+    with _storage_lock:
+        if _job_journal is None:
+            ensure_image_dir()
+            _job_journal = JobJournal(os.path.join(IMAGE_DIR, JOURNAL_FILE))
+        return _job_journal
+
+
+def relocate_image(old_path, new_path):
+    # Points the index and the result cache at an image's new location.
+    moved = get_image_index().relocate(old_path, new_path)
+    get_result_cache().relocate(old_path, new_path)
+    get_similarity_index().relocate(old_path, new_path)
+    return moved
+
+
+def get_transcoder():
+    # None unless IMAGE_STORE_TRANSCODE names a format.
+    global _transcoder
+    with _storage_lock:
+        if _transcoder is None and TRANSCODE_FORMAT:
+            _transcoder = Transcoder(get_image_store(), relocate_image)
+        return _transcoder
+
+
+def describe_request(prompt, model, aspect_ratio, seed=None, variant=0):
+    # Everything that determines the provider's output; used as the result
+    # cache key. Variant 0 keeps the single-image key so earlier cache
+    # entries still match.
+    spec = get_model(model)
+    if spec.provider == "fal":
+        request = {"provider": "fal", "model_path": spec.endpoint, **flux_arguments(prompt, aspect_ratio, seed)}
+    else:
+        request = {"provider": "stability", "url": STABILITY_API_URL,
+                   **stability_form_data(prompt, model, aspect_ratio, seed=seed)}
+    if variant:
+        request["variant"] = variant
+    return request
+
+
+def variant_seed(seed, variant):
+    return None if seed is None else seed + variant
+
+
+def variant_seeds(seed, variants):
+    # The seed each variant is sent with, or None for a seedless request.
+    return None if seed is None else [variant_seed(seed, variant) for variant in variants]
+
+
+def begin_request(request, prompt, model, trace):
+    trace = trace if trace is not None else Trace()
+    trace.model = model
+    trace.provider = request["provider"]
+    trace.prompt = prompt
+    trace.status = "failed"
+    return trace
+
+
+@contextlib.contextmanager
+def job_scope(trace, job):
+    # Makes the trace and job current for one generation; a cancelled or
+    # timed-out job is recorded as such on the trace.
+    with use_trace(trace), use_job(job if job is not None else current_job()):
+        try:
+            yield
+        except JobCancelled as e:
+            if isinstance(e, JobTimeout):
+                trace.status = "timeout"
+            else:
+                trace.status = "suspended" if isinstance(e, JobSuspended) else "cancelled"
+            raise
+
+
+def lookup_cached(requests, trace, force=False):
+    # One (file_name, True) per cached variant, None where it must be
+    # generated.
+    if force:
+        return [None] * len(requests)
+    with trace.span("cache_lookup"):
+        cached = [get_result_cache().get(request) for request in requests]
+    for file_name in cached:
+        if file_name:
+            trace.status = "cached"
+            trace.file = file_name
+    return [(file_name, True) if file_name else None for file_name in cached]
+
+
+def store_result(request, result, prompt, model, aspect_ratio, seed, latency, trace):
+    width, height = read_image_size(result.path)
+    get_image_index().record(ImageRecord(
+        path=result.path,
+        prompt=prompt,
+        model=model,
+        provider=request["provider"],
+        aspect_ratio=aspect_ratio,
+        seed=seed,
+        latency=latency,
+        byte_size=result.size,
+        width=width,
+        height=height,
+        sha256=result.sha256,
+    ))
+    get_result_cache().put(request, result.path)
+    if get_transcoder() is not None:
+        get_transcoder().submit(result.path)
+    trace.status = "ok"
+    trace.file = result.path
+    return result.path
+
+
+def store_results(requests, outcomes, missing, results, prompt, model, aspect_ratio, seed, latency, trace):
+    # Each variant was sent with its own seed (see generate_images).
+    for variant, result in zip(missing, results):
+        if result:
+            file_name = store_result(requests[variant], result, prompt, model, aspect_ratio,
+                                     variant_seed(seed, variant), latency, trace)
+            outcomes[variant] = (file_name, False)
+        else:
+            outcomes[variant] = (None, False)
+    return [outcomes[variant] for variant in missing]
+
+
+def merge_shared(outcomes, missing, generated, shared, trace):
+    # `generated` holds the missing variants' outcomes. A caller that joined
+    # someone else's in-flight request did not pay for it, so its outcomes
+    # are reported as cached.
+    for variant, (file_name, _) in zip(missing, generated):
+        outcomes[variant] = (file_name, shared)
+        if shared and file_name:
+            trace.status = "coalesced"
+            trace.file = file_name
+    return outcomes
+
+
+def generate_variants(prompt, model, aspect_ratio, variants=1, progress=None, seed=None, force=False, trace=None,
+                      priority=PRIORITY_BATCH, job=None):
+    # Returns one (file_name, cached) per variant; file_name is None where
+    # that variant failed. A seedless request is still cached: asking for the
+    # same prompt again is treated as wanting the same images unless `force`
+    # is set. Only the variants missing from the cache are generated. Stage
+    # timings are recorded on `trace` when given; the caller decides when the
+    # trace is complete and calls record_trace. `priority` is the scheduler
+    # lane the provider requests queue in. An identical request already in
+    # flight is joined instead of sent again (see inflight.py), and fal
+    # requests are journaled so an interrupted one is resumed rather than
+    # paid for twice (see journal.py). `job` (jobs.Job) lets the caller
+    # cancel the generation and bounds its time; either raises JobCancelled.
+    requests = [describe_request(prompt, model, aspect_ratio, seed, variant) for variant in range(variants)]
+    trace = begin_request(requests[0], prompt, model, trace)
+
+    with job_scope(trace, job):
+        outcomes = lookup_cached(requests, trace, force)
+        missing = [variant for variant, outcome in enumerate(outcomes) if outcome is None]
+        if not missing:
+            return outcomes
+
+        def generate(progress):
+            started = time.monotonic()
+            results = generate_images(prompt, model, aspect_ratio, len(missing), progress,
+                                      variant_seeds(seed, missing), priority,
+                                      get_job_journal().generation(prompt, model, aspect_ratio, seed, missing))
+            return store_results(requests, outcomes, missing, results, prompt, model, aspect_ratio, seed,
+                                 time.monotonic() - started, trace)
+
+        generated, shared = get_in_flight().run([requests[variant] for variant in missing], generate, progress)
+        return merge_shared(outcomes, missing, generated, shared, trace)
+
+
+def generate_image_with_model(prompt, model, aspect_ratio, progress=None, seed=None, force=False, trace=None):
+    # Returns (file_name, cached) for a single image.
+    return generate_variants(prompt, model, aspect_ratio, 1, progress, seed, force, trace)[0]
+
+
+async def generate_variants_async(prompt, model, aspect_ratio, providers, variants=1, progress=None, seed=None,
+                                  force=False, trace=None, priority=PRIORITY_BATCH, job=None):
+    # asyncio counterpart of generate_variants. `providers` comes from
+    # async_providers.open_providers(). The cache and index are local SQLite
+    # calls and run inline; only provider I/O is awaited.
+    from async_providers import generate_images as generate_images_async
+
+    requests = [describe_request(prompt, model, aspect_ratio, seed, variant) for variant in range(variants)]
+    trace = begin_request(requests[0], prompt, model, trace)
+
+    with job_scope(trace, job):
+        outcomes = lookup_cached(requests, trace, force)
+        missing = [variant for variant, outcome in enumerate(outcomes) if outcome is None]
+        if not missing:
+            return outcomes
+
+        async def generate(progress):
+            started = time.monotonic()
+            results = await generate_images_async(
+                providers, prompt, model, aspect_ratio, len(missing), progress, variant_seeds(seed, missing),
+                priority, get_job_journal().generation(prompt, model, aspect_ratio, seed, missing)
+            )
+            return store_results(requests, outcomes, missing, results, prompt, model, aspect_ratio, seed,
+                                 time.monotonic() - started, trace)
+
+        generated, shared = await get_in_flight().run_async(
+            [requests[variant] for variant in missing], generate, progress
+        )
+        return merge_shared(outcomes, missing, generated, shared, trace)
+
+
+async def generate_image_async(prompt, model, aspect_ratio, providers, progress=None, seed=None, force=False,
+                               trace=None):
+    return (await generate_variants_async(prompt, model, aspect_ratio, providers, 1, progress, seed, force, trace))[0]
+
+
+def resume_request(record, progress=None, priority=PRIORITY_BATCH):
+    # Collects one journaled fal request and stores its images under the
+    # variants it was generating, as the interrupted generation would have.
+    # Returns one (file_name, cached) per image.
+    requests = [describe_request(record.prompt, record.model, record.aspect_ratio, record.seed, variant)
+                for variant in record.variants]
+    trace = begin_request(requests[0], record.prompt, record.model, None)
+    seed = record.arguments.get("seed")  # the seed the request was sent with
+    claimed = []
+
+    def collect(progress):
+        entry = get_job_journal().claim(record)
+        if entry is None:
+            return [(None, False)] * len(requests)  # someone else resumed it
+        claimed.append(entry)
+        started = time.monotonic()
+        with get_scheduler().slot(get_model(record.model), priority):
+            results = collect_fal_request(entry.request, len(requests), progress, entry)
+        latency = time.monotonic() - started
+        return [
+            (store_result(request, result, record.prompt, record.model, record.aspect_ratio,
+                          seed, latency, trace), False) if result else (None, False)
+            for request, result in zip(requests, results)
+        ]
+
+    try:
+        with job_scope(trace, None):
+            outcomes, shared = get_in_flight().run(requests, collect, progress)
+            return [(file_name, shared) for file_name, _ in outcomes]
+    finally:
+        if claimed:
+            record_trace(trace)
+
+
+def resume_interrupted(progress=None, priority=PRIORITY_BATCH, job=None):
+    # Collects the fal requests that earlier runs submitted but never
+    # collected because the process crashed or was closed. Returns one
+    # (file_name, cached) per image; file_name is None where the request
+    # could not be collected (fal no longer has it, or it failed).
+    records = get_job_journal().orphans()
+    if not records:
+        return []
+    job = job if job is not None else current_job()
+    with ThreadPoolExecutor(max_workers=min(RESUME_WORKERS, len(records))) as executor:
+        futures = [executor.submit(job.wrap(resume_request), record, progress, priority) for record in records]
+        outcomes = []
+        try:
+            for record, future in zip(records, futures):
+                try:
+                    outcomes.extend(future.result())
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    print(f"Error resuming fal request {record.request_id}: {e}")
+                    outcomes.extend([(None, False)] * len(record.variants))
+        except BaseException:
+            job.cancel()  # Ctrl-C: stop the other requests before waiting for them
+            raise
+    return outcomes
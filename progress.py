@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import namedtuple
+
+# A generation's progress as a stream of events: where the request sits in
+# the provider's queue, the latest log line while it runs, bytes downloaded.
+# Providers and downloads call `progress(event)`; the callback is threaded
+# down from the caller like the Trace is made current. Each event is a
+# snapshot of the request's state, so a consumer may drop any event in
+# favour of a later one. That is what ThrottledProgress does before events
+# cross to the GUI thread.
+
+QUEUE = "queue"
+RUNNING = "running"
+DOWNLOAD = "download"
+STAGE_ORDER = {QUEUE: 0, RUNNING: 1, DOWNLOAD: 2}
+PROGRESS_INTERVAL = 0.1
+
+ProgressEvent = namedtuple("ProgressEvent", ["stage", "queue_position", "message", "done", "total"])
+ProgressEvent.__new__.__defaults__ = (None, None, 0, 0)
+
+
+def describe_event(event):
+    if event.stage == QUEUE:
+        return "Queued" if event.queue_position is None else f"Queued · {event.queue_position} ahead"
+    if event.stage == RUNNING:
+        return f"Generating · {event.message}" if event.message else "Generating..."
+    if event.total:
+        return f"Downloading · {event.done * 100 // event.total}%"
+    return f"Downloading · {event.done // 1024} KB"
+
+
+class CombinedProgress:
+    # Folds the events of several concurrent requests or downloads into one
+    # stream: bytes add up, the least advanced part sets the stage, and the
+    # lowest queue position and the latest log line are kept.
+    def __init__(self, progress, count):
+        self.progress = progress
+        self.events = [None] * count
+        self.message = None
+        self.lock = threading.Lock()
+
+    def part(self, index):
+        if self.progress is None:
+            return None
+
+        def update(event):
+            with self.lock:
+                self.events[index] = event
+                if event.message:
+                    self.message = event.message
+                event = self.fold()
+            self.progress(event)
+        return update
+
+    def fold(self):
+        events = [event for event in self.events if event is not None]
+        positions = [event.queue_position for event in events
+                     if event.stage == QUEUE and event.queue_position is not None]
+        return ProgressEvent(
+            min((event.stage for event in events), key=STAGE_ORDER.get),
+            min(positions) if positions else None,
+            self.message,
+            sum(event.done for event in events),
+            sum(event.total for event in events),
+        )
+
+
+class ThrottledProgress:
+    # Passes on at most one event per `interval` and drops repeats. A change
+    # of stage and a finished download always go through, so the consumer
+    # never misses a transition and the last event it sees is current.
+    # Safe to call from several threads.
+    def __init__(self, progress, interval=PROGRESS_INTERVAL):
+        self.progress = progress
+        self.interval = interval
+        self.last = None
+        self.sent = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        now = time.monotonic()
+        with self.lock:
+            last = self.last
+            if last is not None:
+                if event == last:
+                    return
+                finished = event.total and event.done >= event.total
+                if event.stage == last.stage and not finished and now - self.sent < self.interval:
+                    return
+            self.last = event
+            self.sent = now
+            # Under the lock so events from fanned-out threads stay in order.
+            self.progress(event)
@@ -0,0 +1,303 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import JobCancelled, JobSuspended, current_job, detached
+from journal import NULL_ENTRY
+from model_registry import get_model, plan_batches
+from scheduler import PRIORITY_BATCH, get_scheduler
+from progress import QUEUE, RUNNING, CombinedProgress, ProgressEvent
+from storage import stream_to_store
+from telemetry import current_trace
+from transport import get_transport
+
+# Constants
+STABILITY_API_URL = "https://api.stability.ai/v2beta/stable-image/generate/sd3"
+STABILITY_API_KEY = "API KEY HERE"  # Make sure to set this API key
+FAL_API_KEY = os.getenv("FAL_KEY")  # Make sure to set this environment variable
+FAL_QUEUE_URL = os.getenv("FAL_QUEUE_URL", "https://queue.fal.run")
+POLL_INTERVAL = 0.5
+
+# fal queue states
+QUEUED = "IN_QUEUE"
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+FLUX_IMAGE_SIZES = {
+    "1:1": "square_hd",
+    "16:9": "landscape_16_9",
+    "4:3": "landscape_4_3",
+    "3:4": "portrait_4_3",
+    "9:16": "portrait_16_9",
+}
+
+
+class ProviderError(Exception):
+    pass
+
+
+def response_error(response, name):
+    # Reads the (small) error body so the message says why, then closes.
+    try:
+        detail = response.text[:200]
+    except Exception:
+        detail = ""
+    response.close()
+    return ProviderError(f"{name} returned HTTP {response.status_code}: {detail}")
+
+
+def missing_api_key(models):
+    # The message to show when a selected model's provider has no key set.
+    if not FAL_API_KEY and any(get_model(model).provider == "fal" for model in models):
+        return "Please set your FAL_KEY environment variable to use Flux models."
+    return None
+
+
+def stability_form_data(prompt, model, aspect_ratio, output_format="png", seed=None):
+    data = {
+        "prompt": prompt,
+        "model": get_model(model).endpoint,
+        "output_format": output_format,
+        "aspect_ratio": aspect_ratio,
+    }
+    if seed is not None:
+        data["seed"] = seed
+    return data
+
+
+def flux_arguments(prompt, aspect_ratio, seed=None, num_images=1):
+    arguments = {
+        "prompt": prompt,
+        "image_size": FLUX_IMAGE_SIZES.get(aspect_ratio, "landscape_4_3"),
+        "num_images": num_images,
+        "enable_safety_checker": True,
+        "safety_tolerance": "2"
+    }
+    if seed is not None:
+        arguments["seed"] = seed
+    return arguments
+
+
+def generate_stability_image(prompt, model="sd3.5-large", aspect_ratio="16:9", output_format="png", progress=None, seed=None):
+    headers = {
+        "authorization": f"Bearer {STABILITY_API_KEY}",
+        "accept": "image/*",
+    }
+
+    data = stability_form_data(prompt, model, aspect_ratio, output_format, seed)
+
+    files = {
+        "none": ('', ''),
+    }
+
+    # The v2beta endpoint is synchronous: everything up to the response
+    # headers is queueing plus inference on Stability's side. There is no
+    # remote cancel; a cancelled job abandons the request.
+    trace = current_trace()
+    trace.begin("inference")
+    current_job().enter("inference")
+    if progress:
+        progress(ProgressEvent(RUNNING))
+    response = get_transport().post(STABILITY_API_URL, headers=headers, data=data, files=files, stream=True)
+    trace.end()
+
+    if response.status_code != 200:
+        raise response_error(response, "Stability")
+    return stream_to_store(response, output_format, progress)
+
+
+def download_images(urls, progress=None):
+    # One image streams inline so its download and write stages are traced
+    # separately; several download concurrently under a single wall-clock
+    # "download" span (pool threads do not inherit the current trace).
+    if len(urls) == 1:
+        return [download_image(urls[0], progress)]
+    combined = CombinedProgress(progress, len(urls))
+    job = current_job()
+    with current_trace().span("download"), ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        futures = [
+            executor.submit(job.wrap(download_image), url, combined.part(index))
+            for index, url in enumerate(urls)
+        ]
+        return [future.result() for future in futures]
+
+
+def download_image(url, progress=None):
+    response = get_transport().get(url, stream=True)
+    if response.status_code != 200:
+        response.close()
+        return None
+    return stream_to_store(response, "png", progress)
+
+
+def queue_progress(state, queue_position=None, logs=None):
+    # The progress event for a fal queue status.
+    if state == IN_PROGRESS:
+        return ProgressEvent(RUNNING, message=logs[-1]["message"] if logs else None)
+    return ProgressEvent(QUEUE, queue_position=queue_position)
+
+
+def fal_headers():
+    return {"Authorization": f"Key {FAL_API_KEY}"} if FAL_API_KEY else {}
+
+
+def fal_json(response):
+    if response.status_code >= 400:
+        raise response_error(response, "fal")
+    return response.json()
+
+
+def submit_fal_request(model_path, arguments):
+    # Returns the queue's handle: request_id plus status, response and
+    # cancel URLs.
+    return fal_json(get_transport().post(f"{FAL_QUEUE_URL.rstrip('/')}/{model_path}", headers=fal_headers(),
+                                         json=arguments))
+
+
+def cancel_fal_request(request):
+    # Best effort, and outside the job: it runs because the job was cancelled.
+    if not request.get("cancel_url"):
+        return
+    try:
+        with detached():
+            get_transport().request("PUT", request["cancel_url"], headers=fal_headers()).close()
+    except Exception as e:
+        print(f"Error cancelling fal request {request.get('request_id')}: {e}")
+
+
+def wait_for_fal_request(request, progress=None, entry=NULL_ENTRY):
+    # Polls the queue until the request completes. Each status becomes a
+    # progress event: queue position, then the latest log line. `entry`
+    # journals the status changes.
+    trace = current_trace()
+    job = current_job()
+    transport = get_transport()
+    trace.begin("queue_wait")
+    job.enter("queue_wait")
+    while True:
+        status = fal_json(transport.get(request["status_url"], headers=fal_headers(), params={"logs": 1}))
+        entry.status(status["status"])
+        if status["status"] == COMPLETED:
+            return
+        if status["status"] == IN_PROGRESS:
+            if trace.current and trace.current[0] == "queue_wait":
+                trace.begin("inference")
+            if job.stage == "queue_wait":
+                job.enter("inference")
+        if progress:
+            progress(queue_progress(status["status"], status.get("queue_position"), status.get("logs")))
+        job.sleep(POLL_INTERVAL)
+
+
+def fetch_fal_result(request):
+    trace = current_trace()
+    trace.begin("result")
+    current_job().enter("result")
+    result = fal_json(get_transport().get(request["response_url"], headers=fal_headers()))
+    trace.end()
+    return result
+
+
+def collect_fal_request(request, num_images, progress=None, entry=NULL_ENTRY):
+    # Waits for a submitted request and downloads its images. A cancelled or
+    # timed-out job cancels the request in the queue rather than leaving it
+    # to run and bill; a suspended one leaves it for a later run to collect.
+    # Once fal has completed it there is nothing to cancel, and a result that
+    # fails to arrive can be fetched again later.
+    if progress:
+        progress(ProgressEvent(QUEUE))
+    try:
+        wait_for_fal_request(request, progress, entry)
+    except BaseException as e:
+        entry.fail(e)
+        if not isinstance(e, JobSuspended):
+            cancel_fal_request(request)
+        raise
+    try:
+        images = (fetch_fal_result(request) or {}).get("images") or []
+        results = download_images([image["url"] for image in images[:num_images]], progress)
+    except BaseException as e:
+        entry.fetch_failed(e)
+        raise
+    entry.complete()
+    return results + [None] * (num_images - len(results))
+
+
+def generate_flux_image(prompt, model="fal-ai/flux-pro/v1.1", aspect_ratio="1:1", progress=None, seed=None,
+                        num_images=1, journal=None):
+    # Returns one DownloadResult (or None) per requested image; fal produces
+    # all of them from a single queued request. Drives fal's queue REST API
+    # over the shared transport (the flow fal_client.subscribe wraps) so the
+    # wait can be cancelled. `journal` (journal.JournalGeneration) records
+    # the request so it survives a crash, and a request with the same
+    # arguments that an earlier run left in the queue is adopted instead of
+    # submitted again.
+    model_path = get_model(model).endpoint
+    arguments = flux_arguments(prompt, aspect_ratio, seed, num_images)
+    trace = current_trace()
+    job = current_job()
+
+    try:
+        entry = journal.adopt(model_path, arguments) if journal else None
+        if entry is not None:
+            request = entry.request
+            print(f"Resuming fal request {request['request_id']}")
+        else:
+            trace.begin("submit")
+            job.enter("submit")
+            entry = journal.begin(model_path, arguments) if journal else NULL_ENTRY
+            try:
+                request = submit_fal_request(model_path, arguments)
+            except BaseException as e:
+                entry.fail(e)
+                raise
+            entry.submitted(request)
+        return collect_fal_request(request, num_images, progress, entry)
+    except (JobCancelled, ProviderError):
+        raise
+    except Exception as e:
+        raise ProviderError(f"fal request failed: {e}") from e
+
+
+def generate_images(prompt, model, aspect_ratio, variants=1, progress=None, seeds=None, priority=PRIORITY_BATCH,
+                    journal=None):
+    # `variants` images of one prompt: native batching where the model has
+    # it (fal `num_images`), concurrent requests for the rest. Returns one
+    # DownloadResult or None per variant. `seeds`, when given, holds each
+    # variant's seed; seeded variants are requested one at a time, since a
+    # native batch takes only one seed. Every request waits for a slot from
+    # the provider's scheduler first. fal requests are journaled when
+    # `journal` is given.
+    spec = get_model(model)
+    batches = plan_batches(model, variants, seeds is not None)
+    offsets = [sum(batches[:index]) for index in range(len(batches))]
+
+    def run_batch(size, offset, batch_progress):
+        batch_seed = None if seeds is None else seeds[offset]
+        with get_scheduler().slot(spec, priority):
+            if spec.provider == "fal":
+                return generate_flux_image(prompt, model, aspect_ratio, batch_progress, batch_seed, num_images=size,
+                                           journal=journal and journal.batch(offset, size))
+            return [generate_stability_image(prompt, model, aspect_ratio, progress=batch_progress, seed=batch_seed)]
+
+    if len(batches) == 1:
+        return run_batch(batches[0], 0, progress)
+
+    # Fanned-out requests overlap end to end, so they are traced as one
+    # "inference" span covering every request and its download.
+    combined = CombinedProgress(progress, len(batches))
+    job = current_job()
+    results = []
+    with current_trace().span("inference"), ThreadPoolExecutor(max_workers=len(batches)) as executor:
+        futures = [
+            executor.submit(job.wrap(run_batch), size, offset, combined.part(index))
+            for index, (size, offset) in enumerate(zip(batches, offsets))
+        ]
+        for size, future in zip(batches, futures):
+            try:
+                results.extend(future.result())
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"Error generating {model} variant: {e}")
+                results.extend([None] * size)
+    return results
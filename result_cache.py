@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RESULT_CACHE_FILE = ".result_cache.sqlite"
+RESULT_CACHE_TTL = float(os.getenv("IMAGE_COMPARE_CACHE_TTL", 7 * 24 * 3600))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_COMPARE_CACHE_MAX_ENTRIES", 5000))
+
+
+def request_key(request):
+    # Canonical JSON (sorted keys, no whitespace) so the same request always
+    # hashes the same regardless of dict ordering.
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    # Maps a request hash to the image file it produced. Entries expire after
+    # `ttl` seconds and the least recently used ones are evicted past
+    # `max_entries`. Only the index entry is dropped; the image itself stays
+    # in the gallery.
+    def __init__(self, path, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                request TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.connection.commit()
+
+    def get(self, request):
+        key = request_key(request)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT file_path, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            file_path, created_at = row
+            if now - created_at > self.ttl or not os.path.exists(file_path):
+                self.connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.connection.commit()
+                return None
+            self.connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            return file_path
+
+    def put(self, request, file_path):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (key, file_path, request, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (request_key(request), file_path, json.dumps(request, sort_keys=True), now, now)
+            )
+            self.connection.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+            self.connection.execute("""
+                DELETE FROM results WHERE key IN (
+                    SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self.connection.commit()
+
+    def relocate(self, old_path, new_path):
+        # The image moved (store migration, transcoding); entries follow it.
+        with self.lock:
+            self.connection.execute("UPDATE results SET file_path = ? WHERE file_path = ?", (new_path, old_path))
+            self.connection.commit()
+
+    def invalidate(self, request):
+        with self.lock:
+            self.connection.execute("DELETE FROM results WHERE key = ?", (request_key(request),))
+            self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM results")
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
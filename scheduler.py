@@ -0,0 +1,262 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+
+from jobs import current_job
+from telemetry import current_trace
+
+# Admission control in front of every provider request. Each provider gets a
+# token bucket (requests per second) and an adaptive concurrency limit:
+# additive increase while requests come back at normal latency,
+# multiplicative decrease on a 429 or when latency balloons. Waiters are
+# served in priority order, so an interactive request from the GUI goes ahead
+# of queued batch work.
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+PROVIDER_LIMITS = {
+    # rate (requests/s), burst, initial and maximum concurrency
+    "stability": {"rate": 15.0, "burst": 15, "initial": 2, "maximum": 8},
+    "fal": {"rate": 10.0, "burst": 10, "initial": 4, "maximum": 16},
+}
+MIN_CONCURRENCY = 1
+DECREASE_FACTOR = 0.5
+LATENCY_DECREASE_FACTOR = 0.9
+# A request slower than this multiple of the model's typical latency counts
+# as a congestion signal.
+LATENCY_TOLERANCE = 3.0
+# Further decreases within this window are ignored, so one burst of 429s
+# halves the limit once rather than collapsing it to the minimum.
+DECREASE_COOLDOWN = 2.0
+ASYNC_POLL_INTERVAL = 0.05
+
+_current_slot = contextvars.ContextVar("current_slot", default=None)
+
+
+class TokenBucket:
+    # Not locked itself; ProviderLimiter calls it with its own lock held.
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self):
+        # Takes a token and returns 0, or returns the seconds until one is due.
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if not self.rate:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class Slot:
+    def __init__(self, limiter, typical_latency=None):
+        self.limiter = limiter
+        self.typical_latency = typical_latency
+        self.started = time.monotonic()
+        self.throttled = False
+
+
+class ProviderLimiter:
+    def __init__(self, name, rate=None, burst=1, initial=1, maximum=1, minimum=MIN_CONCURRENCY):
+        self.name = name
+        self.cond = threading.Condition()
+        self.bucket = TokenBucket(rate, burst)
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.last_decrease = 0.0
+        self.throttle_count = 0
+        self.completed = 0
+
+    def configure(self, rate=None, burst=None, maximum=None):
+        with self.cond:
+            if rate is not None:
+                self.bucket.rate = rate
+                self.bucket.burst = max(1, burst or int(rate) or 1)
+            if maximum is not None:
+                self.maximum = max(self.minimum, maximum)
+                self.limit = min(self.limit, self.maximum)
+            self.cond.notify_all()
+
+    def enqueue(self, priority):
+        ticket = (priority, next(self.sequence))
+        heapq.heappush(self.waiters, ticket)
+        return ticket
+
+    def try_take(self, ticket):
+        # With the lock held: 0 when the slot is granted, otherwise seconds
+        # to wait for a token, or None to wait for a notification.
+        if self.waiters[0] != ticket or self.in_flight >= int(self.limit):
+            return None
+        wait = self.bucket.reserve()
+        if wait:
+            return wait
+        heapq.heappop(self.waiters)
+        self.in_flight += 1
+        # The next waiter may be able to go too.
+        self.cond.notify_all()
+        return 0
+
+    def abandon(self, ticket):
+        with self.cond:
+            self.waiters.remove(ticket)
+            heapq.heapify(self.waiters)
+            self.cond.notify_all()
+
+    def decrease(self, factor):
+        now = time.monotonic()
+        if now - self.last_decrease >= DECREASE_COOLDOWN:
+            self.limit = max(self.minimum, self.limit * factor)
+            self.last_decrease = now
+
+    def throttled(self, slot, retry_after=None):
+        with self.cond:
+            slot.throttled = True
+            self.throttle_count += 1
+            self.decrease(DECREASE_FACTOR)
+            if retry_after:
+                self.bucket.pause(retry_after)
+
+    def release(self, slot, succeeded):
+        with self.cond:
+            self.in_flight -= 1
+            self.completed += 1
+            if succeeded and not slot.throttled:
+                latency = time.monotonic() - slot.started
+                if slot.typical_latency and latency > slot.typical_latency * LATENCY_TOLERANCE:
+                    self.decrease(LATENCY_DECREASE_FACTOR)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def running(self, typical_latency):
+        slot = Slot(self, typical_latency)
+        token = _current_slot.set(slot)
+        succeeded = False
+        try:
+            yield slot
+            succeeded = True
+        finally:
+            _current_slot.reset(token)
+            self.release(slot, succeeded)
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, priority=PRIORITY_BATCH, typical_latency=None):
+        # A cancelled job leaves the queue at once; one whose deadline passes
+        # while queued leaves with a JobTimeout.
+        job = current_job()
+        job.enter("admission")
+        with current_trace().span("admission"), job.on_cancel(self.wake), self.cond:
+            ticket = self.enqueue(priority)
+            try:
+                wait = self.try_take(ticket)
+                while wait != 0:
+                    self.cond.wait(job.timeout_for(wait))
+                    job.check()
+                    wait = self.try_take(ticket)
+            except BaseException:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.cond.notify_all()
+                raise
+        with self.running(typical_latency) as slot:
+            yield slot
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self, priority=PRIORITY_BATCH, typical_latency=None):
+        # Event-loop waiters poll rather than block on the condition; the
+        # interval is negligible next to a generation.
+        import asyncio
+
+        job = current_job()
+        job.enter("admission")
+        with current_trace().span("admission"):
+            with self.cond:
+                ticket = self.enqueue(priority)
+            try:
+                while True:
+                    job.check()
+                    with self.cond:
+                        wait = self.try_take(ticket)
+                    if wait == 0:
+                        break
+                    await asyncio.sleep(min(wait or ASYNC_POLL_INTERVAL, ASYNC_POLL_INTERVAL))
+            except BaseException:
+                self.abandon(ticket)
+                raise
+        with self.running(typical_latency) as slot:
+            yield slot
+
+    def stats(self):
+        with self.cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": len(self.waiters),
+                "throttled": self.throttle_count,
+                "completed": self.completed,
+            }
+
+
+class Scheduler:
+    def __init__(self, limits=None):
+        self.limiters = {
+            name: ProviderLimiter(name, **options)
+            for name, options in (limits or PROVIDER_LIMITS).items()
+        }
+
+    def limiter(self, provider):
+        return self.limiters[provider]
+
+    def slot(self, spec, priority=PRIORITY_BATCH):
+        return self.limiters[spec.provider].slot(priority, spec.typical_latency)
+
+    def async_slot(self, spec, priority=PRIORITY_BATCH):
+        return self.limiters[spec.provider].async_slot(priority, spec.typical_latency)
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+
+def note_throttled(retry_after=None):
+    # Called by the transport on a 429; attributed to whichever slot the
+    # current thread or task is running under.
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.limiter.throttled(slot, retry_after)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
@@ -0,0 +1,289 @@
+import argparse
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import IMAGE_DIR, ensure_image_dir
+
+# "Find images like this one" and near-duplicate detection over the whole
+# gallery. Each image's 64-bit perceptual hash (image_metrics.perceptual_hash)
+# is persisted in SQLite and held in memory in a BK-tree, so a Hamming-radius
+# query only visits the subtrees that can contain a match instead of every
+# image. Images the GUI generates are hashed as they arrive, on a background
+# thread (submit()); refresh() catches up with everything else, such as
+# batch output, so a batch run never loads the metrics engine (NumPy, Qt).
+# Hashing goes through the metrics engine, which caches features by content
+# hash.
+#
+#   python image_compare.py similar generated_images/<file>.png --radius 10
+#   python image_compare.py similar --duplicates --radius 4
+
+SIMILARITY_FILE = ".similarity.sqlite"
+SIMILAR_RADIUS = 12
+DUPLICATE_RADIUS = 4
+HASH_WORKERS = 4
+
+
+class BKTree:
+    # Nodes are [hash, paths, children]; children are keyed by their Hamming
+    # distance to the node. By the triangle inequality only children whose
+    # key lies within `radius` of the query's distance to the node can hold
+    # matches. Removal drops the path but keeps the node for routing.
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, path):
+        if self.root is None:
+            self.root = [value, {path}, {}]
+            return
+        node = self.root
+        while True:
+            distance = (node[0] ^ value).bit_count()
+            if distance == 0:
+                node[1].add(path)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {path}, {}]
+                return
+            node = child
+
+    def discard(self, value, path):
+        node = self.root
+        while node is not None:
+            distance = (node[0] ^ value).bit_count()
+            if distance == 0:
+                node[1].discard(path)
+                return
+            node = node[2].get(distance)
+
+    def query(self, value, radius):
+        # [(distance, path)], nearest first.
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = (node[0] ^ value).bit_count()
+            if distance <= radius:
+                results.extend((distance, path) for path in node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return sorted(results)
+
+
+def hash_image(engine, path):
+    from image_metrics import MetricsUnavailable
+
+    try:
+        return engine.features(path)["phash"]
+    except (OSError, MetricsUnavailable) as e:
+        print(f"Error hashing {path}: {e}")
+        return None
+
+
+class SimilarityIndex:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                phash TEXT NOT NULL
+            )
+        """)
+        self.connection.commit()
+        self.tree = BKTree()
+        self.hashes = {}
+        for path, phash in self.connection.execute("SELECT path, phash FROM hashes"):
+            self.hashes[path] = int(phash, 16)
+            self.tree.add(self.hashes[path], path)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, path, phash):
+        value = int(phash, 16)
+        with self.lock:
+            previous = self.hashes.get(path)
+            if previous == value:
+                return
+            if previous is not None:
+                self.tree.discard(previous, path)
+            self.hashes[path] = value
+            self.tree.add(value, path)
+            self.connection.execute("INSERT OR REPLACE INTO hashes (path, phash) VALUES (?, ?)", (path, phash))
+            self.connection.commit()
+
+    def remove(self, path):
+        with self.lock:
+            value = self.hashes.pop(path, None)
+            if value is None:
+                return
+            self.tree.discard(value, path)
+            self.connection.execute("DELETE FROM hashes WHERE path = ?", (path,))
+            self.connection.commit()
+
+    def relocate(self, old_path, new_path):
+        # A losslessly transcoded image keeps its pixels, and so its hash.
+        with self.lock:
+            value = self.hashes.get(old_path)
+        if value is not None:
+            self.remove(old_path)
+            self.add(new_path, f"{value:016x}")
+
+    def submit(self, path):
+        # Hashes a newly saved image in the background. Without the metrics
+        # engine's dependencies the image is left to refresh().
+        try:
+            from image_metrics import get_metrics_engine
+        except ImportError:
+            return
+        with self.lock:
+            if path in self.hashes:
+                return
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, args=(get_metrics_engine(),),
+                                               name="similarity-index", daemon=True)
+                self.thread.start()
+        self.queue.put(path)
+
+    def run(self, engine):
+        while True:
+            path = self.queue.get()
+            try:
+                value = hash_image(engine, path)
+                if value is not None:
+                    self.add(path, value)
+            except sqlite3.Error as e:
+                print(f"Error indexing {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def refresh(self, paths, engine=None, workers=HASH_WORKERS):
+        # Brings the index in line with `paths` (the image index's): hashes
+        # the new ones, forgets the gone ones. Returns (added, removed).
+        paths = set(paths)
+        with self.lock:
+            missing = [path for path in paths if path not in self.hashes]
+            gone = [path for path in self.hashes if path not in paths]
+        for path in gone:
+            self.remove(path)
+        if not missing:
+            return 0, len(gone)
+
+        from image_metrics import get_metrics_engine
+        engine = engine or get_metrics_engine()
+
+        added = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, value in zip(missing, executor.map(lambda path: hash_image(engine, path), missing)):
+                if value is not None:
+                    self.add(path, value)
+                    added += 1
+        return added, len(gone)
+
+    def query(self, phash, radius=SIMILAR_RADIUS):
+        with self.lock:
+            return self.tree.query(int(phash, 16), radius)
+
+    def similar_to(self, path, radius=SIMILAR_RADIUS):
+        # [(distance, path)] for images within `radius` of `path`, the image
+        # itself excluded. `path` must be in the index.
+        with self.lock:
+            value = self.hashes.get(path)
+            if value is None:
+                return []
+            results = self.tree.query(value, radius)
+        return [(distance, other) for distance, other in results if other != path]
+
+    def near_duplicates(self, radius=DUPLICATE_RADIUS):
+        # Groups of two or more images that are within `radius` of a common
+        # image, largest group first. Each image appears in one group.
+        with self.lock:
+            items = sorted(self.hashes.items())
+        seen = set()
+        groups = []
+        for path, value in items:
+            if path in seen:
+                continue
+            with self.lock:
+                group = [other for _, other in self.tree.query(value, radius) if other not in seen]
+            if len(group) > 1:
+                seen.update(group)
+                groups.append(group)
+        return sorted(groups, key=len, reverse=True)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+_similarity_index = None
+_similarity_lock = threading.Lock()
+
+
+def get_similarity_index():
+    global _similarity_index
+    with _similarity_lock:
+        if _similarity_index is None:
+            ensure_image_dir()
+            _similarity_index = SimilarityIndex(os.path.join(IMAGE_DIR, SIMILARITY_FILE))
+        return _similarity_index
+
+
+def refreshed_similarity_index():
+    # The index caught up with the image directory: the metadata index is
+    # synced first (cheap, stat only), so images written by other processes
+    # are included, then only the new ones are hashed.
+    from image_index import scan_directory
+    from pipeline import get_image_index
+
+    image_index = get_image_index()
+    image_index.sync(dict.fromkeys(image_index.paths_in(IMAGE_DIR)), scan_directory(IMAGE_DIR))
+    index = get_similarity_index()
+    index.refresh(image_index.paths())
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find visually similar or near-duplicate generated images.")
+    parser.add_argument("image", nargs="?", help="Image to find matches for")
+    parser.add_argument("--duplicates", action="store_true", help="List groups of near-duplicates instead")
+    parser.add_argument("--radius", type=int, default=None,
+                        help=f"Maximum Hamming distance between 64-bit hashes "
+                             f"(default {SIMILAR_RADIUS}, or {DUPLICATE_RADIUS} with --duplicates)")
+    args = parser.parse_args(argv)
+    if not args.image and not args.duplicates:
+        parser.error("give an image or --duplicates")
+
+    index = refreshed_similarity_index()
+    if args.duplicates:
+        groups = index.near_duplicates(DUPLICATE_RADIUS if args.radius is None else args.radius)
+        for group in groups:
+            print("\n".join(group) + "\n")
+        print(f"{len(groups)} group(s) of near-duplicates among {len(index)} image(s)")
+        return 0
+
+    path = os.path.relpath(args.image)
+    if path not in index.hashes:
+        # An image from outside the gallery: hash it without indexing it.
+        from image_metrics import get_metrics_engine
+        results = index.query(get_metrics_engine().features(args.image)["phash"],
+                              SIMILAR_RADIUS if args.radius is None else args.radius)
+    else:
+        results = index.similar_to(path, SIMILAR_RADIUS if args.radius is None else args.radius)
+    for distance, other in results:
+        print(f"{distance:>3}  {other}")
+    print(f"{len(results)} similar image(s) among {len(index)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from jobs import current_job
+from progress import DOWNLOAD, ProgressEvent
+from telemetry import current_trace
+from transport import iter_response_bytes
+
+IMAGE_DIR = "generated_images"
+OBJECT_DIR_NAME = "objects"
+LEDGER_FILE = ".ledger"
+SHARD_DEPTH = 2
+STORED_EXTENSIONS = ("png", "jpeg", "jpg", "webp")
+CHUNK_SIZE = 64 * 1024
+# Set IMAGE_STORE_TRANSCODE=webp (or png) to re-encode new images losslessly
+# in the background; a re-encode is kept only if it is smaller.
+TRANSCODE_FORMAT = os.getenv("IMAGE_STORE_TRANSCODE", "").lower()
+TRANSCODE_QUALITY = {"webp": 100, "png": 0}  # webp: 100 is lossless; png: 0 is maximum compression
+# New images are left alone this long so the GUI and metrics can read them
+# under the path they were returned with.
+TRANSCODE_DELAY = 30.0
+
+DownloadResult = namedtuple("DownloadResult", ["path", "sha256", "size"])
+
+
+def ensure_image_dir():
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    return IMAGE_DIR
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageStore:
+    # Content-addressed image files: objects/ab/cd/<sha256>.<ext> under the
+    # image directory, sharded on the hash's leading hex digits so no
+    # directory grows past a few hundred entries even at millions of images.
+    # Files are written to a temp file and renamed into place once their
+    # hash is known; identical bytes are stored once. The name keeps the
+    # hash of the bytes as delivered even after a lossless transcode changes
+    # the extension. Every file added or removed is appended to a ledger so
+    # watchers can follow the store without listing it.
+    def __init__(self, root):
+        self.root = root
+        self.object_dir = os.path.join(root, OBJECT_DIR_NAME)
+        self.ledger_path = os.path.join(self.object_dir, LEDGER_FILE)
+
+    def shard_dir(self, sha256):
+        return os.path.join(self.object_dir, *(sha256[2 * level:2 * level + 2] for level in range(SHARD_DEPTH)))
+
+    def object_path(self, sha256, extension):
+        return os.path.join(self.shard_dir(sha256), f"{sha256}.{extension}")
+
+    def find(self, sha256):
+        # The stored file for this content, in whatever format it is kept.
+        for extension in STORED_EXTENSIONS:
+            path = self.object_path(sha256, extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def temp_file(self, suffix=".part"):
+        # On the store's filesystem, so the final rename is atomic.
+        os.makedirs(self.object_dir, exist_ok=True)
+        return tempfile.mkstemp(prefix=".incoming-", suffix=suffix, dir=self.object_dir)
+
+    def commit(self, temp_path, sha256, extension):
+        # Moves a fully written temp file to its content address. Returns the
+        # stored path; when the content is already stored the temp file is
+        # dropped and the existing path returned.
+        path = self.find(sha256)
+        if path is not None:
+            os.remove(temp_path)
+            return path
+        path = self.object_path(sha256, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+        self.log("+", path)
+        return path
+
+    def address(self, source, sha256):
+        # Where add_file() will put `source`: its existing copy, if any.
+        extension = os.path.splitext(source)[1].lstrip(".").lower()
+        return self.find(sha256) or self.object_path(sha256, extension)
+
+    def add_file(self, source, sha256):
+        # Moves a file from the same filesystem into the store (migration).
+        # Returns (path, stored); `stored` is False when identical bytes were
+        # already there, in which case the source is deleted.
+        path = self.find(sha256)
+        if path is not None:
+            os.remove(source)
+            return path, False
+        path = self.address(source, sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source, path)
+        self.log("+", path)
+        return path, True
+
+    def replace_format(self, path, temp_path, extension):
+        # Swaps a stored file for a re-encoded temp file under the same hash.
+        sha256 = os.path.splitext(os.path.basename(path))[0]
+        new_path = self.object_path(sha256, extension)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, new_path)
+        if new_path != path:
+            os.remove(path)
+            self.log("-", path)
+        self.log("+", new_path)
+        return new_path
+
+    def log(self, change, path):
+        # One short O_APPEND write per line, so concurrent writers (GUI and a
+        # batch process) never interleave within a line.
+        with open(self.ledger_path, "a", encoding="utf-8") as ledger:
+            ledger.write(f"{change} {path}\n")
+
+    def ensure_ledger(self):
+        os.makedirs(self.object_dir, exist_ok=True)
+        open(self.ledger_path, "a").close()
+        return self.ledger_path
+
+    def ledger_size(self):
+        try:
+            return os.path.getsize(self.ledger_path)
+        except OSError:
+            return 0
+
+    def read_ledger(self, offset):
+        # Changes appended since `offset`: (new offset, added, removed). Only
+        # complete lines are consumed.
+        try:
+            with open(self.ledger_path, "rb") as ledger:
+                ledger.seek(offset)
+                data = ledger.read()
+        except OSError:
+            return offset, [], []
+        data = data[:data.rfind(b"\n") + 1]
+        added, removed = [], []
+        for line in data.decode("utf-8").splitlines():
+            change, _, path = line.partition(" ")
+            if change == "+":
+                added.append(path)
+                if path in removed:
+                    removed.remove(path)
+            elif change == "-":
+                removed.append(path)
+                if path in added:
+                    added.remove(path)
+        return offset + len(data), added, removed
+
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store():
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            ensure_image_dir()
+            _image_store = ImageStore(IMAGE_DIR)
+        return _image_store
+
+
+def transcode_file(store, path, image_format=None):
+    # Re-encodes a stored image losslessly; the new file replaces the old one
+    # only if it decodes to identical pixels and is smaller. Returns the new
+    # path, or None when the image was left alone.
+    image_format = image_format or TRANSCODE_FORMAT
+    if image_format not in TRANSCODE_QUALITY or path.endswith("." + image_format):
+        return None
+    from PyQt6.QtGui import QImage, QImageWriter
+
+    image = QImage(path)
+    if image.isNull():
+        return None
+    fd, temp_path = store.temp_file("." + image_format)
+    os.close(fd)
+    try:
+        writer = QImageWriter(temp_path, image_format.encode())
+        writer.setQuality(TRANSCODE_QUALITY[image_format])
+        pixels = image.convertToFormat(QImage.Format.Format_ARGB32)
+        if (not writer.write(image)
+                or os.path.getsize(temp_path) >= os.path.getsize(path)
+                or QImage(temp_path).convertToFormat(QImage.Format.Format_ARGB32) != pixels):
+            os.remove(temp_path)
+            return None
+        return store.replace_format(path, temp_path, image_format)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class Transcoder:
+    # Background lossless re-encoding of new images, each TRANSCODE_DELAY
+    # seconds after it was submitted. `relocated(old, new)` is called from
+    # the worker thread after each replacement so references (index, result
+    # cache) can follow the file; `relocations` keeps the old -> new map.
+    def __init__(self, store, relocated, image_format=None, delay=TRANSCODE_DELAY):
+        self.store = store
+        self.relocated = relocated
+        self.image_format = image_format or TRANSCODE_FORMAT
+        self.delay = delay
+        self.queue = queue.Queue()
+        self.flushing = threading.Event()
+        self.relocations = {}
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, path):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="transcoder", daemon=True)
+                self.thread.start()
+        self.queue.put((time.monotonic() + self.delay, path))
+
+    def run(self):
+        while True:
+            due, path = self.queue.get()
+            try:
+                self.flushing.wait(due - time.monotonic())
+                new_path = transcode_file(self.store, path, self.image_format)
+                if new_path is not None:
+                    self.relocated(path, new_path)
+                    self.relocations[path] = new_path
+            except (OSError, ImportError) as e:
+                print(f"Error transcoding {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # Transcodes everything queued now, without waiting out the delay,
+        # and returns the relocations made so far.
+        self.flushing.set()
+        self.queue.join()
+        return dict(self.relocations)
+
+
+class PartialDownload:
+    # Chunks go to a temp file in the image store and are hashed as they
+    # arrive; commit() renames the file to its content address, so readers
+    # never see a half-written image. Shared by the blocking and asyncio
+    # download paths. The current job is checked before each chunk.
+    def __init__(self, store, extension, total=0, progress=None):
+        self.job = current_job()
+        self.job.enter("download")
+        self.store = store
+        self.extension = extension
+        self.total = total
+        self.progress = progress
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.started = time.perf_counter()
+        self.write_seconds = 0.0
+        fd, self.temp_path = store.temp_file()
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        self.job.check()
+        if not chunk:
+            return
+        write_started = time.perf_counter()
+        self.file.write(chunk)
+        self.write_seconds += time.perf_counter() - write_started
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        if self.progress:
+            self.progress(ProgressEvent(DOWNLOAD, done=self.size, total=self.total))
+
+    def commit(self):
+        write_started = time.perf_counter()
+        self.file.close()
+        path = self.store.commit(self.temp_path, self.digest.hexdigest(), self.extension)
+        self.write_seconds += time.perf_counter() - write_started
+        return DownloadResult(path, self.digest.hexdigest(), self.size)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def record_spans(self):
+        trace = current_trace()
+        trace.add("write", self.write_seconds)
+        trace.add("download", time.perf_counter() - self.started - self.write_seconds)
+
+
+def stream_to_store(response, extension, progress=None, chunk_size=CHUNK_SIZE):
+    download = PartialDownload(get_image_store(), extension, int(response.headers.get("Content-Length") or 0),
+                               progress)
+    try:
+        for chunk in iter_response_bytes(response, chunk_size):
+            download.write(chunk)
+        return download.commit()
+    except BaseException:
+        download.discard()
+        raise
+    finally:
+        response.close()
+        download.record_spans()
+
+
+async def async_stream_to_store(response, extension, progress=None, chunk_size=CHUNK_SIZE):
+    # File writes stay blocking: chunks are small and local disk is fast
+    # next to the network reads this awaits on.
+    download = PartialDownload(get_image_store(), extension, int(response.headers.get("Content-Length") or 0),
+                               progress)
+    try:
+        async for chunk in response.aiter_bytes(chunk_size):
+            download.write(chunk)
+        return download.commit()
+    except BaseException:
+        download.discard()
+        raise
+    finally:
+        await response.aclose()
+        download.record_spans()
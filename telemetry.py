@@ -0,0 +1,218 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Per-generation stage timings. A Trace is made current for the duration of
+# a job (a context variable, so it follows the job's thread or task), and the
+# provider, download and decode code record spans against whatever trace is
+# current without it being threaded through every call.
+
+STAGES = ["cache_lookup", "admission", "submit", "queue_wait", "inference", "result", "download", "write", "decode"]
+STAGE_LABELS = {
+    "cache_lookup": "cache",
+    "admission": "wait",
+    "submit": "submit",
+    "queue_wait": "queue",
+    "inference": "inference",
+    "result": "result",
+    "download": "download",
+    "write": "write",
+    "decode": "decode",
+}
+HISTOGRAM_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300]
+TRACE_LOG = os.getenv("IMAGE_COMPARE_TRACE_LOG")
+TRACE_LOG_NAME = ".traces.jsonl"
+METRICS_FILE = ".metrics.prom"
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    def __init__(self, model=None, provider=None, prompt=None):
+        self.model = model
+        self.provider = provider
+        self.prompt = prompt
+        self.status = None
+        self.file = None
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.current = None
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def begin(self, stage):
+        # Sequential stages: starting one closes the previous.
+        self.end()
+        self.current = (stage, time.perf_counter())
+
+    def end(self):
+        if self.current is not None:
+            stage, started = self.current
+            self.current = None
+            self.add(stage, time.perf_counter() - started)
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        with self.lock:
+            spans = dict(self.spans)
+        parts = [f"{STAGE_LABELS.get(stage, stage)} {spans[stage]:.2f}s" for stage in STAGES if stage in spans]
+        return " · ".join(parts)
+
+    def to_dict(self):
+        with self.lock:
+            spans = {stage: round(seconds, 4) for stage, seconds in self.spans.items()}
+        return {
+            "started_at": self.started_at,
+            "model": self.model,
+            "provider": self.provider,
+            "status": self.status,
+            "file": self.file,
+            "total": round(self.total(), 4),
+            "spans": spans,
+        }
+
+
+class _NullTrace(Trace):
+    def add(self, stage, seconds):
+        pass
+
+
+def current_trace():
+    trace = _current_trace.get()
+    return trace if trace is not None else _NullTrace()
+
+
+@contextlib.contextmanager
+def use_trace(trace):
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.end()
+        _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def untraced():
+    # For fan-out: the parallel branches' stages overlap, so the caller
+    # records one wall-clock span for the lot and the branches record none.
+    token = _current_trace.set(_NullTrace())
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_histograms = {}
+        self.total_histograms = {}
+        self.outcomes = {}
+
+    def observe_trace(self, trace):
+        model = trace.model or "unknown"
+        with self.lock:
+            for stage, seconds in trace.spans.items():
+                self.stage_histograms.setdefault((stage, model), Histogram()).observe(seconds)
+            self.total_histograms.setdefault(model, Histogram()).observe(trace.total())
+            key = (model, trace.status or "unknown")
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            lines.append("# HELP image_compare_stage_seconds Time spent in each generation stage.")
+            lines.append("# TYPE image_compare_stage_seconds histogram")
+            for (stage, model), histogram in sorted(self.stage_histograms.items()):
+                lines.extend(self._histogram_lines("image_compare_stage_seconds", histogram, stage=stage, model=model))
+
+            lines.append("# HELP image_compare_generation_seconds End-to-end generation time.")
+            lines.append("# TYPE image_compare_generation_seconds histogram")
+            for model, histogram in sorted(self.total_histograms.items()):
+                lines.extend(self._histogram_lines("image_compare_generation_seconds", histogram, model=model))
+
+            lines.append("# HELP image_compare_generations_total Generations by model and outcome.")
+            lines.append("# TYPE image_compare_generations_total counter")
+            for (model, status), count in sorted(self.outcomes.items()):
+                lines.append(f"image_compare_generations_total{{{_labels(model=model, status=status)}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self, name, histogram, **labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{{{_labels(**labels, le=bound)}}} {cumulative}")
+        lines.append(f"{name}_sum{{{_labels(**labels)}}} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{{{_labels(**labels)}}} {histogram.count}")
+        return lines
+
+    def write_prometheus(self, path):
+        # Atomic replace so a node_exporter textfile collector never reads a
+        # partial file.
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".prom", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+
+METRICS = MetricsRegistry()
+_log_lock = threading.Lock()
+
+
+def record_trace(trace, log_path=None):
+    trace.end()
+    METRICS.observe_trace(trace)
+    if log_path is None:
+        from storage import IMAGE_DIR
+        log_path = TRACE_LOG or os.path.join(IMAGE_DIR, TRACE_LOG_NAME)
+    line = json.dumps(trace.to_dict(), ensure_ascii=False)
+    with _log_lock:
+        directory = os.path.dirname(log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(log_path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
@@ -0,0 +1,180 @@
+import os
+from collections import namedtuple
+
+from PyQt6.QtGui import QPalette, QColor
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QObject, Qt, pyqtSignal
+
+# One place for the GUI's colours. A theme is a QPalette; the single
+# application-level stylesheet, whose rules select widgets by type and object
+# name, sets only geometry, fonts and the accent. Qt bakes a widget's palette
+# into its style when a rule gives it a colour or border, and only a full
+# re-polish would undo that, so every colour that changes with the theme
+# comes from the palette instead. The sheet is set once, and switching themes
+# is one setPalette() call that restyles nothing. Custom-painted views (the
+# gallery delegate) follow ThemeManager.changed.
+
+Theme = namedtuple("Theme", [
+    "name", "bg_color", "container_bg", "border_color", "text_color", "placeholder_color",
+    "accent_color", "accent_hover", "accent_pressed", "hover_color", "hover_text_color",
+])
+
+# Shared by every theme, so the stylesheet can paint with it directly.
+ACCENT_COLOR = "#4a90e2"
+ACCENT_HOVER = "#357abd"
+ACCENT_PRESSED = "#2a5f9e"
+
+DARK = Theme("dark", "#1a1a1a", "#2d2d2d", "#404040", "#ffffff", "#666666",
+             ACCENT_COLOR, ACCENT_HOVER, ACCENT_PRESSED, "#3d3d3d", "#ffffff")
+LIGHT = Theme("light", "#f5f5f5", "#ffffff", "#e0e0e0", "#333333", "#999999",
+              ACCENT_COLOR, ACCENT_HOVER, ACCENT_PRESSED, "#e8e8e8", "#333333")
+THEMES = {theme.name: theme for theme in (DARK, LIGHT)}
+
+
+def system_theme(palette):
+    return DARK if palette.color(QPalette.ColorRole.Window).lightness() < 128 else LIGHT
+
+
+def build_palette(theme):
+    palette = QPalette()
+    roles = {
+        QPalette.ColorRole.Window: theme.bg_color,
+        QPalette.ColorRole.WindowText: theme.text_color,
+        QPalette.ColorRole.Base: theme.container_bg,
+        QPalette.ColorRole.AlternateBase: theme.hover_color,
+        QPalette.ColorRole.Text: theme.text_color,
+        QPalette.ColorRole.Button: theme.container_bg,
+        QPalette.ColorRole.ButtonText: theme.text_color,
+        QPalette.ColorRole.PlaceholderText: theme.placeholder_color,
+        QPalette.ColorRole.Highlight: theme.accent_color,
+        QPalette.ColorRole.HighlightedText: "#ffffff",
+        QPalette.ColorRole.Mid: theme.border_color,
+        QPalette.ColorRole.Light: theme.container_bg,
+        QPalette.ColorRole.Dark: theme.border_color,
+        QPalette.ColorRole.ToolTipBase: theme.container_bg,
+        QPalette.ColorRole.ToolTipText: theme.text_color,
+    }
+    for role, color in roles.items():
+        palette.setColor(role, QColor(color))
+    # Disabled text: a disabled button, and the unselectable group headings
+    # in the model lists.
+    for role in (QPalette.ColorRole.WindowText, QPalette.ColorRole.Text, QPalette.ColorRole.ButtonText):
+        palette.setColor(QPalette.ColorGroup.Disabled, role, QColor(theme.placeholder_color))
+    return palette
+
+
+STYLESHEET = f"""
+        QLineEdit {{
+            padding: 12px;
+            font-size: 14px;
+        }}
+        QComboBox {{
+            padding: 8px 12px;
+            min-width: 150px;
+        }}
+        QComboBox::item:!enabled {{
+            font-weight: bold;
+            margin-top: 5px;
+        }}
+        QFrame#comparison_frame, QFrame#imageContainer {{
+            padding: 10px;
+        }}
+
+        QPushButton#primaryButton, QDialog#imageViewer QPushButton {{
+            background-color: {ACCENT_COLOR};
+            color: white;
+            border: none;
+            border-radius: 4px;
+            padding: 8px 16px;
+            font-weight: bold;
+        }}
+        QDialog#imageViewer QPushButton {{
+            min-width: 100px;
+        }}
+        QPushButton#primaryButton:hover, QDialog#imageViewer QPushButton:hover {{
+            background-color: {ACCENT_HOVER};
+        }}
+        QPushButton#primaryButton:pressed, QDialog#imageViewer QPushButton:pressed {{
+            background-color: {ACCENT_PRESSED};
+        }}
+        QPushButton#secondaryButton {{
+            padding: 8px 16px;
+        }}
+
+        QLabel#headerTitle {{
+            font-size: 24px;
+            font-weight: bold;
+            margin-bottom: 10px;
+        }}
+        QLabel#modelGroupHeader {{
+            color: {ACCENT_COLOR};
+            font-weight: bold;
+            padding: 12px 8px;
+            font-size: 13px;
+            margin-top: 8px;
+        }}
+        QPushButton#modelButton {{
+            text-align: left;
+            padding: 10px 16px;
+            border-radius: 4px;
+            font-size: 12px;
+            margin: 2px 0px;
+        }}
+        QPushButton#modelButton:hover {{
+            color: {ACCENT_COLOR};
+        }}
+        QPushButton#modelButton:checked {{
+            background-color: {ACCENT_COLOR};
+            color: white;
+            font-weight: bold;
+        }}
+
+        QLabel#slotTitle {{
+            font-weight: bold;
+            font-size: 14px;
+            padding: 5px;
+        }}
+        QLabel#timingLabel {{
+            font-size: 11px;
+            padding: 2px;
+        }}
+        QLabel#metricsLabel {{
+            font-size: 12px;
+            padding: 4px;
+        }}
+    """
+
+
+class ThemeManager(QObject):
+    changed = pyqtSignal(object)
+
+    def __init__(self, app, theme=None):
+        super().__init__(app)
+        self.app = app
+        self.theme = None
+        # Lets the palette reach widgets the stylesheet styles.
+        app.setAttribute(Qt.ApplicationAttribute.AA_UseStyleSheetPropagationInWidgetStyles)
+        app.setStyleSheet(STYLESHEET)
+        self.apply(theme or system_theme(app.palette()))
+
+    def apply(self, theme):
+        if theme == self.theme:
+            return
+        self.theme = theme
+        self.app.setPalette(build_palette(theme))
+        self.changed.emit(theme)
+
+    def toggle(self):
+        self.apply(LIGHT if self.theme == DARK else DARK)
+
+
+_theme_manager = None
+
+
+def get_theme_manager():
+    # Created on first use, after the QApplication; the starting theme
+    # follows the system's unless IMAGE_COMPARE_THEME names one.
+    global _theme_manager
+    if _theme_manager is None:
+        _theme_manager = ThemeManager(QApplication.instance(), THEMES.get(os.getenv("IMAGE_COMPARE_THEME", "")))
+    return _theme_manager
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import tempfile
+
+from PyQt6.QtGui import QImage
+from PyQt6.QtCore import QSize
+
+from image_loader import decode_scaled
+
+THUMBNAIL_SIZE = 200
+THUMBNAIL_DIR_NAME = ".thumbnails"
+
+
+class ThumbnailCache:
+    # Pre-scaled JPEGs keyed by (path, mtime, size). Editing or replacing an
+    # image changes its key, so stale thumbnails are never served; prune()
+    # removes the orphans (see gallery.CachePruner).
+    def __init__(self, cache_dir, size=THUMBNAIL_SIZE):
+        self.cache_dir = cache_dir
+        self.size = size
+
+    def key(self, file_path, stat=None):
+        stat = stat or os.stat(file_path)
+        raw = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+    def get(self, file_path):
+        try:
+            path = self.cache_path(self.key(file_path))
+        except OSError:
+            return None
+        if not os.path.exists(path):
+            return None
+        image = QImage(path)
+        return None if image.isNull() else image
+
+    def build(self, file_path):
+        image = decode_scaled(file_path, QSize(self.size, self.size))
+        if image.isNull():
+            return None
+        thumbnail = image.convertToFormat(QImage.Format.Format_RGB32)
+
+        path = self.cache_path(self.key(file_path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".jpg", dir=os.path.dirname(path))
+        os.close(fd)
+        if thumbnail.save(temp_path, "JPG", 85):
+            os.replace(temp_path, path)
+        else:
+            os.remove(temp_path)
+        return thumbnail
+
+    def get_or_build(self, file_path):
+        thumbnail = self.get(file_path)
+        if thumbnail is None:
+            thumbnail = self.build(file_path)
+        return thumbnail
+
+    def prune(self, valid, before):
+        # Removes thumbnails whose key is not in `valid`, except ones written
+        # at or after `before` (a timestamp) for images newer than the keys.
+        if not os.path.isdir(self.cache_dir):
+            return
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if os.path.splitext(name)[0] not in valid:
+                    path = os.path.join(shard_dir, name)
+                    try:
+                        if os.path.getmtime(path) < before:
+                            os.remove(path)
+                    except OSError:
+                        pass
@@ -0,0 +1,254 @@
+import email.utils
+import os
+import random
+import threading
+import time
+
+from jobs import current_job
+from scheduler import note_throttled
+
+# Shared HTTP transport for every provider. Connections are pooled and kept
+# alive per host so repeated calls skip the TCP+TLS handshake.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 180
+MAX_CONNECTIONS_PER_HOST = 8
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Methods safe to send again after the connection dropped mid-request.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+HTTP2_ENABLED = os.getenv("IMAGE_COMPARE_HTTP2", "").lower() in ("1", "true", "yes")
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def failed_to_connect(error):
+    # requests raises the same ConnectionError whether the connection could
+    # not be made or dropped after the request was sent (a ProtocolError or
+    # RemoteDisconnected underneath); only the urllib3 error it wraps tells
+    # them apart.
+    from requests.exceptions import ConnectTimeout
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+def iter_response_bytes(response, chunk_size=64 * 1024):
+    if hasattr(response, "iter_content"):
+        return response.iter_content(chunk_size=chunk_size)
+    return response.iter_bytes(chunk_size=chunk_size)
+
+
+class RetryPolicy:
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def retry_delay(self, response, attempt):
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = self.backoff(attempt)
+        return min(delay, self.backoff_max)
+
+
+class Transport(RetryPolicy):
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_connections_per_host=MAX_CONNECTIONS_PER_HOST, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, http2=HTTP2_ENABLED):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.client = None
+
+        if http2:
+            try:
+                import httpx
+                self.client = httpx.Client(
+                    http2=True,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    # httpx limits the whole pool, not each host: room for
+                    # the four hosts the requests adapter pools for.
+                    limits=httpx.Limits(max_connections=max_connections_per_host * 4,
+                                        max_keepalive_connections=max_connections_per_host),
+                )
+                # Both are raised before anything is sent.
+                self.connect_errors = (httpx.ConnectError, httpx.ConnectTimeout)
+                self.failed_to_connect = lambda error: True
+            except ImportError:
+                print("HTTP/2 requested but httpx[http2] is not installed; falling back to HTTP/1.1")
+
+        if self.client is None:
+            # Imported here so modules that only need the transport's helpers
+            # do not pay for requests at import time.
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self.session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=max_connections_per_host,
+                pool_block=True,
+            )
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+            self.connect_errors = (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout)
+            self.failed_to_connect = failed_to_connect
+
+    def send(self, method, url, stream=False, **kwargs):
+        # Under a job the socket timeouts are cut to the time it has left,
+        # and the call runs where cancelling the job can abandon it; a
+        # response that turns up afterwards is closed.
+        job = current_job()
+        connect_timeout = job.timeout_for(self.connect_timeout)
+        read_timeout = job.timeout_for(self.read_timeout)
+        if self.client is not None:
+            import httpx
+            kwargs.setdefault("timeout", httpx.Timeout(read_timeout, connect=connect_timeout))
+            request = self.client.build_request(method, url, **kwargs)
+            call = lambda: self.client.send(request, stream=stream)
+        else:
+            kwargs.setdefault("timeout", (connect_timeout, read_timeout))
+            call = lambda: self.session.request(method, url, stream=stream, **kwargs)
+        try:
+            return job.call(call, discard=lambda response: response.close())
+        except Exception:
+            job.check()  # a timeout cut short by the job is reported as the job's
+            raise
+
+    def request(self, method, url, stream=False, **kwargs):
+        # Read timeouts are never retried. A connection error is retried for
+        # idempotent methods, but for a POST only when the connection was
+        # never made: one that dropped mid-request may already have been
+        # accepted (and billed) by the server.
+        job = current_job()
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.send(method, url, stream=stream, **kwargs)
+            except self.connect_errors as error:
+                if attempt == self.max_retries or not (idempotent or self.failed_to_connect(error)):
+                    raise
+                delay = self.backoff(attempt)
+            else:
+                if response.status_code == 429:
+                    note_throttled(retry_after_seconds(response))
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = self.retry_delay(response, attempt)
+                response.close()
+            job.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        else:
+            self.session.close()
+
+
+class AsyncTransport(RetryPolicy):
+    # asyncio counterpart of Transport on httpx.AsyncClient, with the same
+    # retry rules. A client belongs to one event loop, so there is no
+    # process-wide instance: open one per loop with `async with`.
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_connections_per_host=MAX_CONNECTIONS_PER_HOST, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, http2=HTTP2_ENABLED):
+        import httpx
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_errors = (httpx.ConnectError, httpx.ConnectTimeout)
+        options = {
+            "timeout": httpx.Timeout(read_timeout, connect=connect_timeout),
+            "limits": httpx.Limits(max_connections=max_connections_per_host * 4,
+                                   max_keepalive_connections=max_connections_per_host),
+        }
+        try:
+            self.client = httpx.AsyncClient(http2=http2, **options)
+        except ImportError:
+            print("HTTP/2 requested but httpx[http2] is not installed; falling back to HTTP/1.1")
+            self.client = httpx.AsyncClient(**options)
+
+    async def request(self, method, url, stream=False, **kwargs):
+        import asyncio
+
+        import httpx
+
+        job = current_job()
+        for attempt in range(self.max_retries + 1):
+            try:
+                timeout = self.client.timeout
+                request = self.client.build_request(method, url, timeout=httpx.Timeout(
+                    job.timeout_for(timeout.read), connect=job.timeout_for(timeout.connect)), **kwargs)
+                response = await self.client.send(request, stream=stream)
+            except self.connect_errors:
+                job.check()
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+            except httpx.TimeoutException:
+                job.check()
+                raise
+            else:
+                if response.status_code == 429:
+                    note_throttled(retry_after_seconds(response))
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = self.retry_delay(response, attempt)
+                await response.aclose()
+            await asyncio.sleep(job.timeout_for(delay))
+            job.check()
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport